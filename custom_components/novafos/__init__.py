@@ -2,19 +2,27 @@
 
 from __future__ import annotations
 
-from .coordinator import NovafosUpdateCoordinator
+from .coordinator import (
+    NovafosUpdateCoordinator,
+    backfill_store,
+    metadata_store,
+    response_cache_store,
+    rollup_store,
+)
 from .services import async_setup_services
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 
-from .const import DOMAIN
+from .const import DOMAIN, HOURLY_DAYS, TRACE_RESPONSES
 
 # The Novafos integration - not on PyPi, just bundled here.
 # Contrary to:
 # https://developers.home-assistant.io/docs/creating_component_code_review#4-communication-with-devicesservices
 from .pynovafos.novafos import Novafos
+from .pynovafos.async_novafos import AsyncNovafos
 
 # Development help
 import logging
@@ -53,10 +61,23 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     _LOGGER.debug(f"Novafos ConfigData: {entry.data}")
 
     # Use the coordinator which handles regular fetch of API data.
-    api = Novafos(timezone=hass.config.time_zone)
+    # The asyncio client runs its requests on the event loop - no executor threads - through
+    # the aiohttp session shared by Home Assistant.
+    # With debug logging enabled, the latest raw responses are kept for the diagnostics download.
+    api = AsyncNovafos(
+        timezone=hass.config.time_zone,
+        session=async_get_clientsession(hass),
+        trace_responses=TRACE_RESPONSES if _LOGGER.isEnabledFor(logging.DEBUG) else 0,
+        # Daily summaries only serve the grouped sensors
+        hourly_days=HOURLY_DAYS if entry.data["use_grouped_sensors"] else None,
+    )
     coordinator = NovafosUpdateCoordinator(hass, api, entry)
-    # If you do not want to retry setup on failure, use
-    await coordinator.async_refresh()
+    # Responses of completed periods are kept across restarts
+    await coordinator.async_load_cache()
+    # Only the meters are discovered before the sensors are set up - taken from the store if an
+    # earlier run saved them.  Retrieving and importing the history can take minutes on a fresh
+    # install - the first refresh runs in the background.
+    await coordinator.async_setup_meters()
     # This one repeats connecting to the API until first success.
     # NOTE: Disabled because of login screen reCAPTCHA - need a valid token to perform refresh.
     # await coordinator.async_config_entry_first_refresh()
@@ -74,6 +95,8 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     await async_setup_services(hass, coordinator)
 
+    coordinator.async_start_backfill()
+
     return True
 
 
@@ -81,11 +104,23 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        coordinator = hass.data[DOMAIN].pop(entry.entry_id)["coordinator"]
+        coordinator.async_cancel_pending_refresh()
+        coordinator.async_cancel_backfill()
+        # Close the client - the session shared by Home Assistant is left open
+        await coordinator.api.close()
 
     return unload_ok
 
 
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Remove the stored API responses, rollups, backfill checkpoints and meters when the config entry is deleted."""
+    await response_cache_store(hass, entry).async_remove()
+    await rollup_store(hass, entry).async_remove()
+    await backfill_store(hass, entry).async_remove()
+    await metadata_store(hass, entry).async_remove()
+
+
 async def async_migrate_entry(hass, config_entry: ConfigEntry) -> bool:
     """Handle migration of setup entry data from one version to the next."""
     _LOGGER.info("Migrating from version %s", config_entry.version)
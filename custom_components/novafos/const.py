@@ -16,6 +16,14 @@ DOMAIN = "novafos"
 # Default name for sensor prefix texts (possibly other things)
 DEFAULT_NAME = "Novafos"
 
+# Number of raw API responses kept for diagnostics when debug logging is enabled
+TRACE_RESPONSES = 20
+
+# Days of history retrieved hourly with the grouped sensors enabled.  The days before are
+# only retrieved as daily summaries, which fill the grouped statistics - 24 times fewer rows -
+# so the hourly statistics start hourly_days back.  None retrieves all history hourly.
+HOURLY_DAYS = None
+
 # NOTE:
 #  All consumption data can be derived from the statistics sensor.
 #  The sensor will always have state "unknown" because data is only relevant in the past.
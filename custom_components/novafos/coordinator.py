@@ -2,16 +2,22 @@
 
 from __future__ import annotations
 
-from .pynovafos.novafos import Novafos
+from .pynovafos.async_novafos import AsyncNovafos
+from .pynovafos.resilience import Deadline
+
+import asyncio
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
 from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
 from homeassistant.exceptions import HomeAssistantError
 
 from datetime import datetime as dt
 from datetime import timedelta
+from itertools import islice
 
 
 from .const import DOMAIN
@@ -41,6 +47,43 @@ import logging
 
 _LOGGER = logging.getLogger(__name__)
 
+# Storage of the API response cache.  Completed periods are never retrieved again.
+CACHE_STORAGE_VERSION = 1
+CACHE_SAVE_DELAY = 30
+# Storage of the grouped statistics state.  Saved along with the response cache.
+ROLLUP_STORAGE_VERSION = 1
+# Storage of the first-time backfill checkpoints.  Saved along with the response cache.
+BACKFILL_STORAGE_VERSION = 1
+# Storage of the customer profile and active meters.  Saved as soon as they change.
+METADATA_STORAGE_VERSION = 1
+
+# Seconds one refresh may spend on the KMD API.  Days not retrieved by then are left for the next refresh.
+REFRESH_DEADLINE = 120
+# Seconds until the refresh picking up the days left by the previous refresh
+PENDING_REFRESH_DELAY = 60
+# Default number of statistics rows handed to the recorder per import job - a month of hours
+IMPORT_BATCH_SIZE = 24 * 31
+
+
+def response_cache_store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    """Return the storage holding the API response cache of a config entry."""
+    return Store(hass, CACHE_STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.responses")
+
+
+def rollup_store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    """Return the storage holding the grouped statistics state of a config entry."""
+    return Store(hass, ROLLUP_STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.rollups")
+
+
+def backfill_store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    """Return the storage holding the backfill checkpoints of a config entry."""
+    return Store(hass, BACKFILL_STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.backfill")
+
+
+def metadata_store(hass: HomeAssistant, entry: ConfigEntry) -> Store:
+    """Return the storage holding the customer profile and active meters of a config entry."""
+    return Store(hass, METADATA_STORAGE_VERSION, f"{DOMAIN}.{entry.entry_id}.metadata")
+
 
 class NovafosUpdateCoordinator(DataUpdateCoordinator):
     """DataUpdateCoordinator for Novafos."""
@@ -48,8 +91,9 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
     def __init__(
         self,
         hass: HomeAssistant,
-        api: Novafos,
+        api: AsyncNovafos,
         entry: ConfigEntry,
+        import_batch_size: int = IMPORT_BATCH_SIZE,
     ) -> None:
         """Initialize DataUpdateCoordinator"""
         self.api = api
@@ -68,10 +112,185 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
             if "access_token_date_updated" in self.entry.options
             else ""
         )
+        self._cache_store = response_cache_store(hass, entry)
+        self._rollup_store = rollup_store(hass, entry)
+        self._backfill_store = backfill_store(hass, entry)
+        self._metadata_store = metadata_store(hass, entry)
+        # Statistics rows handed to the recorder per import job
+        self._import_batch_size = max(1, import_batch_size)
+        # Meter types the sensors were set up for
+        self._setup_meter_types: set[str] = set()
+        # Set when a refresh did not retrieve all statistics
+        self._statistics_pending = False
+        self._unsub_pending_refresh = None
+        # One refresh at a time - the background backfill may overlap a refresh requested
+        # by a service call
+        self._refresh_lock = asyncio.Lock()
+        # The first refresh, retrieving and importing the history, runs in the background
+        self._backfill_task: asyncio.Task | None = None
 
         super().__init__(hass, _LOGGER, name="Novafos")
 
+    async def async_load_cache(self) -> None:
+        """Restore the API responses, grouped statistics state, backfill checkpoints and meters saved by an earlier run."""
+        self.api.response_cache.load(await self._cache_store.async_load())
+        self.api.rollups.load(await self._rollup_store.async_load())
+        self.api.backfill.load(await self._backfill_store.async_load())
+        self.api.load_metadata(await self._metadata_store.async_load())
+
+    def _save_cache(self) -> None:
+        """Schedule saving the API response cache, grouped statistics state and backfill checkpoints if they changed."""
+        if self.api.response_cache.dirty:
+            self._cache_store.async_delay_save(
+                self.api.response_cache.to_dict, CACHE_SAVE_DELAY
+            )
+        if self.api.rollups.dirty:
+            self._rollup_store.async_delay_save(
+                self.api.rollups.to_dict, CACHE_SAVE_DELAY
+            )
+        if self.api.backfill.dirty:
+            self._backfill_store.async_delay_save(
+                self.api.backfill.to_dict, CACHE_SAVE_DELAY
+            )
+
+    async def async_setup_meters(self) -> None:
+        """
+        Provide the active meters - all the sensors need to be set up.
+        No consumption data is retrieved, see async_start_backfill.
+
+        The meters stored by an earlier run are taken as they are, without reaching the API.
+        The first refresh authenticates and validates them.  Without stored meters they are
+        discovered here, which needs a valid access token.
+        """
+        if self.api.get_meter_types():
+            _LOGGER.debug("Setting up the stored meters")
+            data = (self.api._meter_data, None)
+        elif await self._authenticate():
+            data = (self.api._meter_data, None)
+        else:
+            data = (self.api.get_dummy_data(), None)
+        self._setup_meter_types = set(data[0])
+        self.async_set_updated_data(data)
+
+    async def _authenticate(self) -> bool:
+        """Authenticate and store the customer profile and active meters if they changed."""
+        if not await self.api.authenticate_using_access_token(
+            self.access_token,
+            self.access_token_date_updated,
+        ):
+            return False
+        if self.api.metadata_dirty:
+            # Saved right away - a reload sets up the sensors from the stored meters
+            await self._metadata_store.async_save(self.api.metadata_to_dict())
+        return True
+
+    def _check_meter_types(self) -> None:
+        """Reload the config entry if the meters changed since the sensors were set up."""
+        meter_types = {meter_device.type for meter_device in self.api.get_meter_types()}
+        if meter_types != self._setup_meter_types:
+            _LOGGER.info(
+                "Active meters changed from %s to %s - reloading",
+                sorted(self._setup_meter_types),
+                sorted(meter_types),
+            )
+            self.hass.config_entries.async_schedule_reload(self.entry.entry_id)
+
+    def async_start_backfill(self) -> None:
+        """Run the first refresh as a background task of the config entry."""
+        self._backfill_task = self.entry.async_create_background_task(
+            self.hass, self.async_refresh(), f"{DOMAIN} history backfill"
+        )
+
+    def async_cancel_backfill(self) -> None:
+        """Cancel the background refresh, e.g. when the config entry is unloaded."""
+        if self._backfill_task is not None and not self._backfill_task.done():
+            self._backfill_task.cancel()
+        self._backfill_task = None
+
+    @property
+    def backfill_progress(self) -> dict[str, float]:
+        """Share of the days retrieved per meter type with a first-time backfill in progress."""
+        progress = {}
+        for meter_device in self.api.get_meter_types():
+            share = self.api.backfill.progress(meter_device.type)
+            if share is not None:
+                progress[meter_device.type] = share
+        return progress
+
+    def _schedule_pending_refresh(self) -> None:
+        """Refresh again soon if statistics were left for the next refresh."""
+        self.async_cancel_pending_refresh()
+        if not self._statistics_pending:
+            return
+
+        async def _refresh(_now) -> None:
+            self._unsub_pending_refresh = None
+            await self.async_request_refresh()
+
+        _LOGGER.info(
+            "Not all statistics were retrieved - continuing in %ss",
+            PENDING_REFRESH_DELAY,
+        )
+        self._unsub_pending_refresh = async_call_later(
+            self.hass, PENDING_REFRESH_DELAY, _refresh
+        )
+
+    def async_cancel_pending_refresh(self) -> None:
+        """Cancel a scheduled refresh, e.g. when the config entry is unloaded."""
+        if self._unsub_pending_refresh is not None:
+            self._unsub_pending_refresh()
+            self._unsub_pending_refresh = None
+
+    async def _import_statistics(
+        self, metadata: StatisticMetaData, statistics
+    ) -> StatisticData | None:
+        """
+        Import statistics rows import_batch_size at a time.  Returns the last row imported.
+
+        statistics may be a generator - rows are only built for the batch at hand.  The
+        recorder is waited for between batches, so a long backfill does not queue up in
+        front of other writers.  The batches are cut once the refresh has retrieved its
+        days: the readings themselves are held by the meter data of the client until
+        then, so this bounds the rows of one recorder job, not the memory of the refresh.
+        """
+        rows = iter(statistics)
+        last = None
+        batch = list(islice(rows, self._import_batch_size))
+        while batch:
+            async_import_statistics(self.hass, metadata, batch)
+            last = batch[-1]
+            batch = list(islice(rows, self._import_batch_size))
+            if batch:
+                await get_instance(self.hass).async_block_till_done()
+        return last
+
+    async def _get_statistics(self, from_date, deadline: Deadline):
+        """Retrieve statistics until the deadline and note if days were left."""
+        data = await self.api.get_statistics(from_date, deadline)
+        self._statistics_pending |= self.api.statistics_pending
+        return data
+
+    def _no_statistics(self, data, meter_type) -> bool:
+        """Check if nothing was retrieved for the meter type, e.g. because the deadline passed."""
+        if data.get(meter_type):
+            return False
+        _LOGGER.info(
+            "No new %s statistics retrieved - trying again on the next refresh",
+            meter_type,
+        )
+        return True
+
+    @property
+    def statistics_pending(self) -> bool:
+        """Set when the latest refresh did not retrieve all statistics."""
+        return self._statistics_pending
+
     async def _async_update_data(self):
+        """Get the data for Novafos.  Refreshes run one at a time."""
+        async with self._refresh_lock:
+            return await self._update_data()
+
+    async def _update_data(self):
         """Get the data for Novafos."""
         _LOGGER.debug("Performing token based authentication")
 
@@ -84,25 +303,29 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
         #     self.api._meter_data_extra = get_year_sample_data_extra()
 
         meter_year_data = None
-        if await self.hass.async_add_executor_job(
-            self.api.authenticate_using_access_token,
-            self.access_token,
-            self.access_token_date_updated,
-        ):
+        if await self._authenticate():
+            self._check_meter_types()
             # Retrieve latest data from the API
             # if True:
+            # One deadline for the whole refresh - a stalled API must not block Home Assistant
+            deadline = Deadline(REFRESH_DEADLINE)
+            self._statistics_pending = False
             try:
                 _LOGGER.debug("Getting latest statistics")
-                meter_year_data = await self.hass.async_add_executor_job(
-                    self.api.get_year_data
-                )
+                meter_year_data = await self.api.get_year_data(deadline)
                 # last_state = await self._insert_statistics(debug=debug)
-                await self._insert_statistics(debug=debug)
+                await self._insert_statistics(debug=debug, deadline=deadline)
                 if self.entry.data["use_grouped_sensors"]:
+                    # Days the API summarised are not summed from the hourly data
+                    await self.api.get_day_summaries(deadline=deadline)
                     await self._insert_grouped_statistics(debug=debug)
                 data = (self.api._meter_data, meter_year_data)  # , last_state)
             except Exception as ex:
                 raise UpdateFailed(f"The service is unavailable: {ex}")
+            finally:
+                # Keep what was retrieved - also if the update failed half way
+                self._save_cache()
+                self._schedule_pending_refresh()
         else:
             data = (self.api.get_dummy_data(), meter_year_data)  # , None)
 
@@ -110,13 +333,13 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
         _LOGGER.debug("Returning from Coordinator with data: %s", data)
         return data
 
-    async def _insert_statistics(self, debug) -> None:
+    async def _insert_statistics(self, debug, deadline: Deadline | None = None) -> None:
         """Update statistics when data is returned"""
         # Iterate over water/heating
         # _get_meter_types returns:
-        #      [{'type': 'water', 'InstallationId': 12345678, 'MeasurementPointId': 23456789, 'Unit': {'Id': 11111, 'Name': 'm³', 'Description': 'Vand', 'Decimals': 0, 'Order': 1}}]
+        #      [MeterInfo(type='water', installation_id=12345678, measurement_point_id=23456789, unit={'Id': 11111, 'Name': 'm³', 'Description': 'Vand', 'Decimals': 0, 'Order': 1})]
         for meter_device in self.api.get_meter_types():
-            meter_type = meter_device["type"]
+            meter_type = meter_device.type
             _LOGGER.debug("Retrieving statistics data for %s meter.", meter_type)
 
             statistic_id = f"sensor.{DOMAIN}_{meter_type}_statistics"
@@ -131,11 +354,39 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
             )
             # Returns: last_stats = defaultdict(<class 'list'>, {'sensor.novafos_water_statistics': [{'start': 1735948800.0, 'end': 1735952400.0}]})
             _LOGGER.debug("Last statistics (raw): %s", last_stats)
-            if not last_stats:
-                # First time we insert 365 days of data (if available)
-                min_date = await self.hass.async_add_executor_job(
-                    self.api.get_available_time_series_periods
+            checkpoint = self.api.backfill.get(meter_type)
+            resume_from = self.api.backfill.resume_from(meter_type)
+            if checkpoint is not None and resume_from is None:
+                self.api.backfill.finish(meter_type)
+                checkpoint = None
+            if checkpoint is not None:
+                # A backfill was cut short - continue from its checkpoint
+                _LOGGER.debug(
+                    "Continuing the %s statistics backfill from %s",
+                    meter_type,
+                    resume_from,
                 )
+                if debug:
+                    data = self.api._meter_data
+                else:
+                    data = await self._get_statistics(resume_from, deadline)
+                if checkpoint.last_hour is not None and meter_type in data:
+                    # The hours imported before are not imported again
+                    data = {
+                        meter_type: data[meter_type].between(
+                            checkpoint.last_hour + 3600
+                        )
+                    }
+                    if not data[meter_type] and not self.api.statistics_pending:
+                        self.api.backfill.finish(meter_type)
+                if self._no_statistics(data, meter_type):
+                    continue
+                _sum = checkpoint.sum
+            elif not last_stats:
+                # Grouped statistics start over with the hourly ones
+                self.api.rollups.reset(meter_type)
+                # First time we insert 365 days of data (if available)
+                min_date = await self.api.get_available_time_series_periods()
 
                 one_year_back = dt.now().replace(
                     year=dt.now().year - 1,
@@ -155,16 +406,15 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
                     one_year_back,
                     min_date,
                 )
+                # Progress is checkpointed - a backfill cut short continues where it stopped
+                self.api.start_backfill(meter_type, one_year_back)
                 if debug:
                     data = self.api._meter_data
                 else:
-                    data = await self.hass.async_add_executor_job(
-                        self.api.get_statistics, one_year_back
-                    )
+                    data = await self._get_statistics(one_year_back, deadline)
+                if self._no_statistics(data, meter_type):
+                    continue
                 _sum = 0.0
-                _max = data[meter_type][0]["Value"]
-                _min = data[meter_type][0]["Value"]
-                _mean = data[meter_type][0]["Value"]
             else:
                 # Fetch data this many days back
                 delta_days = 1
@@ -193,14 +443,9 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
                 if debug:
                     data = self.api._meter_data
                 else:
-                    data = await self.hass.async_add_executor_job(
-                        self.api.get_statistics, start
-                    )
+                    data = await self._get_statistics(start, deadline)
                 if statistic_id in stat:
                     _sum = cast(float, stat[statistic_id][0]["sum"])
-                    _max = cast(float, stat[statistic_id][0]["max"])
-                    _min = cast(float, stat[statistic_id][0]["min"])
-                    _mean = cast(float, stat[statistic_id][0]["mean"])
                 else:
                     # For some reason the latest statistics has nothing? Panic and get data 1 year back again!
                     # one_year_back = dt.now().replace(year=dt.now().year-1, month=1, day=1, hour=0, minute=0, second=0)
@@ -212,42 +457,14 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
                         "No last statistics detected - this is unexpected - retrieving data since %s.",
                         one_year_back,
                     )
-                    data = await self.hass.async_add_executor_job(
-                        self.api.get_statistics, one_year_back
-                    )
+                    data = await self._get_statistics(one_year_back, deadline)
+                    if self._no_statistics(data, meter_type):
+                        continue
                     # Need to reset sum to 0.0 because we don't know the offset any more.
                     _sum = 0.0
-                    _max = data[meter_type][0]["Value"]
-                    _min = data[meter_type][0]["Value"]
-                    _mean = data[meter_type][0]["Value"]
 
-            # Array of statistics points
-            statistics = []
-
-            # Populate statistics array
-            last_value = data[meter_type][0]["Value"]
-            for val in data[meter_type]:
-                # Add timezone to dataset as Home Assistant works in UTC
-                from_time = dt_util.parse_datetime(f"{val['DateFrom']}").replace(
-                    tzinfo=dt_util.get_time_zone(self.hass.config.time_zone)
-                )
-                _sum += val["Value"]
-                _max = last_value if val["Value"] < last_value else val["Value"]
-                _min = last_value if val["Value"] >= last_value else val["Value"]
-                _mean = (_min + _max) / 2
-                last_value = val["Value"]
-                # _LOGGER.debug(f"Adding: {from_time}, {val["Value"]}, {_sum}")
-
-                statistics.append(
-                    StatisticData(
-                        start=from_time,
-                        state=val["Value"],
-                        sum=_sum,
-                        min=_min,
-                        max=_max,
-                        mean=_mean,
-                    )
-                )
+            if self._no_statistics(data, meter_type):
+                continue
 
             # For min/max/average check out https://github.com/emontnemery/home-assistant/blob/dev/homeassistant/components/kitchen_sink/__init__.py#L148,
             # https://github.com/emontnemery/home-assistant/blob/dev/homeassistant/components/recorder/models/statistics.py#L31
@@ -272,57 +489,60 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
                 statistic_id=statistic_id,
                 unit_of_measurement=unit,
             )
-            async_import_statistics(self.hass, metadata, statistics)
+            # Imported in batches, the running sum carried from one batch to the next
+            last = await self._import_statistics(
+                metadata, _hourly_statistics(data[meter_type], _sum)
+            )
+            if self.api.backfill.get(meter_type) is not None:
+                self.api.backfill.advance(
+                    meter_type,
+                    data[meter_type].timestamps[-1],
+                    last["sum"],
+                    self.api.tz,
+                )
+                if not self.api.statistics_pending:
+                    self.api.backfill.finish(meter_type)
 
             # Could return last state for a sensor - but the sensor state ruins the statistics.
             # return statistics[-1]['state']
 
-    async def _insert_grouped_statistics(
-        self, grouping=("day", "week", "month", "year"), debug=False
-    ) -> None:
+    async def _insert_grouped_statistics(self, debug=False) -> None:
         """Update statistics when data is returned"""
         # Iterate over water/heating
         # _get_meter_types returns:
-        #      [{'type': 'water', 'InstallationId': 11223344, 'MeasurementPointId': 33445566, 'Unit': {'Id': 10319, 'Name': 'm³', 'Description': 'Vand', 'Decimals': 0, 'Order': 1}}]
+        #      [MeterInfo(type='water', installation_id=11223344, measurement_point_id=33445566, unit={'Id': 10319, 'Name': 'm³', 'Description': 'Vand', 'Decimals': 0, 'Order': 1})]
         for meter_device in self.api.get_meter_types():
-            for grouping in grouping:
-                meter_type = meter_device["type"]
+            meter_type = meter_device.type
+            # Only the buckets touched by the hourly data retrieved since the last update
+            rollups = self.api.update_rollups(meter_type)
+            for grouping_name, dataset in rollups.items():
                 _LOGGER.debug(
                     "Generating grouped statistics data for %s meter for %s.",
                     meter_type,
-                    grouping,
+                    grouping_name,
                 )
 
-                dataset = self.api.get_grouped_statistics("water", grouping)
-                statistic_id = f"sensor.{DOMAIN}_{meter_type}_statistics_{grouping}"
+                statistic_id = (
+                    f"sensor.{DOMAIN}_{meter_type}_statistics_{grouping_name}"
+                )
                 if meter_type == "water":
                     unit = UnitOfVolume.CUBIC_METERS
                 else:
                     unit = UnitOfEnergy.KILOWATT_HOUR
 
-                # Naive version - just recalculate the complete history of the sensor data
-
-                # Array of statistics points
-                statistics = []
-
-                # Populate statistics array
-                for date, _sum, _change, _min, _max, _mean in dataset:
-                    # Add timezone to dataset as Home Assistant works in UTC
-                    from_time = dt_util.parse_datetime(date).replace(
-                        tzinfo=dt_util.get_time_zone(self.hass.config.time_zone)
-                    )
-                    # _LOGGER.debug(f"Adding: {from_time}, {val["Value"]}, {_sum}")
-
-                    statistics.append(
-                        StatisticData(
-                            start=from_time,
-                            state=_sum,
-                            sum=_sum,
-                            min=_min,
-                            max=_max,
-                            mean=_mean,
-                        )
+                # Add timezone to dataset as Home Assistant works in UTC
+                tz = dt_util.get_time_zone(self.hass.config.time_zone)
+                statistics = (
+                    StatisticData(
+                        start=dt_util.parse_datetime(row.date).replace(tzinfo=tz),
+                        state=row.sum,
+                        sum=row.sum,
+                        min=row.min,
+                        max=row.max,
+                        mean=row.mean,
                     )
+                    for row in dataset
+                )
 
                 metadata = StatisticMetaData(
                     mean_type=StatisticMeanType.ARITHMETIC,
@@ -332,7 +552,26 @@ class NovafosUpdateCoordinator(DataUpdateCoordinator):
                     statistic_id=statistic_id,
                     unit_of_measurement=unit,
                 )
-                async_import_statistics(self.hass, metadata, statistics)
+                await self._import_statistics(metadata, statistics)
+
+
+def _hourly_statistics(series, _sum):
+    """Yield the statistics rows of the hourly readings, the sum running on from _sum."""
+    last_value = series.values[0]
+    # Home Assistant works in UTC - the readings are kept as UTC epoch seconds
+    for timestamp, value in series:
+        _sum += value
+        _max = last_value if value < last_value else value
+        _min = last_value if value >= last_value else value
+        last_value = value
+        yield StatisticData(
+            start=dt_util.utc_from_timestamp(timestamp),
+            state=value,
+            sum=_sum,
+            min=_min,
+            max=_max,
+            mean=(_min + _max) / 2,
+        )
 
 
 class InvalidAuth(HomeAssistantError):
@@ -0,0 +1,73 @@
+"""Diagnostics support for Novafos."""
+
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {"access_token"}
+
+# Customer and meter identifiers in the meters and the bodies of the traced API responses
+TRACE_TO_REDACT = {
+    "City",
+    "ContactInfos",
+    "FullName",
+    "Id",
+    "InstallationId",
+    "InstallationPeriodId",
+    "Location",
+    "LocationId",
+    "MeasurementPointId",
+    "MeasurementPointNumber",
+    "MeterId",
+    "MeterNumber",
+    "Number",
+    "ProfileId",
+    "StreetAddress",
+    "installation_id",
+    "measurement_point_id",
+}
+
+
+async def async_get_config_entry_diagnostics(
+    hass: HomeAssistant, entry: ConfigEntry
+) -> dict[str, Any]:
+    """Return diagnostics for a config entry.
+
+    The raw API responses are only included if debug logging was enabled when the
+    integration was set up.
+    """
+    coordinator = hass.data[DOMAIN][entry.entry_id]["coordinator"]
+    return {
+        "entry": {
+            "data": dict(entry.data),
+            "options": async_redact_data(dict(entry.options), TO_REDACT),
+        },
+        "meters": [
+            async_redact_data(meter_device._asdict(), TRACE_TO_REDACT)
+            for meter_device in coordinator.api.get_meter_types()
+        ],
+        "statistics_pending": coordinator.statistics_pending,
+        "backfill_progress": coordinator.backfill_progress,
+        "responses": _redact_responses(coordinator.api.trace.as_list()),
+    }
+
+
+def _redact_responses(responses):
+    """Return the traced responses with the identifiers redacted from the JSON bodies."""
+    redacted = []
+    for response in responses:
+        try:
+            body = json.loads(response["body"])
+        except (TypeError, ValueError):
+            # Not JSON, e.g. an error page - kept as it is
+            redacted.append(response)
+            continue
+        redacted.append({**response, "body": async_redact_data(body, TRACE_TO_REDACT)})
+    return redacted
@@ -0,0 +1,433 @@
+"""
+asyncio twin of the novafos.dk API wrapper.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+
+import aiohttp
+
+from .novafos import (
+    DEFAULT_METADATA_TTL,
+    DEFAULT_RETENTION_DAYS,
+    DEFAULT_WINDOW_DAYS,
+    DeadlineExceeded,
+    HTTPFailed,
+    LoginFailed,
+    NovafosBase,
+    RateLimited,
+    Unavailable,
+)
+from .resilience import (
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    RETRY_STATUS,
+    Deadline,
+    RetryPolicy,
+)
+from .scheduler import BackfillScheduler, parse_retry_after
+from .stream import STREAM_CHUNK_SIZE
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class AsyncNovafos(NovafosBase):
+    """
+    asyncio implementation of the KMD API wrapper based on aiohttp.
+
+    Exposes the same methods as Novafos, but awaitable, so the caller can run the
+    requests directly on the event loop instead of blocking an executor thread.
+
+    If no session is given, a pooled keep-alive session is created on first use and
+    closed again by close().  A session passed in is owned (and closed) by the caller.
+
+    The windows of a backfill run concurrently, at most backfill_concurrency windows at
+    a time and rate_limit requests per second across all of them.
+    """
+
+    def __init__(
+        self,
+        timezone,
+        session: aiohttp.ClientSession | None = None,
+        pool_size=4,
+        window_days=DEFAULT_WINDOW_DAYS,
+        backfill_concurrency=4,
+        rate_limit=5.0,
+        retry_policy: RetryPolicy | None = None,
+        trace_responses=0,
+        retention_days=DEFAULT_RETENTION_DAYS,
+        hourly_days=None,
+        metadata_ttl=DEFAULT_METADATA_TTL,
+    ):
+        super().__init__(
+            timezone,
+            window_days,
+            retry_policy,
+            trace_responses,
+            retention_days,
+            hourly_days,
+            metadata_ttl,
+        )
+        self._session = session
+        self._owns_session = session is None
+        self._pool_size = pool_size
+        self._scheduler = BackfillScheduler(
+            concurrency=backfill_concurrency,
+            rate=rate_limit,
+            burst=max(1, pool_size),
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or (self._owns_session and self._session.closed):
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._pool_size)
+            )
+        return self._session
+
+    async def close(self):
+        """Close the pooled HTTP session and release its connections."""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _request_timeout(self):
+        """Return the timeouts for a request - ending it by the deadline, if any."""
+        return aiohttp.ClientTimeout(
+            total=None if self._deadline is None else self._deadline.remaining(),
+            sock_connect=CONNECT_TIMEOUT,
+            sock_read=READ_TIMEOUT,
+        )
+
+    async def _read_timeseries(self, response):
+        """Parse a consumptionTimeSeries response chunk by chunk as it streams in."""
+        parser, series_data = self._timeseries_parser()
+        # Only hold on to the body if it is traced
+        body = [] if self.trace.enabled else None
+        try:
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                if body is not None:
+                    body.append(chunk)
+                parser.feed(chunk)
+            parser.close()
+        except ValueError as parse_err:
+            raise self._unreadable(parse_err) from parse_err
+        finally:
+            if body is not None:
+                self.trace.record(
+                    "POST", str(response.url), response.status, b"".join(body)
+                )
+        return parser, series_data
+
+    async def _send_json(self, method, url, headers, read=None, **kwargs):
+        """Send a single request to the API and return the decoded JSON body.
+
+        If read is given, await read(response) is returned instead.
+        """
+        self._check_deadline()
+        try:
+            async with self._get_session().request(
+                method, url, headers=headers, timeout=self._request_timeout(), **kwargs
+            ) as response:
+                # Streamed bodies are traced while they are read
+                if self.trace.enabled and (read is None or response.status >= 400):
+                    self.trace.record(
+                        method, url, response.status, await response.read()
+                    )
+                # Handle HTTP status codes explicitly: 401/403 indicate invalid/expired token
+                if response.status in (401, 403):
+                    _LOGGER.error(
+                        "Authentication failed when calling %s: %s %s",
+                        url,
+                        response.status,
+                        await response.text(),
+                    )
+                    self._authentication_failed()
+                    raise LoginFailed("Invalid or expired access token")
+                if response.status == 429:
+                    raise RateLimited(
+                        parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                if response.status in RETRY_STATUS:
+                    _LOGGER.warning(
+                        "HTTP error occurred while calling %s: %s", url, response.status
+                    )
+                    raise Unavailable(f"HTTP {response.status} from {url}")
+                response.raise_for_status()
+                if read is not None:
+                    return await read(response)
+                return await response.json(content_type=None)
+        except (
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            TimeoutError,
+        ) as req_err:
+            _LOGGER.warning("Request error occurred while calling %s: %s", url, req_err)
+            # Network level error, or the connection dropped mid-body - worth another try
+            raise Unavailable(f"Request error while calling {url}") from req_err
+        except aiohttp.ClientError as req_err:
+            _LOGGER.error("Request error occurred while calling %s: %s", url, req_err)
+            # HTTP or other request-level error
+            raise HTTPFailed from req_err
+
+    async def _request_json(self, method, url, headers=None, read=None, **kwargs):
+        """Perform an API request and return the decoded JSON body - or what read returns.
+
+        Transient failures are retried with backoff, see Novafos._request.  On HTTP 429
+        all requests sharing the rate limiter are paused.
+        """
+        if headers is None:
+            headers = self._api_headers()
+        trial = self._check_circuit()
+        try:
+            attempt = 0
+            while True:
+                await self._scheduler.limiter.acquire()
+                try:
+                    result = await self._send_json(method, url, headers, read, **kwargs)
+                except Unavailable as err:
+                    delay = self._retry_delay(err, attempt)
+                    if delay is None:
+                        self._circuit.record_failure()
+                        raise
+                    # No time left to wait for the retry
+                    self._check_deadline(delay)
+                    attempt += 1
+                    if isinstance(err, RateLimited):
+                        # Pause all requests sharing the limiter, then try again
+                        self._scheduler.rate_limited(delay)
+                    else:
+                        _LOGGER.debug("Retrying %s in %.1fs: %s", url, delay, err)
+                        await asyncio.sleep(delay)
+                    continue
+                self._circuit.record_success()
+                return result
+        except BaseException:
+            # Neither a success nor a failure of the API, e.g. rejected or past the
+            # deadline - the next request may be the trial of the half-open circuit
+            if trial:
+                self._circuit.release_trial()
+            raise
+
+    async def authenticate_using_access_token(
+        self, access_token, access_token_date_updated
+    ):
+        """The only reason for this function is due to to a reCAPTCHA challenge on the Novafos login page.
+        The date is used to verify the token is not too old when getting data.
+        """
+        if not self._set_access_token(access_token, access_token_date_updated):
+            return False
+        if self._metadata_current():
+            return True
+
+        # Configure other data necessary for fetching data
+        try:
+            await self._get_customer_id()
+            await self._get_active_meters()
+            self._metadata_updated()
+            return True
+        except LoginFailed as lf:
+            _LOGGER.error("Login failed during authenticate_using_access_token: %s", lf)
+            return False
+        except HTTPFailed as hf:
+            _LOGGER.error("HTTP failure during authenticate_using_access_token: %s", hf)
+            return False
+
+    async def _get_customer_id(self):
+        # Need to retrieve the customer ID from the user profile to fetch data.
+        # Only the Authorization header applies here.
+        url = f"{self._api_url}/api/profile/get"
+        resp_json = await self._request_json(
+            "GET", url, headers={"Authorization": self._access_token}
+        )
+        self._parse_customer_profile(resp_json)
+
+    async def _get_active_meters(self):
+        """See Novafos._get_active_meters."""
+        data = {"IncludeUnits": "true"}
+        url = f"{self._api_url}/api/meter/customerActiveMeters"
+        self._parse_active_meters(await self._request_json("POST", url, data=data))
+
+    async def get_available_time_series_periods(self) -> datetime:
+        """See Novafos.get_available_time_series_periods."""
+        url = f"{self._api_url}/api/consumption/availableTimeSeriesPeriods"
+        return self._parse_available_periods(await self._request_json("GET", url))
+
+    async def _get_consumption_timeseries(
+        self, metering_device, dateFrom, dateTo, zoomLevel=0
+    ):
+        """See Novafos._get_consumption_timeseries."""
+        data = self._consumption_request_data(
+            metering_device, dateFrom, dateTo, zoomLevel
+        )
+        key = self.response_cache.key(metering_device, zoomLevel, dateFrom, dateTo)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
+
+        url = f"{self._api_url}/api/consumption/consumptionTimeSeries"
+        # The response is parsed while it streams in
+        parsed = await self._request_json(
+            "POST", url, read=self._read_timeseries, json=data
+        )
+        return self._cache_timeseries(key, metering_device, dateFrom, dateTo, parsed)
+
+    async def _map_meters(self, func, metering_devices, *args):
+        """See Novafos._map_meters."""
+        semaphore = asyncio.Semaphore(self._pool_size)
+
+        async def run(metering_device):
+            async with semaphore:
+                return await func(metering_device, *args)
+
+        return await asyncio.gather(
+            *(run(metering_device) for metering_device in metering_devices),
+            return_exceptions=True,
+        )
+
+    async def _get_all_consumption_timeseries(self, dateFrom, dateTo, zoomLevel=0):
+        """Retrieve data from all active metering devices"""
+        results = self._meter_results(
+            self._active_meters,
+            await self._map_meters(
+                self._get_consumption_timeseries,
+                self._active_meters,
+                dateFrom,
+                dateTo,
+                zoomLevel,
+            ),
+        )
+        return [
+            self._empty_timeseries(active_meter) if timeseries is None else timeseries
+            for active_meter, timeseries in zip(self._active_meters, results)
+        ]
+
+    async def _get_window_timeseries(self, metering_device, first_day, last_day):
+        """See Novafos._get_window_timeseries."""
+        dateFrom, dateTo = self._window_range(first_day, last_day)
+        try:
+            series = await self._get_consumption_timeseries(
+                metering_device, dateFrom, dateTo, self._zoom_level["Hour"]
+            )
+            if not self._is_truncated(series, first_day, last_day):
+                return [series]
+            _LOGGER.debug("Window %s to %s was truncated", dateFrom, dateTo)
+        except (Unavailable, DeadlineExceeded):
+            # A smaller window will not help
+            raise
+        except HTTPFailed:
+            if first_day == last_day:
+                raise
+            _LOGGER.debug("Window %s to %s was rejected", dateFrom, dateTo)
+
+        left, right = self._split_window(first_day, last_day)
+        return await self._get_window_timeseries(
+            metering_device, *left
+        ) + await self._get_window_timeseries(metering_device, *right)
+
+    async def get_statistics(
+        self, from_date=None, deadline: Deadline | None = None
+    ) -> dict:
+        """See Novafos.get_statistics.
+
+        The windows are fetched concurrently by the backfill scheduler and stored in
+        chronological order once all of them are done.
+        """
+        self.statistics_pending = False
+        if from_date is None:
+            # If no date, just return - no default behaviour
+            return {}
+
+        with self._deadline_scope(deadline):
+            hourly_from = self._hourly_start(from_date)
+            # The hours are only retrieved once the days before them are - no gap is
+            # left in the rollups
+            if hourly_from <= from_date or await self._get_day_summaries(
+                from_date, hourly_from - timedelta(days=1), required=True
+            ):
+                await self._get_statistics(hourly_from)
+        return self._statistics_since(from_date)
+
+    async def _get_statistics(self, from_date):
+        active_meters = list(self._active_meters)
+        windows = self._statistics_windows(from_date)
+        _LOGGER.info(
+            "Statistics fetch %s window(s) from %s", len(windows), from_date.date()
+        )
+        results = await self._scheduler.run(
+            partial(
+                self._map_meters,
+                self._get_window_timeseries,
+                active_meters,
+                first_day,
+                last_day,
+            )
+            for first_day, last_day in windows
+        )
+
+        failed = set()
+        for n, ((first_day, _), window_results) in enumerate(zip(windows, results)):
+            try:
+                if isinstance(window_results, BaseException):
+                    raise window_results
+                self._store_window_results(active_meters, window_results, failed)
+            except HTTPFailed as err:
+                if n == 0 and not self._deadline_expired():
+                    raise
+                # Keep the days before the failed window.  Later windows are in the
+                # response cache and cheap to pick up on the next update.
+                self._statistics_deferred(first_day, err)
+                break
+        self._log_statistics()
+
+    async def get_day_summaries(self, from_date=None, deadline: Deadline | None = None):
+        """See Novafos.get_day_summaries."""
+        if from_date is None:
+            from_date = self._day_summaries_start()
+        if from_date is not None:
+            with self._deadline_scope(deadline):
+                await self._get_day_summaries(from_date)
+        return self._day_sums
+
+    async def _get_day_summaries(self, from_date, until=None, required=False):
+        """See Novafos._get_day_summaries."""
+        active_meters = list(self._active_meters)
+        for first_day, last_day in self._statistics_windows(from_date, until):
+            if self._deadline_expired():
+                return self._day_summaries_stopped(
+                    first_day, "deadline passed", required
+                )
+            dateFrom, dateTo = self._window_range(first_day, last_day)
+            try:
+                results = self._meter_results(
+                    active_meters,
+                    await self._map_meters(
+                        self._get_consumption_timeseries,
+                        active_meters,
+                        dateFrom,
+                        dateTo,
+                        self._zoom_level["Day"],
+                    ),
+                )
+            except HTTPFailed as err:
+                return self._day_summaries_stopped(first_day, err, required)
+            self._store_day_summaries(results)
+            if required and None in results:
+                # Stop for all meters to keep the days without gaps
+                return self._day_summaries_stopped(
+                    first_day, "a meter failed", required
+                )
+        return True
+
+    async def get_year_data(self, deadline: Deadline | None = None):
+        """See Novafos.get_year_data."""
+        dateFrom, dateTo = self._year_range()
+
+        with self._deadline_scope(deadline):
+            time_series = await self._get_all_consumption_timeseries(
+                dateFrom=dateFrom, dateTo=dateTo, zoomLevel=self._zoom_level["Year"]
+            )
+        return self._build_year_data(time_series)
@@ -0,0 +1,126 @@
+"""
+Checkpoints of the first-time statistics backfill.
+
+Retrieving a year of hourly data takes more than one refresh - the refresh deadline, a
+restart or an expired access token cut it short.  A checkpoint per meter type records
+the last hour imported as statistics, the running sum at that hour and the windows of
+days still to retrieve, so the backfill continues where it stopped.  The owner persists
+the checkpoints, e.g. through the Home Assistant storage helper.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime
+import logging
+from typing import NamedTuple
+
+_LOGGER = logging.getLogger(__name__)
+
+BACKFILL_VERSION = 1
+
+
+class Checkpoint(NamedTuple):
+    """Progress of the backfill of a meter type."""
+
+    # Start of the last hour imported as UTC epoch seconds - None before the first import
+    last_hour: int | None
+    # Statistics sum at the last hour imported
+    sum: float
+    # Windows of local days still to retrieve: [(first_day, last_day), ...] as ISO dates
+    windows: list
+    # Days to retrieve when the backfill started
+    days: int = 0
+
+
+class BackfillCheckpoints:
+    """Backfill checkpoints per meter type."""
+
+    def __init__(self):
+        self._meters = {}
+        # Set whenever the content changes and needs to be persisted
+        self.dirty = False
+
+    def get(self, meter_type):
+        """Return the checkpoint of a meter type, or None if no backfill is in progress."""
+        return self._meters.get(meter_type)
+
+    def start(self, meter_type, windows):
+        """Start a backfill of the windows of days [(first_day, last_day), ...] from a zero sum."""
+        windows = [
+            (first.date().isoformat(), last.date().isoformat())
+            for first, last in windows
+        ]
+        self._meters[meter_type] = Checkpoint(None, 0.0, windows, _days(windows))
+        self.dirty = True
+
+    def resume_from(self, meter_type):
+        """Return the first day still to retrieve as naive local datetime - None if none is left."""
+        checkpoint = self._meters.get(meter_type)
+        if checkpoint is None or not checkpoint.windows:
+            return None
+        return datetime.fromisoformat(checkpoint.windows[0][0])
+
+    def progress(self, meter_type):
+        """Return the share of the days retrieved, 0.0 to 1.0 - None if no backfill is in progress."""
+        checkpoint = self._meters.get(meter_type)
+        if checkpoint is None:
+            return None
+        if not checkpoint.days:
+            return 1.0
+        return 1.0 - _days(checkpoint.windows) / checkpoint.days
+
+    def advance(self, meter_type, last_hour, running_sum, tz):
+        """
+        Record that the hours until last_hour are imported, with running_sum the sum at last_hour.
+        The windows ending before the local day of last_hour are done.
+        """
+        checkpoint = self._meters[meter_type]
+        day = datetime.fromtimestamp(last_hour, tz).date().isoformat()
+        self._meters[meter_type] = checkpoint._replace(
+            last_hour=last_hour,
+            sum=running_sum,
+            windows=[window for window in checkpoint.windows if window[1] >= day],
+        )
+        self.dirty = True
+
+    def finish(self, meter_type):
+        """Drop the checkpoint of a meter type once its backfill is complete."""
+        if self._meters.pop(meter_type, None) is not None:
+            _LOGGER.info("Backfill of %s statistics complete", meter_type)
+            self.dirty = True
+
+    def to_dict(self):
+        """Return the persistable content."""
+        self.dirty = False
+        return {
+            "version": BACKFILL_VERSION,
+            "meters": {
+                meter_type: checkpoint._asdict()
+                for meter_type, checkpoint in self._meters.items()
+            },
+        }
+
+    def load(self, data):
+        """Restore the content saved by to_dict."""
+        if not data or data.get("version") != BACKFILL_VERSION:
+            return
+        self._meters = {
+            meter_type: Checkpoint(
+                checkpoint["last_hour"],
+                checkpoint["sum"],
+                [tuple(window) for window in checkpoint["windows"]],
+                checkpoint["days"],
+            )
+            for meter_type, checkpoint in data["meters"].items()
+        }
+        _LOGGER.debug(
+            "Loaded backfill checkpoints of %s meter type(s)", len(self._meters)
+        )
+
+
+def _days(windows):
+    """Count the days of windows of ISO dates."""
+    return sum(
+        (date.fromisoformat(last) - date.fromisoformat(first)).days + 1
+        for first, last in windows
+    )
@@ -0,0 +1,142 @@
+"""
+Cache of consumptionTimeSeries responses.
+
+Data for a finished period never changes once every hour is complete, so such
+responses do not expire.  Responses for periods still in progress expire
+after a TTL.  The cache is bounded all the same: responses for periods which ended
+more than retention seconds ago are dropped, and beyond max_entries the least recently
+used response is.  The cache is a plain dictionary which the owner persists, e.g.
+through the Home Assistant storage helper.  The records of the responses are stored
+as lists and dictionaries - JSON encoders do not take NamedTuples.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+from .records import PeriodSummary, Reading
+
+_LOGGER = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+
+# Seconds a response for a period with incomplete data is served from the cache
+DEFAULT_PARTIAL_TTL = 15 * 60
+
+# Responses kept at most.  Two years of month grid windows of two meters at two zoom levels
+# take some 200.
+DEFAULT_MAX_ENTRIES = 256
+
+
+class ResponseCache:
+    """
+    Cache of flattened consumptionTimeSeries responses keyed by
+    (MeasurementPointId, unit, zoom level, window).
+    """
+
+    def __init__(self, ttl=DEFAULT_PARTIAL_TTL, retention=None, max_entries=None):
+        self._ttl = ttl
+        self._retention = retention
+        self._max_entries = DEFAULT_MAX_ENTRIES if max_entries is None else max_entries
+        # In order of use, the least recently used first
+        self._entries = {}
+        # Set whenever the content changes and needs to be persisted
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(metering_device, zoomLevel, dateFrom, dateTo):
+        """Build the cache key for a request."""
+        return (
+            f"{metering_device.measurement_point_id}/{metering_device.unit['Id']}"
+            f"/{zoomLevel}/{dateFrom}/{dateTo}"
+        )
+
+    def _expired(self, entry, now):
+        if not entry["immutable"]:
+            return now - entry["stored"] > self._ttl
+        # Periods which ended before the retention window are not asked for again
+        end = entry.get("end")
+        return (
+            self._retention is not None
+            and end is not None
+            and end < now - self._retention
+        )
+
+    def get(self, key):
+        """Return the cached response for key, or None if it is missing or expired."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry, time.time()):
+            del self._entries[key]
+            self.dirty = True
+            return None
+        # Most recently used
+        self._entries[key] = self._entries.pop(key)
+        # Callers may modify the top level - hand out a copy of that.  The records are immutable.
+        return dict(entry["response"])
+
+    def put(self, key, response, immutable, end=None):
+        """
+        Store a response.  Immutable responses do not expire before end, the end of their
+        period as epoch seconds, falls out of the retention window.
+        """
+        self._entries.pop(key, None)
+        self._entries[key] = {
+            "stored": time.time(),
+            "immutable": immutable,
+            "end": end,
+            "response": response,
+        }
+        while len(self._entries) > self._max_entries:
+            del self._entries[next(iter(self._entries))]
+        self.dirty = True
+
+    def to_dict(self):
+        """Return the persistable content of the cache.  Expired entries are dropped."""
+        now = time.time()
+        self._entries = {
+            key: entry
+            for key, entry in self._entries.items()
+            if not self._expired(entry, now)
+        }
+        self.dirty = False
+        return {
+            "version": CACHE_VERSION,
+            "entries": {
+                key: {**entry, "response": _to_plain(entry["response"])}
+                for key, entry in self._entries.items()
+            },
+        }
+
+    def load(self, data):
+        """Restore the content saved by to_dict."""
+        if not data or data.get("version") != CACHE_VERSION:
+            return
+        self._entries = {
+            key: {**entry, "response": _from_plain(entry["response"])}
+            for key, entry in data["entries"].items()
+        }
+        _LOGGER.debug("Loaded %s cached responses", len(self._entries))
+
+
+def _to_plain(response):
+    """Turn the records of a response into lists and dictionaries."""
+    return {
+        **response,
+        "Data": [list(row) for row in response["Data"]],
+        "Extra": response["Extra"]._asdict(),
+    }
+
+
+def _from_plain(response):
+    """Undo _to_plain."""
+    return {
+        **response,
+        "Data": [Reading(*row) for row in response["Data"]],
+        "Extra": PeriodSummary(**response["Extra"]),
+    }
@@ -4,16 +4,63 @@ Primary public module for novafos.dk API wrapper.
 
 from __future__ import annotations
 
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from datetime import date, datetime
 from datetime import timedelta
-from unittest import result
 from zoneinfo import ZoneInfo
 import logging
-import json
+import time
 import requests
+from requests.adapters import HTTPAdapter
+
+from .backfill import BackfillCheckpoints
+from .cache import ResponseCache
+from .resilience import (
+    CONNECT_TIMEOUT,
+    RATE_LIMITED_RETRIES,
+    READ_TIMEOUT,
+    RETRY_STATUS,
+    CircuitBreaker,
+    Deadline,
+    RetryPolicy,
+)
+from .records import MeterInfo, PeriodSummary, Reading
+from .rollup import GROUPINGS, IncrementalRollups, rollup
+from .scheduler import parse_retry_after
+from .series import HourlySeries
+from .stream import STREAM_CHUNK_SIZE, ConsumptionStreamParser
+from .tracing import LazyJson, ResponseTrace
 
 _LOGGER = logging.getLogger(__name__)
 
+_UTC = ZoneInfo("UTC")
+
+# Days of hourly data asked for in one consumptionTimeSeries request
+DEFAULT_WINDOW_DAYS = 31
+
+# Days of hourly data kept per meter.  Covers the initial import from the start of last year.
+DEFAULT_RETENTION_DAYS = 2 * 366
+
+# Summaries of the latest windows retrieved kept per meter type, for debug logging
+EXTRA_KEPT = 64
+
+# Deadline of the ongoing get_statistics/get_year_data call, and whether get_statistics left
+# days for the next call.  Kept per context - per asyncio task or thread - as calls made by
+# concurrent tasks on one client overlap.
+_DEADLINE: ContextVar[Deadline | None] = ContextVar("novafos_deadline", default=None)
+_STATISTICS_PENDING: ContextVar[bool] = ContextVar(
+    "novafos_statistics_pending", default=False
+)
+
+# Version of the customer profile and active meters content, see metadata_to_dict
+METADATA_VERSION = 1
+
+# Seconds the customer profile and active meters are used before they are retrieved again
+DEFAULT_METADATA_TTL = 24 * 3600
+
 
 class LoginFailed(Exception):
     """ "Exception class for bad credentials"""
@@ -23,12 +70,62 @@ class HTTPFailed(Exception):
     """Exception class for API HTTP failures"""
 
 
-class Novafos:
+class Unavailable(HTTPFailed):
+    """Exception class for transient API failures - network errors, HTTP 5xx and the like"""
+
+
+class RateLimited(Unavailable):
+    """Exception class for the API answering HTTP 429 Too Many Requests"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited - retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitOpen(Unavailable):
+    """Exception class for requests not sent because the API failed repeatedly"""
+
+    def __init__(self, retry_in):
+        super().__init__(f"KMD API unavailable - requests paused for {retry_in:.0f}s")
+        self.retry_in = retry_in
+
+
+class DeadlineExceeded(HTTPFailed):
+    """Exception class for requests not sent because the deadline of the caller has passed"""
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter applying connect/read timeouts to requests sent without a timeout."""
+
+    def __init__(self, *args, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs):
+        self._timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self._timeout
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+class NovafosBase:
     """
-    Primary exported interface for KMD API wrapper.
+    Transport independent part of the KMD API wrapper.
+
+    Holds the state, builds the API requests, parses the API responses and
+    groups the data.  The actual HTTP calls are made by Novafos (blocking)
+    and AsyncNovafos (asyncio).
     """
 
-    def __init__(self, timezone):
+    def __init__(
+        self,
+        timezone,
+        window_days=DEFAULT_WINDOW_DAYS,
+        retry_policy: RetryPolicy | None = None,
+        trace_responses=0,
+        retention_days=DEFAULT_RETENTION_DAYS,
+        hourly_days=None,
+        metadata_ttl=DEFAULT_METADATA_TTL,
+    ):
         self._api_url = "https://easy-energy-plugin-api.kmd.dk"
         self.tz = ZoneInfo(timezone)
 
@@ -37,26 +134,124 @@ class Novafos:
         self._customer_number = ""
         self._active_meters = []
         self._earliest_data_date = None
+        # Hourly readings per meter type as HourlySeries.  Hours fetched again replace the
+        # readings already there, and only the latest retention_days days are kept.
         self._meter_data = {}
+        self._retention = max(1, retention_days) * 24 * 3600
+        # Summaries (PeriodSummary) of the latest EXTRA_KEPT windows retrieved per meter type
         self._meter_data_extra = {}
+        # Daily sums summarised by the API (Day zoom) per meter type: {date: sum}.  Only days
+        # flagged complete are kept - the rollups take them instead of summing the hours.
+        self._day_sums = {}
         self._meter_data_grouped = {}
         self._last_valid_day = None
 
         # NOTE: Added because of reCAPCTHA login screen
         self._access_token_date_updated = ""
+        # Set whenever the customer profile or active meters change and need to be persisted
+        self.metadata_dirty = False
+        # The customer profile and active meters are retrieved again after metadata_ttl seconds,
+        # with a new access token, or after the API rejected the access token
+        self._metadata_ttl = metadata_ttl
+        self._metadata_retrieved = None
+        self._metadata_token = ""
 
         # Zoom level is the granuarity of the retrieved data
         self._zoom_level = {"Year": 0, "Month": 1, "Day": 2, "Hour": 3, "Billing": 4}
 
+        # Number of days of hourly data asked for in a single request.  1 is one request per day.
+        self._window_days = max(1, window_days)
+
+        # Days before today retrieved at Hour zoom by get_statistics.  Older days are only
+        # retrieved at Day zoom, as daily summaries for the rollups.  None is all days hourly.
+        self._hourly_days = None if hourly_days is None else max(1, hourly_days)
+
+        # Responses already retrieved.  Periods with complete data are never asked for again.
+        self.response_cache = ResponseCache(retention=self._retention)
+
+        # Grouped statistics state.  Only the buckets touched by new hourly data are recomputed.
+        self.rollups = IncrementalRollups()
+
+        # Progress of the first-time statistics backfill per meter type
+        self.backfill = BackfillCheckpoints()
+
+        # Transient failures are retried.  Repeated failures open the circuit and requests fail fast.
+        self._retry = retry_policy if retry_policy is not None else RetryPolicy()
+        self._circuit = CircuitBreaker()
+
+        # The latest raw API responses, kept for diagnostics if trace_responses > 0
+        self.trace = ResponseTrace(trace_responses)
+
     def _print_json(self, map, context="JSON dump"):
-        _LOGGER.debug(
-            "%s:\n %s",
-            context,
-            json.dumps(map, indent=4, sort_keys=True, ensure_ascii=False),
-        )
+        # Only serialised if the record is emitted
+        _LOGGER.debug("%s:\n %s", context, LazyJson(map))
 
-    def authenticate_using_access_token(self, access_token, access_token_date_updated):
-        """The only reason for this function is due to to a reCAPTCHA challenge on the Novafos login page.
+    def _api_headers(self):
+        """Return the headers identifying the customer towards the API.  Unset values are left out."""
+        headers = {
+            "Customer-Id": self._customer_id,
+            "Customer-Number": self._customer_number,
+            "Authorization": self._access_token,
+        }
+        return {key: value for key, value in headers.items() if value}
+
+    def _check_circuit(self):
+        """
+        Raise CircuitOpen if requests to the API are paused after repeated failures.
+        Returns True for the trial request of the half-open circuit.
+        """
+        if not self._circuit.allow_request():
+            raise CircuitOpen(self._circuit.retry_in())
+        return self._circuit.is_open
+
+    @property
+    def _deadline(self) -> Deadline | None:
+        """Deadline of the ongoing get_statistics/get_year_data call of this context, if any."""
+        return _DEADLINE.get()
+
+    @property
+    def statistics_pending(self) -> bool:
+        """Set when the latest get_statistics call of this context stopped early and left days for the next call."""
+        return _STATISTICS_PENDING.get()
+
+    @statistics_pending.setter
+    def statistics_pending(self, pending: bool):
+        _STATISTICS_PENDING.set(pending)
+
+    @contextmanager
+    def _deadline_scope(self, deadline: Deadline | None):
+        """Apply deadline to the requests made within the block - in this context only."""
+        token = _DEADLINE.set(deadline)
+        try:
+            yield
+        finally:
+            _DEADLINE.reset(token)
+
+    def _check_deadline(self, needed=0.0):
+        """Raise DeadlineExceeded if less than needed seconds are left until the deadline."""
+        if self._deadline is not None and self._deadline.remaining() <= needed:
+            raise DeadlineExceeded("Deadline passed - request not sent")
+
+    def _deadline_expired(self):
+        return self._deadline is not None and self._deadline.expired
+
+    def _retry_delay(self, err, attempt):
+        """Return the seconds to wait before repeating a request which failed with err,
+        or None if it should not be repeated.  attempt is the number of retries made so far.
+        """
+        if isinstance(err, RateLimited):
+            if attempt >= RATE_LIMITED_RETRIES:
+                return None
+            return err.retry_after
+        if attempt >= self._retry.retries:
+            return None
+        return self._retry.delay(attempt + 1)
+
+    def _update_session_headers(self):
+        """Called whenever the credentials change.  Transports with default headers hook in here."""
+
+    def _set_access_token(self, access_token, access_token_date_updated):
+        """Store the access token and check that it can be used for API accesses.
         The date is used to verify the token is not too old when getting data.
         """
         self._access_token_date_updated = access_token_date_updated
@@ -65,11 +260,13 @@ class Novafos:
             self._access_token = "Bearer " + access_token
         else:
             self._access_token = ""
+            self._update_session_headers()
             _LOGGER.error(
                 "Token update does not seem to have a valid length %s. Please check again. (This message is normal the first time the integration starts)",
                 len(access_token),
             )
             return False
+        self._update_session_headers()
         _LOGGER.debug(
             "Access token set to: '%s' at date: '%s'",
             self._access_token,
@@ -89,63 +286,775 @@ class Novafos:
                 "Access_token too old or not set correctly while authenticating"
             )
             return False
-        else:
-            # Configure other data necessary for fetching data
-            try:
-                self._get_customer_id()
-                self._get_active_meters()
-                return True
-            except LoginFailed as lf:
-                _LOGGER.error("Login failed during authenticate_using_access_token: %s", lf)
-                return False
-            except HTTPFailed as hf:
-                _LOGGER.error("HTTP failure during authenticate_using_access_token: %s", hf)
-                return False
+        return True
+
+    def _metadata_current(self):
+        """Check if the customer profile and active meters can be used without retrieving them again."""
+        return (
+            self._metadata_retrieved is not None
+            and self._metadata_token == self._access_token
+            and time.time() - self._metadata_retrieved < self._metadata_ttl
+        )
 
-    def _get_customer_id(self):
-        # Need to retrieve the customer ID from the user profile to fetch data.
-        headers = {
-            "Authorization": self._access_token,
+    def _metadata_updated(self):
+        """Note that the customer profile and active meters were retrieved with the current access token."""
+        self._metadata_retrieved = time.time()
+        self._metadata_token = self._access_token
+
+    def _authentication_failed(self):
+        """The API rejected the access token - retrieve the profile and meters again next time."""
+        self._metadata_retrieved = None
+
+    def _parse_customer_profile(self, resp_json):
+        """Pick the customer id and number from the profile response."""
+        try:
+            customer_id = f"{resp_json['Customers'][0]['Id']}"
+            customer_number = f"{resp_json['Customers'][0]['Number']}"
+        except Exception as json_err:
+            _LOGGER.error("Failed to parse customer id response: %s", json_err)
+            raise HTTPFailed from json_err
+        if (customer_id, customer_number) != (self._customer_id, self._customer_number):
+            self._customer_id = customer_id
+            self._customer_number = customer_number
+            self.metadata_dirty = True
+        self._update_session_headers()
+        _LOGGER.debug(
+            "Retrieved customer_id, number: %s, %s",
+            self._customer_id,
+            self._customer_number,
+        )
+
+    def _parse_active_meters(self, response_json):
+        """Pick the active water and heating meters from the customerActiveMeters response."""
+        previous = self._active_meters
+        self._active_meters = []
+        for meter in response_json:
+            """ Pick up active water measuring meters """
+            if meter["IsActive"] and meter["ConsumptionTypeId"] == 6:
+                # Water type
+                self._add_active_meter(
+                    MeterInfo(
+                        "water",
+                        meter["InstallationId"],
+                        meter["MeasurementPointId"],
+                        meter["Units"][0],
+                    )
+                )
+            if meter["IsActive"] and meter["ConsumptionTypeId"] == 5:
+                # Heating type
+                self._add_active_meter(
+                    MeterInfo(
+                        "heating",
+                        meter["InstallationId"],
+                        meter["MeasurementPointId"],
+                        meter["Units"][0],
+                    )
+                )
+        if self._active_meters != previous:
+            self.metadata_dirty = True
+        # The meter data of meters no longer active is dropped
+        active_types = {active.type for active in self._active_meters}
+        for meter_type in [key for key in self._meter_data if key not in active_types]:
+            del self._meter_data[meter_type]
+            del self._meter_data_extra[meter_type]
+        _LOGGER.debug("Got active (water/heating) meters : %s", self._active_meters)
+
+    def _add_active_meter(self, active):
+        """Add an active meter.  The meter data retrieved before for its type is kept."""
+        if active.type not in self._meter_data:
+            self._meter_data[active.type] = HourlySeries(
+                self.tz, retention=self._retention
+            )
+            self._meter_data_extra[active.type] = deque(maxlen=EXTRA_KEPT)
+        self._active_meters.append(active)
+
+    def metadata_to_dict(self):
+        """Return the customer profile and active meters as persistable content."""
+        self.metadata_dirty = False
+        return {
+            "version": METADATA_VERSION,
+            "customer_id": self._customer_id,
+            "customer_number": self._customer_number,
+            "meters": [active._asdict() for active in self._active_meters],
         }
 
-        url = f"{self._api_url}/api/profile/get"
+    def load_metadata(self, data):
+        """
+        Restore the customer profile and active meters saved by metadata_to_dict.
+        The meters are then known without reaching the API - authenticating retrieves them again.
+        """
+        if not data or data.get("version") != METADATA_VERSION:
+            return
+        self._customer_id = data["customer_id"]
+        self._customer_number = data["customer_number"]
+        self._active_meters = []
+        self._meter_data = {}
+        self._meter_data_extra = {}
+        for active in data["meters"]:
+            self._add_active_meter(MeterInfo(**active))
+        self._update_session_headers()
+        _LOGGER.debug("Loaded active (water/heating) meters : %s", self._active_meters)
+
+    def get_meter_types(self):
+        return self._active_meters
+
+    def _parse_available_periods(self, result_json):
+        """Pick the earliest date with data from the availableTimeSeriesPeriods response."""
+        # Enable logging DEBUG to see all returned data from the API:
+        self._print_json(
+            result_json, "Retrieved available timeseries periods JSON response"
+        )
 
+        # Entry with RangeType 0 is for the specific meter, and is the one we care about.  It has the actual earliest date of data available.
+        self._earliest_data_date = datetime.fromisoformat(result_json[0]["MinDate"])
+        # self._earliest_data_date = self._local_str_to_utc(result_json[0]["MinDate"])
+        return self._earliest_data_date
+
+    def _consumption_request_data(self, metering_device, dateFrom, dateTo, zoomLevel):
+        """Build the consumptionTimeSeries query for a single metering device."""
+        # Setup query parameters for the API.
+        # Necessary fields are installation relevant properties and the date/zoom range.
+        return {
+            "InstallationId": metering_device.installation_id,
+            "MeasurementPointId": metering_device.measurement_point_id,
+            "Unit": metering_device.unit,
+            "ZoomLevel": zoomLevel,
+            "PriceData": "false",  # optional
+            "Interval": "PT1H",
+            "DateFrom": dateFrom,
+            "DateTo": dateTo,
+        }
+
+    def _unreadable(self, parse_err):
+        """Return the HTTPFailed raised for a time series response which is not JSON or cut short."""
+        _LOGGER.error("Failed to parse time series response: %s", parse_err)
+        return HTTPFailed(f"Unreadable time series response: {parse_err}")
+
+    def _timeseries_parser(self):
+        """Return a streaming parser for a consumptionTimeSeries response, and the list of Readings its rows are added to.
+
+        Only the first data series is used - no idea what would return more than one.  The
+        list holds all rows of the window - it is what the response cache keeps.
+        """
+        series_data = []
+        append = series_data.append
+
+        def add_row(date_from, value):
+            # Add data - complete or not!
+            append(Reading(date_from, value))
+
+        return ConsumptionStreamParser(add_row), series_data
+
+    def _is_complete(self, parser, dateTo):
+        """Check if a parsed consumptionTimeSeries response is final: every value is complete up to dateTo."""
+        if not parser.rows or not parser.complete:
+            return False
+        # Row dates are local time, the requested range is UTC
+        local_end = (
+            datetime.fromisoformat(dateTo).astimezone(self.tz).replace(tzinfo=None)
+        )
+        return datetime.fromisoformat(parser.last_date_to[:19]) >= local_end.replace(
+            microsecond=0
+        )
+
+    def _cache_timeseries(self, key, metering_device, dateFrom, dateTo, parsed):
+        """Flatten a parsed consumptionTimeSeries response and add it to the response cache.
+
+        parsed is the (parser, rows) pair of _timeseries_parser after the whole response was fed.
+        See Novafos._get_consumption_timeseries.
+        """
+        parser, series_data = parsed
+        # Enable logging DEBUG to see the returned totals from the API:
+        self._print_json(parser.summary, "Retrieved timeseries JSON response")
+
+        # Return first data series.  Unknown how more series could come from a single metering device?
+        summary = parser.summary
+        meter_data = {
+            "type": metering_device.type,
+            "Data": series_data,
+            "Extra": PeriodSummary(
+                summary["Total"]["Value"],
+                summary["Average"]["Value"],
+                summary["Maximum"]["Value"],
+                summary["Minimum"]["Value"],
+                parser.last_date_to,
+                parser.complete_rows,
+            ),
+        }
+        _LOGGER.debug("Retrieved data from API: %s", meter_data)
+        # Windows off the month grid, like the days since the last statistics, are asked for
+        # once - kept as final they would pile up a new entry a day
+        self.response_cache.put(
+            key,
+            meter_data,
+            immutable=self._is_complete(parser, dateTo)
+            and self._on_window_grid(dateFrom, dateTo),
+            end=int(datetime.fromisoformat(dateTo).timestamp()),
+        )
+        return meter_data
+
+    def _on_window_grid(self, dateFrom, dateTo):
+        """
+        Check if the UTC range dateFrom-dateTo covers a whole window of the month grid, see
+        _statistics_windows, or a whole year.
+        """
+        first_day = datetime.fromisoformat(dateFrom).astimezone(self.tz).date()
+        last_day = datetime.fromisoformat(dateTo).astimezone(self.tz).date()
+        if (first_day.month, first_day.day, last_day.month, last_day.day) == (
+            1,
+            1,
+            12,
+            31,
+        ):
+            return True
+        if (first_day.day - 1) % self._window_days:
+            return False
+        next_month = (first_day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return last_day == min(
+            first_day + timedelta(days=self._window_days - 1),
+            next_month - timedelta(days=1),
+        )
+
+    def _local_to_utc(self, local_time):
+        """Convert a local time to UTC time including timezone and summer(DST)/winter time offsets."""
+        # A naive time is local to the configured timezone - not to the system time
+        if local_time.tzinfo is None:
+            local_time = local_time.replace(tzinfo=self.tz)
+        return local_time.astimezone(_UTC)
+
+    def _local_str_to_utc_str(self, local_time_str):
+        """Convert a local ISO time string to UTC time strimg."""
+        return self._utc_to_isostr(
+            self._local_to_utc(datetime.fromisoformat(local_time_str))
+        )
+
+    def _local_str_to_utc(self, local_time_str):
+        """Convert a local ISO time string to UTC time strimg."""
+        return self._local_to_utc(datetime.fromisoformat(local_time_str))
+
+    def _utc_to_isostr(self, utc_time):
+        return utc_time.isoformat().replace("+00:00", "Z")
+
+    def _statistics_windows(self, from_date, until=None):
+        """
+        Return the windows of days to fetch hourly statistics for as (first_day, last_day) tuples.
+        Each window covers at most window_days days.
+
+        Windows are laid out from the first day of each month and never cross a month boundary.
+        The same days thus always give the same requests, which can be served by the response cache.
+
+        from_date is a datetime object with the date in local time from which to start retrieving data.  All days until present day will be retrieved,
+        or until the day of until, if given.
+        """
+        # Calculate date range to process - clean time settings too
+        from_date_input = from_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        end_date_input = datetime.now().replace(
+            hour=23, minute=59, second=59, microsecond=0
+        )
+        days_back = (end_date_input - from_date_input).days
+        _LOGGER.debug(
+            "Statistics range to fetch: %s-%s | %s day(s)",
+            from_date_input,
+            end_date_input,
+            days_back,
+        )
+
+        windows = []
+        first_day = from_date_input
+        end_day = from_date_input + timedelta(days=days_back - 1)
+        if until is not None:
+            end_day = min(
+                end_day, until.replace(hour=0, minute=0, second=0, microsecond=0)
+            )
+        while first_day <= end_day:
+            next_month = (first_day.replace(day=28) + timedelta(days=4)).replace(day=1)
+            # Days left of the window of the month grid the first day falls in
+            days = self._window_days - (first_day.day - 1) % self._window_days
+            last_day = min(
+                first_day + timedelta(days=days - 1),
+                next_month - timedelta(days=1),
+                end_day,
+            )
+            windows.append((first_day, last_day))
+            first_day = last_day + timedelta(days=1)
+        return windows
+
+    def _window_range(self, first_day, last_day):
+        """Return the (dateFrom, dateTo) UTC range covering the local days first_day to last_day."""
+        # "DateFrom":"2024-03-31T22:00:00.000Z", "DateTo":"2024-04-02T21:59:59.999Z",  <- sommertid
+        # "DateFrom":"2024-10-27T23:00:00.000Z", "DateTo":"2024-10-28T22:59:59.999Z"   <- vintertid
+        dateFrom = self._utc_to_isostr(self._local_to_utc(first_day))
+        dateTo = self._utc_to_isostr(
+            self._local_to_utc(
+                last_day.replace(hour=23, minute=59, second=59, microsecond=0)
+            )
+        )
+        return dateFrom, dateTo
+
+    def _split_window(self, first_day, last_day):
+        """Split a window of days in two halves."""
+        middle = first_day + (last_day - first_day) / 2
+        middle = middle.replace(hour=0, minute=0, second=0, microsecond=0)
+        return (first_day, middle), (middle + timedelta(days=1), last_day)
+
+    def _is_truncated(self, series, first_day, last_day):
+        """Check if the API returned less data than asked for in a multi-day window.
+        An empty window is not truncated - there is simply no data.
+        """
+        if first_day == last_day or not series["Data"]:
+            return False
+        return series["Data"][-1].date_from[:10] < last_day.strftime("%Y-%m-%d")
+
+    def _empty_timeseries(self, metering_device):
+        """Time series without data, standing in for a metering device which could not be retrieved."""
+        return {
+            "type": metering_device.type,
+            "Data": [],
+            "Extra": PeriodSummary(None, None, None, None, ""),
+        }
+
+    def _meter_results(self, metering_devices, results):
+        """Check the per meter results of a concurrent retrieval.
+
+        A meter failing with HTTPFailed does not discard the data of the other meters - its
+        result is replaced by None.  Only if all meters fail the error is raised.
+        """
+        checked = []
+        for metering_device, outcome in zip(metering_devices, results):
+            if isinstance(outcome, HTTPFailed):
+                _LOGGER.error(
+                    "Retrieving data for %s meter %s failed: %s",
+                    metering_device.type,
+                    metering_device.measurement_point_id,
+                    outcome,
+                )
+                outcome = None
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            checked.append(outcome)
+        if metering_devices and all(outcome is None for outcome in checked):
+            raise HTTPFailed("Retrieving data failed for all meters") from results[0]
+        return checked
+
+    def _store_window_results(self, metering_devices, results, failed):
+        """Store the per meter results of one window.
+
+        failed holds the indexes of meters which failed in an earlier window.  Their later
+        windows are dropped to keep the stored data without gaps.
+        """
+        for idx, parts in enumerate(self._meter_results(metering_devices, results)):
+            if parts is None:
+                failed.add(idx)
+            elif idx not in failed:
+                self._store_statistics([parts])
+
+    def _statistics_deferred(self, first_day, err):
+        """Log that the statistics fetch ended early at the window starting at first_day."""
+        self.statistics_pending = True
+        _LOGGER.warning(
+            "Statistics fetch stopped at %s: %s.  The remaining days are retrieved on the next update",
+            first_day.date(),
+            err,
+        )
+
+    def _statistics_since(self, from_date):
+        """Return the readings of each meter type from the first day of from_date on."""
+        start = from_date.replace(
+            hour=0, minute=0, second=0, microsecond=0, tzinfo=self.tz
+        )
+        return {
+            meter_type: series.between(start)
+            for meter_type, series in self._meter_data.items()
+        }
+
+    def _store_statistics(self, time_series):
+        """Add fetched windows of time series (a list of parts per meter) to the meter data."""
+        for parts in time_series:
+            for series in parts:
+                meter_type = series["type"]
+                if series["Data"]:
+                    # If the dataset returned is not empty extend dataset
+                    self._meter_data[meter_type].extend_rows(series["Data"])
+                    self._meter_data_extra[meter_type].append(series["Extra"])
+
+    def _hourly_start(self, from_date):
+        """Return the day from which get_statistics retrieves hourly data - hourly_days days back at most."""
+        if self._hourly_days is None:
+            return from_date
+        start = (datetime.now() - timedelta(days=self._hourly_days)).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        return max(from_date, start)
+
+    def start_backfill(self, meter_type, from_date):
+        """
+        Start the backfill checkpoint of a meter type with the windows get_statistics
+        retrieves from from_date - the daily summaries before hourly_days included.
+        """
+        self.backfill.start(meter_type, self._statistics_windows(from_date))
+
+    def _day_summaries_stopped(self, first_day, err, required):
+        """
+        Log that the daily summaries were retrieved until the window starting at first_day.
+        Returns False.  The days get_statistics requires are left for the next call.
+        """
+        if required:
+            self._statistics_deferred(first_day, err)
+        else:
+            _LOGGER.info(
+                "Daily summaries from %s not retrieved: %s", first_day.date(), err
+            )
+        return False
+
+    def _day_summaries_start(self):
+        """Return the first local day of the hourly data kept, as naive datetime - None without data."""
+        firsts = [
+            series.timestamps[0] for series in self._meter_data.values() if series
+        ]
+        if not firsts:
+            return None
+        return datetime.fromtimestamp(min(firsts), self.tz).replace(tzinfo=None)
+
+    def _store_day_summaries(self, time_series):
+        """Keep the final daily sums of Day zoom time series.  Days past the retention are dropped."""
+        for series in time_series:
+            if series is None:
+                continue
+            day_sums = self._day_sums.setdefault(series["type"], {})
+            for row in series["Data"][: series["Extra"].complete_rows]:
+                day_sums[date.fromisoformat(row.date_from[:10])] = row.value
+        for day_sums in self._day_sums.values():
+            if day_sums:
+                oldest = max(day_sums) - timedelta(seconds=self._retention)
+                for day in [day for day in day_sums if day < oldest]:
+                    del day_sums[day]
+
+    def _log_statistics(self):
+        # Debug output only - skip walking every hourly row unless it is going to be logged
+        if not _LOGGER.isEnabledFor(logging.DEBUG):
+            return
+        _LOGGER.debug("Statistics data:\n%s", self._meter_data)
+        _LOGGER.debug("Statistics extra_data:\n%s", self._meter_data_extra)
+        for key, series_type in self._meter_data.items():
+            for date_from, value in series_type.iter_local():
+                _LOGGER.debug("%s - %s", date_from, value)
+        for key, series_type in self._meter_data_extra.items():
+            for extra_data in series_type:
+                _LOGGER.debug(
+                    "Sum/Avg/Min/Max: %s / %s / %s / %s | %s",
+                    extra_data.sum,
+                    extra_data.avg,
+                    extra_data.min,
+                    extra_data.max,
+                    extra_data.last_valid_date,
+                )
+
+    def _year_range(self):
+        """Return the (dateFrom, dateTo) range of the current year in UTC."""
+        # Calculate date range to process - clean time settings too
+        from_date_input = datetime.now().replace(
+            month=1, day=1, hour=0, minute=0, second=0, microsecond=0
+        )
+        end_date_input = datetime.now().replace(
+            month=12, day=31, hour=23, minute=59, second=59, microsecond=0
+        )
+        dateFrom = self._utc_to_isostr(self._local_to_utc(from_date_input))
+        dateTo = self._utc_to_isostr(self._local_to_utc(end_date_input))
+
+        _LOGGER.debug(
+            "Statistics year range to fetch: %s-%s", from_date_input, end_date_input
+        )
+        return dateFrom, dateTo
+
+    def _build_year_data(self, time_series):
+        """Key the fetched year time series by meter type.
+
+        The time series may be entries of the response cache - they are copied, not changed.
+        """
+        meter_year_data = {}
+        for series in time_series:
+            type = series["type"]
+            meter_year_data[type] = {
+                key: value for key, value in series.items() if key != "type"
+            }
+
+            if self._last_valid_day:
+                meter_year_data[type]["LastValidDate"] = self._last_valid_day
+
+            if series["Data"]:
+                _LOGGER.debug("Year Total for %s: %s", type, series)
+                _LOGGER.debug("%s", LazyJson(time_series))
+            else:
+                _LOGGER.warning(
+                    "The KMD API returned no yearly data.  Expect sensors to signal 'unavailable'"
+                )
+        return meter_year_data
+
+    def group_by_day(self, meter_type):
+        """
+        Groups the input data into buckets of the hourly measurements per local day.
+
+        Args:
+            meter_type: A string water, heating designating which data series to group
+
+        Returns:
+            A list of RollupRows (date, sum, change, min, max, mean) per day with a measurement
+            for each of its wall-clock hours - 23 on the day DST starts, 24 otherwise.
+            date is in the format "YYYY-MM-DD".
+            sum = sum of consumption for all hours of the day
+            change = change of sum since yesterday
+            min = min of the sums of the day and yesterday
+            max = max of the sums of the day and yesterday
+            mean = mean of the sums of the day and yesterday
+        """
+        return self.get_rollups(meter_type, ("day",))["day"]
+
+    def get_grouped_statistics(self, meter_type: str, grouping: str):
+        """
+        Groups daily statistics into specified time intervals (daily, weekly, monthly, yearly).
+
+        Args:
+            meter_type: A string water, heating designating which data series to group
+            grouping: String specifying the grouping interval ('day', 'week', 'month', 'year')
+
+        Returns:
+            A list of RollupRows, where each row represents statistics for the given grouing:
+            (grouping_start_date, grouping_sum, grouping_change, grouping_min_sum, grouping_max_sum, grouping_mean_sum)
+        """
+        return self.get_rollups(meter_type, (grouping,))[grouping]
+
+    def get_rollups(self, meter_type: str, groupings=GROUPINGS):
+        """
+        Group the hourly data of a meter type into several groupings at once.
+
+        The hourly data is walked a single time for all groupings.  Days summarised by the
+        API, see get_day_summaries, take the server's sum - only the hours of the other days
+        are summed.  Returns a dictionary with the list of RollupRows per grouping, see
+        get_grouped_statistics.
+        """
+        rollups = rollup(
+            self._meter_data[meter_type], groupings, self._day_sums.get(meter_type)
+        )
+        _LOGGER.debug("Grouped stats: %s", rollups)
+        return rollups
+
+    def update_rollups(self, meter_type: str):
+        """
+        Fold the hourly data of a meter type into the kept rollup state.
+
+        Only the days since the last update are summed.  Returns the RollupRows of the
+        buckets touched, per grouping, see get_grouped_statistics.
+        """
+        rollups = self.rollups.update(
+            meter_type, self._meter_data[meter_type], self._day_sums.get(meter_type)
+        )
+        _LOGGER.debug("Updated grouped stats: %s", rollups)
+        return rollups
+
+    def get_dummy_data(self):
+        return {"water": [{"DateFrom": None, "Value": None}]}
+
+
+class Novafos(NovafosBase):
+    """
+    Primary exported interface for KMD API wrapper.
+
+    Blocking implementation based on requests.  See AsyncNovafos for the asyncio twin.
+    """
+
+    def __init__(
+        self,
+        timezone,
+        pool_size=4,
+        window_days=DEFAULT_WINDOW_DAYS,
+        retry_policy: RetryPolicy | None = None,
+        trace_responses=0,
+        retention_days=DEFAULT_RETENTION_DAYS,
+        hourly_days=None,
+        metadata_ttl=DEFAULT_METADATA_TTL,
+    ):
+        super().__init__(
+            timezone,
+            window_days,
+            retry_policy,
+            trace_responses,
+            retention_days,
+            hourly_days,
+            metadata_ttl,
+        )
+
+        # One pooled keep-alive session for all API calls.  This saves a TCP+TLS handshake
+        # per request, which dominates the wall time of a long backfill.
+        self._session = requests.Session()
+        adapter = TimeoutHTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("https://", adapter)
+        self._pool_size = pool_size
+
+    def _update_session_headers(self):
+        """Keep the default headers of the shared session in sync with the credentials."""
+        for key in ("Customer-Id", "Customer-Number", "Authorization"):
+            self._session.headers.pop(key, None)
+        self._session.headers.update(self._api_headers())
+
+    def close(self):
+        """Close the pooled HTTP session and release its connections."""
+        self._session.close()
+
+    def authenticate_using_access_token(self, access_token, access_token_date_updated):
+        """The only reason for this function is due to to a reCAPTCHA challenge on the Novafos login page.
+        The date is used to verify the token is not too old when getting data.
+        """
+        if not self._set_access_token(access_token, access_token_date_updated):
+            return False
+        if self._metadata_current():
+            return True
+
+        # Configure other data necessary for fetching data
         try:
-            response = requests.get(url, headers=headers)
-        except requests.exceptions.RequestException as req_err:
-            _LOGGER.error("Request error occurred while retrieving customer id: %s", req_err)
-            # Network or other request-level error
-            raise HTTPFailed from req_err
+            self._get_customer_id()
+            self._get_active_meters()
+            self._metadata_updated()
+            return True
+        except LoginFailed as lf:
+            _LOGGER.error("Login failed during authenticate_using_access_token: %s", lf)
+            return False
+        except HTTPFailed as hf:
+            _LOGGER.error("HTTP failure during authenticate_using_access_token: %s", hf)
+            return False
 
+    def _raise_for_status(self, response, context):
+        """Raise LoginFailed or HTTPFailed if the API did not accept the request."""
         # Handle HTTP status codes explicitly: 401/403 indicate invalid/expired token
         if response.status_code in (401, 403):
             _LOGGER.error(
-                "Authentication failed when retrieving customer id: %s %s",
+                "Authentication failed when %s: %s %s",
+                context,
                 response.status_code,
                 response.text,
             )
+            self._authentication_failed()
             raise LoginFailed("Invalid or expired access token")
+        if response.status_code == 429:
+            raise RateLimited(parse_retry_after(response.headers.get("Retry-After")))
+        if response.status_code in RETRY_STATUS:
+            _LOGGER.warning(
+                "HTTP error occurred while %s: %s", context, response.status_code
+            )
+            raise Unavailable(f"HTTP {response.status_code} while {context}")
 
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_err:
-            _LOGGER.error("HTTP error occurred while retrieving customer id: %s", http_err)
+            _LOGGER.error("HTTP error occurred while %s: %s", context, http_err)
             raise HTTPFailed from http_err
-        # response = requests.get(url, headers=headers)
+
+    def _read_timeseries(self, response):
+        """Parse a streamed consumptionTimeSeries response chunk by chunk."""
+        parser, series_data = self._timeseries_parser()
+        # Only hold on to the body if it is traced
+        body = [] if self.trace.enabled else None
+        try:
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                if body is not None:
+                    body.append(chunk)
+                parser.feed(chunk)
+            parser.close()
+        except ValueError as parse_err:
+            raise self._unreadable(parse_err) from parse_err
+        finally:
+            if body is not None:
+                self.trace.record(
+                    "POST", response.url, response.status_code, b"".join(body)
+                )
+        return parser, series_data
+
+    def _send(self, method, url, context, read=None, **kwargs):
+        """Send a single request to the API.  Returns the response if it was accepted.
+
+        If read is given, the request is streamed and read(response) is returned instead.
+        """
+        self._check_deadline()
+        if self._deadline is not None:
+            # End the request by the deadline
+            kwargs.setdefault(
+                "timeout",
+                (CONNECT_TIMEOUT, min(READ_TIMEOUT, self._deadline.remaining())),
+            )
+        if read is not None:
+            kwargs["stream"] = True
+        try:
+            response = getattr(self._session, method)(url, **kwargs)
+            # Streamed bodies are traced while they are read
+            if self.trace.enabled and (read is None or response.status_code >= 400):
+                self.trace.record(
+                    method.upper(), url, response.status_code, response.content
+                )
+            try:
+                self._raise_for_status(response, context)
+                if read is None:
+                    return response
+                return read(response)
+            finally:
+                if read is not None:
+                    # Hand the connection back to the pool
+                    response.close()
+        except requests.exceptions.RequestException as req_err:
+            _LOGGER.warning("Request error occurred while %s: %s", context, req_err)
+            # Network or other request-level error
+            raise Unavailable(f"Request error while {context}") from req_err
+
+    def _request(self, method, url, context, **kwargs):
+        """Send a request to the API, retrying transient failures with backoff.
+
+        method is the name of the session method ("get", "post").  Returns the accepted
+        response - or what read returns, see _send.  Raises LoginFailed, HTTPFailed or -
+        for transient failures persisting through all retries - Unavailable.
+        """
+        trial = self._check_circuit()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    response = self._send(method, url, context, **kwargs)
+                except Unavailable as err:
+                    delay = self._retry_delay(err, attempt)
+                    if delay is None:
+                        self._circuit.record_failure()
+                        raise
+                    # No time left to wait for the retry
+                    self._check_deadline(delay)
+                    attempt += 1
+                    _LOGGER.debug("Retrying %s in %.1fs: %s", context, delay, err)
+                    time.sleep(delay)
+                    continue
+                self._circuit.record_success()
+                return response
+        except BaseException:
+            # Neither a success nor a failure of the API, e.g. rejected or past the
+            # deadline - the next request may be the trial of the half-open circuit
+            if trial:
+                self._circuit.release_trial()
+            raise
+
+    def _get_customer_id(self):
+        # Need to retrieve the customer ID from the user profile to fetch data.
+        # Only the Authorization header applies here - drop the customer headers of the session.
+        headers = {
+            "Customer-Id": None,
+            "Customer-Number": None,
+        }
+
+        url = f"{self._api_url}/api/profile/get"
+
+        response = self._request("get", url, "retrieving customer id", headers=headers)
         # self._print_json(response.json(), "Retrieved customer ID JSON response")
         # Parse and validate JSON payload
         try:
             resp_json = response.json()
-            self._customer_id = f"{resp_json['Customers'][0]['Id']}"
-            self._customer_number = f"{resp_json['Customers'][0]['Number']}"
         except Exception as json_err:
             _LOGGER.error("Failed to parse customer id response: %s", json_err)
             raise HTTPFailed from json_err
-        _LOGGER.debug(
-            "Retrieved customer_id, number: %s, %s",
-            self._customer_id,
-            self._customer_number,
-        )
+        self._parse_customer_profile(resp_json)
 
     def _get_active_meters(self):
         """
@@ -173,50 +1082,15 @@ class Novafos:
                     }]
         }]
         """
-        headers = {
-            "Customer-Id": self._customer_id,
-            "Customer-Number": self._customer_number,
-            "Authorization": self._access_token,
-        }
-
         data = {"IncludeUnits": "true"}
 
         url = f"{self._api_url}/api/meter/customerActiveMeters"
 
-        response = requests.post(url, data=data, headers=headers)
+        response = self._request("post", url, "retrieving active meters", data=data)
         # NOTE: Failure may happen right here whenever the API is updated with new headers and what not.
         # self._print_json(response.json(), "Get active meters response")
 
-        response_json = response.json()
-        self._active_meters = []
-        for meter in response_json:
-            """ Pick up active water measuring meters """
-            if meter["IsActive"] and meter["ConsumptionTypeId"] == 6:
-                # Water type
-                active = {
-                    "type": "water",
-                    "InstallationId": meter["InstallationId"],
-                    "MeasurementPointId": meter["MeasurementPointId"],
-                    "Unit": meter["Units"][0],
-                }
-                self._meter_data["water"] = []
-                self._meter_data_extra["water"] = []
-                self._active_meters.append(active)
-            if meter["IsActive"] and meter["ConsumptionTypeId"] == 5:
-                # Heating type
-                active = {
-                    "type": "heating",
-                    "InstallationId": meter["InstallationId"],
-                    "MeasurementPointId": meter["MeasurementPointId"],
-                    "Unit": meter["Units"][0],
-                }
-                self._meter_data["heating"] = []
-                self._meter_data_extra["heating"] = []
-                self._active_meters.append(active)
-        _LOGGER.debug("Got active (water/heating) meters : %s", self._active_meters)
-
-    def get_meter_types(self):
-        return self._active_meters
+        self._parse_active_meters(response.json())
 
     def get_available_time_series_periods(self) -> datetime:
         """Get data from the API about which time series periods are available for the active meters.
@@ -239,24 +1113,9 @@ class Novafos:
           }
         ]
         """
-        headers = {
-            "Customer-Id": self._customer_id,
-            "Customer-Number": self._customer_number,
-            "Authorization": self._access_token,
-        }
         url = f"{self._api_url}/api/consumption/availableTimeSeriesPeriods"
-        response = requests.get(url, headers=headers)
-        result_json = response.json()
-
-        # Enable logging DEBUG to see all returned data from the API:
-        self._print_json(
-            result_json, "Retrieved available timeseries periods JSON response"
-        )
-
-        # Entry with RangeType 0 is for the specific meter, and is the one we care about.  It has the actual earliest date of data available.
-        self._earliest_data_date = datetime.fromisoformat(result_json[0]["MinDate"])
-        # self._earliest_data_date = self._local_str_to_utc(result_json[0]["MinDate"])
-        return self._earliest_data_date
+        response = self._request("get", url, "retrieving available periods")
+        return self._parse_available_periods(response.json())
 
     def _get_consumption_timeseries(
         self, metering_device, dateFrom, dateTo, zoomLevel=0
@@ -338,465 +1197,225 @@ class Novafos:
             ...
         ]
         """
-        headers = {
-            "Customer-Id": self._customer_id,
-            "Customer-Number": self._customer_number,
-            "Authorization": self._access_token,
-        }
+        data = self._consumption_request_data(
+            metering_device, dateFrom, dateTo, zoomLevel
+        )
 
-        # Setup query parameters for the API.
-        # Necessary fields are installation relevant properties and the date/zoom range.
-        data = {
-            "InstallationId": metering_device["InstallationId"],
-            "MeasurementPointId": metering_device["MeasurementPointId"],
-            "Unit": metering_device["Unit"],
-            "ZoomLevel": zoomLevel,
-            "PriceData": "false",  # optional
-            "Interval": "PT1H",
-            "DateFrom": dateFrom,
-            "DateTo": dateTo,
-        }
+        key = self.response_cache.key(metering_device, zoomLevel, dateFrom, dateTo)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached
 
         url = f"{self._api_url}/api/consumption/consumptionTimeSeries"
 
-        response = requests.post(url, json=data, headers=headers)
-        result_json = response.json()
-
-        # Enable logging DEBUG to see all returned data from the API:
-        self._print_json(result_json, "Retrieved timeseries JSON response")
-
-        # Create dataset - only the first data series - no idea what would return more than one.
-        series_data = []
-        last_valid_date = ""
-        if result_json["Series"]:
-            for data in result_json["Series"][0]["Data"]:
-                # Add data - complete or not!
-                series_data.append(
-                    {"DateFrom": data["DateFrom"], "Value": data["Value"]}
-                )
-                # NOTE: Assuming data is sorted by date - which it is
-                last_valid_date = data["DateTo"]
+        # The response is parsed while it streams in
+        parsed = self._request(
+            "post",
+            url,
+            "retrieving time series",
+            read=self._read_timeseries,
+            json=data,
+        )
+        return self._cache_timeseries(key, metering_device, dateFrom, dateTo, parsed)
 
-        # Return first data series.  Unknown how more series could come from a single metering device?
-        meter_data = {
-            "type": metering_device["type"],
-            "Data": series_data,
-            "Extra": {
-                "Sum": result_json["Total"]["Value"],
-                "Avg": result_json["Average"]["Value"],
-                "Max": result_json["Maximum"]["Value"],
-                "Min": result_json["Minimum"]["Value"],
-                "LastValidDate": last_valid_date,
-            },
-        }
-        _LOGGER.debug(f"Retrieved data from API: {meter_data}")
-        return meter_data
+    def _map_meters(self, func, metering_devices, *args):
+        """Call func(metering_device, *args) for the metering devices concurrently, with at most
+        pool_size requests in flight.  Returns the results - or the raised HTTPFailed - in meter order.
+        """
+        if not metering_devices:
+            return []
+        with ThreadPoolExecutor(
+            max_workers=min(self._pool_size, len(metering_devices))
+        ) as executor:
+            # The worker threads run in a copy of the context - the deadline applies there too
+            futures = [
+                executor.submit(copy_context().run, func, metering_device, *args)
+                for metering_device in metering_devices
+            ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except HTTPFailed as err:
+                results.append(err)
+        return results
 
     def _get_all_consumption_timeseries(self, dateFrom, dateTo, zoomLevel=0):
         """Retrieve data from all active metering devices"""
-        meter_data = []
-        for active_meter in self._active_meters:
-            meter_data.append(
-                self._get_consumption_timeseries(
-                    active_meter, dateFrom, dateTo, zoomLevel
-                )
-            )
-        return meter_data
-
-    def _local_to_utc(self, local_time):
-        """Convert a local time to UTC time including timezone and summer(DST)/winter time offsets."""
-        return local_time.astimezone(ZoneInfo("UTC"))
-        # TODO: Find out what is going on here.  If the system time is UTC, the lines below does what is correct.
-        #       If the system time is CET or Europe/Copenhagen, the line above works.
-        #
-        #
-        # local_time_with_timezone = local_time.astimezone(self.tz)
-        # utc_offset = local_time_with_timezone.utcoffset()
-        # return local_time.astimezone(ZoneInfo("UTC")) - utc_offset
-
-    def _local_str_to_utc_str(self, local_time_str):
-        """Convert a local ISO time string to UTC time strimg."""
-        return self._utc_to_isostr(
-            self._local_to_utc(datetime.fromisoformat(local_time_str))
+        results = self._meter_results(
+            self._active_meters,
+            self._map_meters(
+                self._get_consumption_timeseries,
+                self._active_meters,
+                dateFrom,
+                dateTo,
+                zoomLevel,
+            ),
         )
+        return [
+            self._empty_timeseries(active_meter) if timeseries is None else timeseries
+            for active_meter, timeseries in zip(self._active_meters, results)
+        ]
 
-    def _local_str_to_utc(self, local_time_str):
-        """Convert a local ISO time string to UTC time strimg."""
-        return self._local_to_utc(datetime.fromisoformat(local_time_str))
-
-    def _utc_to_isostr(self, utc_time):
-        return utc_time.isoformat().replace("+00:00", "Z")
+    def _get_window_timeseries(self, metering_device, first_day, last_day):
+        """Retrieve hourly data for a window of days for a single metering device.
 
-    def get_statistics(self, from_date=None) -> dict:
+        If the API rejects or truncates the window it is split in two halves which are
+        retrieved separately.  Returns the list of retrieved parts in chronological order.
+        """
+        dateFrom, dateTo = self._window_range(first_day, last_day)
+        try:
+            series = self._get_consumption_timeseries(
+                metering_device, dateFrom, dateTo, self._zoom_level["Hour"]
+            )
+            if not self._is_truncated(series, first_day, last_day):
+                return [series]
+            _LOGGER.debug("Window %s to %s was truncated", dateFrom, dateTo)
+        except (Unavailable, DeadlineExceeded):
+            # A smaller window will not help
+            raise
+        except HTTPFailed:
+            if first_day == last_day:
+                raise
+            _LOGGER.debug("Window %s to %s was rejected", dateFrom, dateTo)
+
+        left, right = self._split_window(first_day, last_day)
+        return self._get_window_timeseries(
+            metering_device, *left
+        ) + self._get_window_timeseries(metering_device, *right)
+
+    def get_statistics(self, from_date=None, deadline: Deadline | None = None) -> dict:
         """
         Retrieve statistics based on hourly data resolution from the API.
+        Days are retrieved window_days at a time and merged into the meter data - hours
+        retrieved before are replaced.  The readings from the first day of from_date on are returned.
+        With hourly_days set, only the latest hourly_days days are retrieved hourly.  The days
+        before are retrieved as daily summaries, see get_day_summaries, which is 24 times fewer rows.
+        The hours are only retrieved once all of these days are.
+        If the API fails part way, the days retrieved until then are returned and the rest
+        is left for the next call.  The same goes for the days not retrieved by the deadline.
+        statistics_pending tells if days were left.
 
         from_date is a datetime object with the date in local time from which to start retrieving data.  All days until present day will be retrieved.
         """
+        self.statistics_pending = False
         if from_date is None:
             # If no date, just return - no default behaviour
             return {}
 
-        # Calculate date range to process - clean time settings too
-        from_date_input = from_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_date_input = datetime.now().replace(
-            hour=23, minute=59, second=59, microsecond=0
-        )
-        days_back = (end_date_input - from_date_input).days
-        duration = range(days_back)
-        _LOGGER.debug(
-            f"Statistics range to fetch: {from_date_input}-{end_date_input} | {days_back} day(s)"
-        )
-
-        first_day = [True] * len(self._meter_data)
-        for day in duration:
-            # "DateFrom":"2024-03-31T22:00:00.000Z", "DateTo":"2024-04-02T21:59:59.999Z",  <- sommertid
-            # "DateFrom":"2024-10-27T23:00:00.000Z", "DateTo":"2024-10-28T22:59:59.999Z"   <- vintertid
-            now = from_date_input + timedelta(days=day)
-            dateFrom = self._utc_to_isostr(self._local_to_utc(now))
-            dateTo = self._utc_to_isostr(
-                self._local_to_utc(
-                    now.replace(hour=23, minute=59, second=59, microsecond=0)
-                )
-            )
-            _LOGGER.info(
-                f"Statistics fetch {days_back - day} day(s) back ({dateFrom} to {dateTo})"
-            )
-
-            time_series = self._get_all_consumption_timeseries(
-                dateFrom=dateFrom, dateTo=dateTo, zoomLevel=self._zoom_level["Hour"]
-            )
-
-            for idx, series in enumerate(time_series):
-                if first_day[idx]:
-                    meter_type = series.pop("type")
-                    first_day[idx] = False
-                if series["Data"]:
-                    # If the dataset returned is not empty extend dataset
-                    self._meter_data[meter_type].extend(series["Data"])
-                    self._meter_data_extra[meter_type].append(series["Extra"])
-
-                # _LOGGER.debug(json.dumps(time_series, sort_keys = False, indent = 4))
-        # Debug output only:
-        _LOGGER.debug(f"Statistics data:\n{self._meter_data}")
-        _LOGGER.debug(f"Statistics extra_data:\n{self._meter_data_extra}")
-        for key, series_type in self._meter_data.items():
-            for hour_data in series_type:
-                _LOGGER.debug(f"{hour_data['DateFrom']} - {hour_data['Value']}")
-        for key, series_type in self._meter_data_extra.items():
-            for extra_data in series_type:
-                _LOGGER.debug(
-                    f"Sum/Avg/Min/Max: {extra_data['Sum']} / {extra_data['Avg']} / {extra_data['Min']} / {extra_data['Max']} | {extra_data['LastValidDate']}"
-                )
+        with self._deadline_scope(deadline):
+            hourly_from = self._hourly_start(from_date)
+            # The hours are only retrieved once the days before them are - no gap is
+            # left in the rollups
+            if hourly_from <= from_date or self._get_day_summaries(
+                from_date, hourly_from - timedelta(days=1), required=True
+            ):
+                self._get_statistics(hourly_from)
 
         # Data structure returned:
-        #  { 'water': [{'DateFrom: <date>, 'Value': <float>}, ...],
-        #    'heating': [{'DateFrom: <date>, 'Value': <float>}, ...],}
-        return self._meter_data
+        #  { 'water': HourlySeries,
+        #    'heating': HourlySeries }
+        return self._statistics_since(from_date)
+
+    def _get_statistics(self, from_date):
+        active_meters = list(self._active_meters)
+        for n, (first_day, last_day) in enumerate(self._statistics_windows(from_date)):
+            if self._deadline_expired():
+                self._statistics_deferred(first_day, "deadline passed")
+                break
+            _LOGGER.info(f"Statistics fetch {first_day.date()} to {last_day.date()}")
 
-    def get_year_data(self):
+            try:
+                results = self._meter_results(
+                    active_meters,
+                    self._map_meters(
+                        self._get_window_timeseries, active_meters, first_day, last_day
+                    ),
+                )
+            except HTTPFailed as err:
+                if n == 0 and not self._deadline_expired():
+                    raise
+                # Keep the days retrieved so far
+                self._statistics_deferred(first_day, err)
+                break
+            self._store_statistics(parts for parts in results if parts is not None)
+            # Stop fetching for a failed meter to keep its data without gaps
+            active_meters = [
+                active_meter
+                for active_meter, parts in zip(active_meters, results)
+                if parts is not None
+            ]
+        self._log_statistics()
+
+    def get_day_summaries(self, from_date=None, deadline: Deadline | None = None):
         """
-        Retrieve statistics for the full year from the API.
+        Retrieve the daily sums summarised by the API (Day zoom) from the first day of from_date on.
 
-        from_date is a datetime object with the date in local time from which to start retrieving data.  All days until present day will be retrieved.
+        The days flagged complete are kept and used by the rollups instead of the sums of
+        their hours.  The days are retrieved in the windows of get_statistics.  No from_date
+        means from the first day of the hourly data kept.  The summaries are optional - if
+        the API fails, or the deadline passes, the rollups sum the hours of the days left.
 
-        Returns:
-          { 'type': 'water',
-            'Data': [{'DateFrom': '2025-01-01T00:00:00', 'Value': 6.288}],
-            'Extra': {
-               'Sum': 6.288, 'Avg': 0.0, 'Max': 0.0, 'Min': 0.0, 'LastValidDate': '2025-12-31T23:59:59'
-            }
-          }
+        Returns the kept sums: { 'water': {date: float}, 'heating': {date: float} }
         """
-        # Calculate date range to process - clean time settings too
-        from_date_input = datetime.now().replace(
-            month=1, day=1, hour=0, minute=0, second=0, microsecond=0
-        )
-        end_date_input = datetime.now().replace(
-            month=12, day=31, hour=23, minute=59, second=59, microsecond=0
-        )
-        dateFrom = self._utc_to_isostr(self._local_to_utc(from_date_input))
-        dateTo = self._utc_to_isostr(self._local_to_utc(end_date_input))
-
-        _LOGGER.debug(
-            f"Statistics year range to fetch: {from_date_input}-{end_date_input}"
-        )
-
-        time_series = self._get_all_consumption_timeseries(
-            dateFrom=dateFrom, dateTo=dateTo, zoomLevel=self._zoom_level["Year"]
-        )
-
-        meter_year_data = {}
-        for series in time_series:
-            type = series.pop("type")
-            meter_year_data[type] = series
-
-            if self._last_valid_day:
-                meter_year_data[type]["LastValidDate"] = self._last_valid_day
-
-            if series["Data"]:
-                _LOGGER.debug(f"Year Total for {type}: {series}")
-                _LOGGER.debug(json.dumps(time_series, sort_keys=False, indent=4))
-            else:
-                _LOGGER.warning(
-                    "The KMD API returned no yearly data.  Expect sensors to signal 'unavailable'"
-                )
-        return meter_year_data
+        if from_date is None:
+            from_date = self._day_summaries_start()
+        if from_date is not None:
+            with self._deadline_scope(deadline):
+                self._get_day_summaries(from_date)
+        return self._day_sums
 
-    def group_by_day(self, meter_type):
+    def _get_day_summaries(self, from_date, until=None, required=False):
         """
-        Groups the input data into buckets of 24 hourly measurements per day.
-
-        Args:
-            meter_type: A string water, heating designating which data series to group
-            prev_day_data: A data structure ('2024-01-02', 0.67, 0.502, 0.168, 0.67, 0.419)
-                with the possible last statistic data
+        Retrieve the daily sums from from_date until the day of until.  Returns True if all
+        days were retrieved for all meters.
 
-        Returns:
-            A dictionary where keys are dates in the format "YYYY-MM-DD"
-            and values are lists of tuples representing hourly measurements
-            for that day.
-            The returned data is (date, sum, change, min, max, mean)
-            sum = sum of consumption for all 24 hours
-            change = change of sum since yesterday
-            min = min value of the hourly data
-            max = max value of the hourly data
-            mean = mean value of the hourly data
-        """
-        daily_data = {}
-        daily_stats = []
-        daily_sums = []
-
-        for item in self._meter_data[meter_type]:
-            # _LOGGER.debug(item)
-            date_str = item["DateFrom"]
-            measurement = item["Value"]
-            # date = self._local_str_to_utc(date_str)
-            date = datetime.fromisoformat(date_str)
-            date_key = date.strftime("%Y-%m-%d")  # Format date as "YYYY-MM-DD"
-            if date_key not in daily_data:
-                daily_data[date_key] = []
-            daily_data[date_key].append((date_str, measurement))
-
-        # _LOGGER.debug(sorted(daily_data.items()))
-
-        for date, hourly_data in sorted(daily_data.items()):
-            if len(hourly_data) == 24:  # Ensure 24 hourly measurements
-                daily_sum = round(sum(measurement for _, measurement in hourly_data), 3)
-                daily_sums.append((date, daily_sum))
-                # _LOGGER.debug(daily_sums[-1])
-
-        # Handle the first day
-        curr_date, curr_sum = daily_sums[0]
-        curr_sum = round(curr_sum, 3)
-        daily_stats.append(
-            (
-                curr_date,
-                curr_sum,  # sum
-                curr_sum,  # change
-                curr_sum,  # min
-                curr_sum,  # max
-                curr_sum,  # mean
-            )
-        )
-
-        if len(daily_sums) > 1:
-            for i in range(1, len(daily_sums)):  # Iterate from the second day onwards
-                prev_date, prev_sum = daily_sums[i - 1]
-                curr_date, curr_sum = daily_sums[i]
-                daily_stats.append(
-                    (
-                        curr_date,
-                        round(curr_sum, 3),
-                        round(
-                            curr_sum - prev_sum, 3
-                        ),  # Calculate change for the current day
-                        min(curr_sum, prev_sum),
-                        max(curr_sum, prev_sum),
-                        round((curr_sum + prev_sum) / 2, 3),
-                    )
+        required is set for the days get_statistics does not retrieve hourly - days left
+        by a failure or the deadline set statistics_pending.
+        """
+        active_meters = list(self._active_meters)
+        for first_day, last_day in self._statistics_windows(from_date, until):
+            if self._deadline_expired():
+                return self._day_summaries_stopped(
+                    first_day, "deadline passed", required
                 )
+            dateFrom, dateTo = self._window_range(first_day, last_day)
+            try:
+                results = self._meter_results(
+                    active_meters,
+                    self._map_meters(
+                        self._get_consumption_timeseries,
+                        active_meters,
+                        dateFrom,
+                        dateTo,
+                        self._zoom_level["Day"],
+                    ),
+                )
+            except HTTPFailed as err:
+                return self._day_summaries_stopped(first_day, err, required)
+            self._store_day_summaries(results)
+            if required and None in results:
+                # Stop for all meters to keep the days without gaps
+                return self._day_summaries_stopped(
+                    first_day, "a meter failed", required
+                )
+        return True
 
-        # _LOGGER.debug(f"Daily stats: {daily_stats}")
-        return daily_stats
-
-        # Code to calculate max min mean for the underlying hourly dataset.
-        # This is what the webinterface does.  It does not however maintain the
-        # magnitude of the data, but that of the underlying dataset.
-        #
-        # for date, hourly_data in sorted(daily_data.items()):
-        #     if len(hourly_data) == 24:  # Ensure 24 hourly measurements
-        #         daily_sum = round(sum(measurement for _, measurement in hourly_data),3)
-        #         min_val = round(min(measurement for _, measurement in hourly_data), 3)
-        #         max_val = round(max(measurement for _, measurement in hourly_data), 3)
-        #         mean_val = round(daily_sum / 24, 3)
-        #         daily_sums.append((date, daily_sum, max_val, min_val, mean_val))
-        #         #_LOGGER.debug(daily_sums[-1])
-
-        # # Handle the first day
-        # curr_date, curr_sum, curr_max, curr_min, curr_mean = daily_sums[0]
-        # daily_stats.append((
-        #     curr_date,
-        #     curr_sum,
-        #     curr_sum, #change
-        #     curr_min,
-        #     curr_max,
-        #     curr_mean
-        # ))
-
-        # if len(daily_sums) > 1:
-        #     for i in range(1, len(daily_sums)):  # Iterate from the second day onwards
-        #         prev_date, prev_sum, prev_max, prev_min, prev_mean = daily_sums[i-1]
-        #         curr_date, curr_sum, curr_max, curr_min, curr_mean = daily_sums[i]
-        #         daily_stats.append((
-        #             curr_date,
-        #             curr_sum,
-        #             round(curr_sum - prev_sum,3),  # Calculate change for the current day
-        #             curr_min,
-        #             curr_max,
-        #             curr_mean
-        #         ))
-
-        # _LOGGER.debug(f"Daily stats: {daily_stats}")
-        # return daily_stats
-
-    def get_grouped_statistics(self, meter_type: str, grouping: str):
+    def get_year_data(self, deadline: Deadline | None = None):
         """
-        Groups daily statistics into specified time intervals (daily, weekly, monthly, yearly).
-
-        Args:
-            daily_stats: A list of tuples, where each tuple represents daily statistics:
-                        (date, daily_sum, daily_change, daily_min_sum, daily_max_sum, daily_mean_sum)
-            grouping: String specifying the grouping interval ('day', 'week', 'month', 'year')
+        Retrieve statistics for the full year from the API.
 
         Returns:
-            A list of tuples, where each tuple represents statistics for the given grouing:
-            (grouping_start_date, grouping_sum, grouping_change, grouping_min_sum, grouping_max_sum, grouping_mean_sum)
+          { 'water': {
+              'Data': [Reading(date_from='2025-01-01T00:00:00', value=6.288)],
+              'Extra': PeriodSummary(sum=6.288, avg=0.0, max=0.0, min=0.0, last_valid_date='2025-12-31T23:59:59')
+            }
+          }
         """
-        grouping_stats = []
-        grouping_sums = []
-
-        daily_stats = self.group_by_day(meter_type)
-        if grouping == "day":
-            return daily_stats
-
-        if grouping == "week":
-            # Determine the start date of the first week in the data
-            first_date = datetime.strptime(daily_stats[0][0], "%Y-%m-%d")
-            first_week_start = first_date - timedelta(
-                days=first_date.weekday()
-            )  # Shift to Monday
-            # _LOGGER.debug(f"First week: {first_date}, {first_week_start}, {first_date.weekday()}")
-
-            current_week_start = first_week_start
-            week_sum = 0
-
-            for date, daily_sum, _, _, _, _ in daily_stats:
-                date_obj = datetime.strptime(date, "%Y-%m-%d")
-                if date_obj >= current_week_start and date_obj < (
-                    current_week_start + timedelta(days=7)
-                ):
-                    week_sum += daily_sum
-                else:
-                    grouping_sums.append(
-                        (current_week_start.strftime("%Y-%m-%d"), round(week_sum, 3))
-                    )
-                    # Move to the next Monday
-                    current_week_start += timedelta(days=7)
-                    week_sum = daily_sum
-
-            # Add the last week's data
-            if week_sum > 0:
-                grouping_sums.append(
-                    (current_week_start.strftime("%Y-%m-%d"), round(week_sum, 3))
-                )
-        elif grouping == "month":
-            current_month = None
-            grouping_sum = 0
-            for date, daily_sum, _, _, _, _ in daily_stats:
-                date_obj = datetime.strptime(date, "%Y-%m-%d")
-                if current_month is None:
-                    print("New month", date_obj.month)
-                    current_month = date_obj.month
-                    grouping_sum = daily_sum
-                elif current_month != date_obj.month:
-                    print("New month", date_obj.month)
-                    grouping_sums.append(
-                        (
-                            (date_obj.replace(day=1) - timedelta(days=1)).strftime(
-                                "%Y-%m-%d"
-                            ),
-                            round(grouping_sum, 3),
-                        )
-                    )
-                    current_month = date_obj.month
-                    grouping_sum = daily_sum
-                else:
-                    grouping_sum += daily_sum
-
-            if grouping_sum > 0:  # Add the last month's data
-                grouping_sums.append(
-                    (
-                        date_obj.replace(day=1).strftime("%Y-%m-%d"),
-                        round(grouping_sum, 3),
-                    )
-                )
+        dateFrom, dateTo = self._year_range()
 
-        elif grouping == "year":
-            current_year = None
-            grouping_sum = 0
-            for date, daily_sum, _, _, _, _ in daily_stats:
-                date_obj = datetime.strptime(date, "%Y-%m-%d")
-                if current_year is None:
-                    print("New year", date_obj.year)
-                    current_year = date_obj.year
-                    grouping_sum = daily_sum
-                elif current_year != date_obj.year:
-                    print("New year", date_obj.year)
-                    grouping_sums.append(
-                        (f"{current_year}-01-01", round(grouping_sum, 3))
-                    )
-                    current_year = date_obj.year
-                    grouping_sum = daily_sum
-                else:
-                    grouping_sum += daily_sum
-
-            if grouping_sum > 0:  # Add the last year's data
-                print("Add year", grouping_sum, current_year)
-                grouping_sums.append((f"{current_year}-01-01", round(grouping_sum, 3)))
-
-        _LOGGER.debug(f"Grouping_sums: {grouping_sums}")
-
-        if grouping_sums:
-            first_grouping_date, first_grouping_sum = grouping_sums[0]
-            grouping_stats.append(
-                (
-                    first_grouping_date,
-                    round(first_grouping_sum, 3),
-                    0.0,  # No change for the first grouping
-                    round(first_grouping_sum, 3),
-                    round(first_grouping_sum, 3),
-                    round(first_grouping_sum, 3),
-                )
+        with self._deadline_scope(deadline):
+            time_series = self._get_all_consumption_timeseries(
+                dateFrom=dateFrom, dateTo=dateTo, zoomLevel=self._zoom_level["Year"]
             )
-
-        if len(grouping_sums) > 1:
-            for i in range(1, len(grouping_sums)):
-                prev_grouping_date, prev_grouping_sum = grouping_sums[i - 1]
-                curr_grouping_date, curr_grouping_sum = grouping_sums[i]
-                grouping_stats.append(
-                    (
-                        curr_grouping_date,
-                        round(curr_grouping_sum, 3),
-                        round(curr_grouping_sum - prev_grouping_sum, 3),
-                        min(curr_grouping_sum, prev_grouping_sum),
-                        max(curr_grouping_sum, prev_grouping_sum),
-                        round((curr_grouping_sum + prev_grouping_sum) / 2, 3),
-                    )
-                )
-
-        _LOGGER.debug(f"Grouped stats: {grouping_stats}")
-        return grouping_stats
-
-    def get_dummy_data(self):
-        return {"water": [{"DateFrom": None, "Value": None}]}
+        return self._build_year_data(time_series)
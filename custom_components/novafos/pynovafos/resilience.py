@@ -0,0 +1,139 @@
+"""
+Retry and circuit breaker policies for KMD API requests.
+
+Transient failures (network errors, HTTP 5xx, rate limiting) are retried with capped
+exponential backoff and jitter.  After repeated failures the circuit opens and requests
+fail fast until the API had some time to recover.
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying - the request may well succeed a little later
+RETRY_STATUS = frozenset({500, 502, 503, 504})
+
+# Times a request is repeated after the API answered HTTP 429
+RATE_LIMITED_RETRIES = 5
+
+# Seconds to wait for a connection to the API, and for the API to send data
+CONNECT_TIMEOUT = 5.0
+READ_TIMEOUT = 30.0
+
+
+class RetryPolicy:
+    """
+    Capped exponential backoff with full jitter.
+
+    A failed request is repeated up to retries times.  Before attempt n (1-based) the
+    caller waits a random time between 0 and min(cap, base * 2**(n-1)) seconds.
+    """
+
+    def __init__(self, retries=3, base=1.0, cap=30.0):
+        self.retries = retries
+        self._base = base
+        self._cap = cap
+
+    def delay(self, attempt):
+        """Return the seconds to wait before the given retry attempt."""
+        return random.uniform(0, min(self._cap, self._base * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Stops requests to the API after failure_threshold consecutive failed requests.
+
+    While open, allow_request() returns False.  After reset_timeout seconds a single trial
+    request is let through (half-open) while the others still fail fast.  Its success
+    closes the circuit, its failure opens it for another reset_timeout.  A trial request
+    ending otherwise is released, one which never reports back is replaced by another
+    one after reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=300.0):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        # When the trial request of the half-open circuit was let through
+        self._trial_at = None
+        # The blocking client sends requests from several threads
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def allow_request(self):
+        """Check if a request may be sent to the API.  Half-open, only the trial request may."""
+        if self._opened_at is None:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if now - self._opened_at < self._reset_timeout:
+                return False
+            if (
+                self._trial_at is not None
+                and now - self._trial_at < self._reset_timeout
+            ):
+                # The trial request has not come back yet
+                return False
+            self._trial_at = now
+            return True
+
+    def retry_in(self):
+        """Return the seconds until requests are let through again."""
+        if self._opened_at is None:
+            return 0.0
+        retry_at = self._opened_at + self._reset_timeout
+        if self._trial_at is not None:
+            retry_at = max(retry_at, self._trial_at + self._reset_timeout)
+        return max(0.0, retry_at - time.monotonic())
+
+    def record_success(self):
+        if self._opened_at is not None:
+            _LOGGER.info("The KMD API responds again - closing the circuit")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_at = None
+
+    def release_trial(self):
+        """Let the next request be the trial - the trial request ended without an outcome."""
+        self._trial_at = None
+
+    def record_failure(self):
+        self._trial_at = None
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self._failure_threshold:
+            if self._opened_at is None:
+                _LOGGER.warning(
+                    "The KMD API failed %s times in a row - pausing requests for %.0fs",
+                    self._failures,
+                    self._reset_timeout,
+                )
+            self._opened_at = time.monotonic()
+
+
+class Deadline:
+    """
+    Point in time by which a unit of work, e.g. one coordinator refresh, has to be done.
+
+    Requests are not started after the deadline, and their timeouts are shortened so they
+    end by the deadline.
+    """
+
+    def __init__(self, seconds):
+        self._end = time.monotonic() + seconds
+
+    def remaining(self):
+        """Return the seconds left until the deadline."""
+        return max(0.0, self._end - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0.0
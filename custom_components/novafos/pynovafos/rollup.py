@@ -0,0 +1,703 @@
+"""
+Day, week, month and year rollups of hourly meter readings.
+
+The hourly series is walked once.  Each complete day is summed and handed to the
+groupings asked for, so all of them together cost about as much as one.  The local
+date is only computed when a reading crosses into the next day.
+
+Days are bounded by their local midnights in epoch seconds, and a day is complete when
+it has a reading for every local wall-clock hour: 23 on the day DST starts and 24
+otherwise.  The API sends the day DST ends as 24 rows with a single 02:00 - if the
+repeated hour is sent twice, both readings count as that one hour.  Days with fewer
+hours - e.g. at the edges of the retrieved period - are partial and left out.
+
+Daily sums summarised by the API can be passed in.  Those days are taken as they are,
+and only the hours of the other days are walked.
+
+IncrementalRollups keeps the state of the groupings between updates, so an update
+only walks the hours added since the last one and returns the buckets they touched.
+The state is a plain dictionary which the owner persists, like the response cache.
+
+If NumPy is installed (Home Assistant ships it) the hourly readings are summed per day,
+and the days per calendar week, month and year, with array operations.  The results
+are the same as those of the pure Python code, which is used otherwise.
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .records import RollupRow
+
+_LOGGER = logging.getLogger(__name__)
+
+# Use the NumPy backend if NumPy is available
+VECTORIZED = np is not None
+
+GROUPINGS = ("day", "week", "month", "year")
+
+# Hourly readings making up a day without DST change
+HOURS_PER_DAY = 24
+
+ROLLUP_VERSION = 1
+
+# Days before the newest complete day which are summed again on the next update.
+# Readings of the latest days may still change when they are retrieved again.
+RESUME_DAYS = 3
+
+
+class _Grouping:
+    """
+    Folds daily sums into the buckets of a grouping.
+
+    add() returns the buckets closed by a day as (date, sum) pairs, close() the open
+    bucket, if any.  prev is the sum of the last closed bucket.  The state - the fields
+    named in _FIELDS and prev - can be saved and restored.
+    """
+
+    _FIELDS = ()
+    _DATE_FIELDS = ()
+
+    def __init__(self):
+        self.prev = None
+
+    def add(self, day, daily_sum):
+        closed = self._add(day, daily_sum)
+        if closed:
+            self.prev = closed[-1][1]
+        return closed
+
+    def _add(self, day, daily_sum):
+        raise NotImplementedError
+
+    def close(self):
+        return []
+
+    def state(self):
+        state = {"prev": self.prev}
+        for field in self._FIELDS:
+            value = getattr(self, field)
+            if field in self._DATE_FIELDS and value is not None:
+                value = value.isoformat()
+            state[field] = value
+        return state
+
+    @classmethod
+    def restored(cls, state):
+        grouping = cls()
+        if state:
+            grouping.prev = state["prev"]
+            for field in cls._FIELDS:
+                value = state[field]
+                if field in cls._DATE_FIELDS and value is not None:
+                    value = date.fromisoformat(value)
+                setattr(grouping, field, value)
+        return grouping
+
+
+class _DaySums(_Grouping):
+    """Sums per day."""
+
+    def _add(self, day, daily_sum):
+        return [(day.isoformat(), daily_sum)]
+
+
+class _WeekSums(_Grouping):
+    """Sums per week, labelled with the Monday starting the week."""
+
+    _FIELDS = ("_start", "_sum")
+    _DATE_FIELDS = ("_start",)
+
+    def __init__(self):
+        super().__init__()
+        self._start = None
+        self._sum = 0
+
+    def _add(self, day, daily_sum):
+        if self._start is None:
+            # Monday of the first week
+            self._start = day - timedelta(days=day.weekday())
+        if self._start <= day < self._start + timedelta(days=7):
+            self._sum += daily_sum
+            return []
+        closed = [(self._start.isoformat(), round(self._sum, 3))]
+        # Move to the next Monday
+        self._start += timedelta(days=7)
+        self._sum = daily_sum
+        return closed
+
+    def close(self):
+        # The ongoing week
+        if self._sum > 0:
+            return [(self._start.isoformat(), round(self._sum, 3))]
+        return []
+
+
+class _MonthSums(_Grouping):
+    """Sums per month, labelled with the last day of the month - the ongoing month with its first day."""
+
+    _FIELDS = ("_month", "_last_day", "_sum")
+    _DATE_FIELDS = ("_last_day",)
+
+    def __init__(self):
+        super().__init__()
+        self._month = None
+        self._last_day = None
+        self._sum = 0
+
+    def _add(self, day, daily_sum):
+        closed = []
+        if self._month is None:
+            self._month = day.month
+            self._sum = daily_sum
+        elif self._month != day.month:
+            closed = [
+                (
+                    (day.replace(day=1) - timedelta(days=1)).isoformat(),
+                    round(self._sum, 3),
+                )
+            ]
+            self._month = day.month
+            self._sum = daily_sum
+        else:
+            self._sum += daily_sum
+        self._last_day = day
+        return closed
+
+    def close(self):
+        # The ongoing month
+        if self._sum > 0:
+            return [(self._last_day.replace(day=1).isoformat(), round(self._sum, 3))]
+        return []
+
+
+class _YearSums(_Grouping):
+    """Sums per year, labelled with January 1st."""
+
+    _FIELDS = ("_year", "_sum")
+
+    def __init__(self):
+        super().__init__()
+        self._year = None
+        self._sum = 0
+
+    def _add(self, day, daily_sum):
+        if self._year is None:
+            self._year = day.year
+            self._sum = daily_sum
+            return []
+        if self._year != day.year:
+            closed = [(f"{self._year}-01-01", round(self._sum, 3))]
+            self._year = day.year
+            self._sum = daily_sum
+            return closed
+        self._sum += daily_sum
+        return []
+
+    def close(self):
+        # The ongoing year
+        if self._sum > 0:
+            return [(f"{self._year}-01-01", round(self._sum, 3))]
+        return []
+
+
+_GROUPINGS = {
+    "day": _DaySums,
+    "week": _WeekSums,
+    "month": _MonthSums,
+    "year": _YearSums,
+}
+
+
+def _with_changes(sums, first_change=None, prev_sum=None):
+    """
+    Turn (date, sum) pairs into RollupRows (date, sum, change, min, max, mean).
+
+    change is the change of the sum since the bucket before, min/max/mean are taken over
+    the sums of the two buckets.  prev_sum is the sum of the bucket before the first
+    pair.  Without it the first bucket has first_change as change - or its sum if
+    first_change is None - and its sum as min/max/mean.
+    """
+    stats = []
+    for date_str, curr_sum in sums:
+        if prev_sum is None:
+            value = round(curr_sum, 3)
+            change = value if first_change is None else first_change
+            stats.append(RollupRow(date_str, value, change, value, value, value))
+        else:
+            stats.append(
+                RollupRow(
+                    date_str,
+                    round(curr_sum, 3),
+                    round(curr_sum - prev_sum, 3),
+                    min(curr_sum, prev_sum),
+                    max(curr_sum, prev_sum),
+                    round((curr_sum + prev_sum) / 2, 3),
+                )
+            )
+        prev_sum = curr_sum
+    return stats
+
+
+def _first_change(grouping):
+    # The first day counts its sum as change, the first week/month/year has no change
+    return None if grouping == "day" else 0.0
+
+
+def _midnight(day, tz):
+    """Epoch seconds of the local midnight starting day."""
+    return int(datetime(day.year, day.month, day.day, tzinfo=tz).timestamp())
+
+
+def _hours_in_day(day, tz):
+    """Hours of a local day: 23 or 25 on days with a DST change, 24 otherwise."""
+    return (_midnight(day + timedelta(days=1), tz) - _midnight(day, tz)) // 3600
+
+
+def _repeated_hour(day_start, day_end, tz):
+    """Epoch seconds of the second occurrence of the wall-clock hour repeated when DST ends."""
+    for timestamp in range(day_start + 3600, day_end, 3600):
+        if (
+            datetime.fromtimestamp(timestamp, tz).hour
+            == datetime.fromtimestamp(timestamp - 3600, tz).hour
+        ):
+            return timestamp
+    return None
+
+
+def _complete_days(series):
+    """Return (local date, sum) for each day of the series with a reading for every hour."""
+    if VECTORIZED:
+        dates, sums = _daily_arrays(series)
+        return list(zip(dates.tolist(), sums.tolist()))
+    return list(_iter_complete_days(series))
+
+
+def _iter_days(series):
+    """
+    Yield (local date, sum, hours, expected hours) for each day of the series.
+
+    hours is the number of wall-clock hours with a reading, expected hours the wall-clock
+    hours of the day.  A day with fewer hours than expected is partial.
+    """
+    day = None
+    day_end = None
+    expected = 0
+    repeated = None
+    previous = None
+    duplicates = 0
+    values = []
+    for timestamp, value in series:
+        if day_end is None or timestamp >= day_end:
+            if values:
+                yield day, round(sum(values), 3), len(values) - duplicates, expected
+            # Crossed into the next local day
+            day = datetime.fromtimestamp(timestamp, series.tz).date()
+            day_start = _midnight(day, series.tz)
+            day_end = _midnight(day + timedelta(days=1), series.tz)
+            length = (day_end - day_start) // 3600
+            repeated = (
+                _repeated_hour(day_start, day_end, series.tz)
+                if length > HOURS_PER_DAY
+                else None
+            )
+            expected = min(length, HOURS_PER_DAY)
+            duplicates = 0
+            values = []
+        elif timestamp == repeated and previous == repeated - 3600:
+            # Both readings of the repeated hour - one wall-clock hour
+            duplicates += 1
+        values.append(value)
+        previous = timestamp
+    if values:
+        yield day, round(sum(values), 3), len(values) - duplicates, expected
+
+
+def _iter_complete_days(series):
+    for day, daily_sum, hours, expected in _iter_days(series):
+        if hours == expected:
+            yield day, daily_sum
+
+
+def _days_with_summaries(series, day_sums):
+    """
+    Return (local date, sum) for the summarised and the complete days, in date order.
+
+    day_sums holds {date: sum} of the days summarised by the API, which are taken as they
+    are.  Only the hours of the days without summary are summed.
+    """
+    if not day_sums:
+        return _complete_days(series)
+    days = {day: round(day_sum, 3) for day, day_sum in day_sums.items()}
+    tz = series.tz
+    first, last = min(days), max(days)
+    # The hours before and after the summarised days, and of the days missing in between
+    parts = [
+        series.between(0, _midnight(first, tz)),
+        series.between(_midnight(last + timedelta(days=1), tz)),
+    ]
+    day = first
+    while day < last:
+        day += timedelta(days=1)
+        if day in days:
+            continue
+        gap_start = day
+        while day + timedelta(days=1) not in days:
+            day += timedelta(days=1)
+        parts.append(
+            series.between(
+                _midnight(gap_start, tz), _midnight(day + timedelta(days=1), tz)
+            )
+        )
+    for part in parts:
+        days.update(_complete_days(part))
+    return sorted(days.items())
+
+
+# Seconds between the UTC offsets sampled by _utc_offsets.  Less than the time between two
+# DST changes, so an offset changing and changing back in between is not missed.
+_OFFSET_SAMPLE_SECONDS = 28 * 86400
+
+
+def _utc_offsets(timestamps, tz):
+    """
+    Return the UTC offsets in seconds at the given sorted timestamps.
+
+    The offset is looked up at the first timestamp of every _OFFSET_SAMPLE_SECONDS and the
+    timestamp before it - so readings between two samples span less than that, also with
+    gaps in the data - and the DST changes between samples with different offsets are found
+    by bisection.  That is a few dozen lookups for years of hourly data.
+    """
+
+    def offset(index):
+        local = datetime.fromtimestamp(int(timestamps[index]), tz)
+        return int(local.utcoffset().total_seconds())
+
+    count = len(timestamps)
+    offsets = np.empty(count, dtype=np.int64)
+    grid = np.searchsorted(
+        timestamps,
+        np.arange(timestamps[0], timestamps[-1], _OFFSET_SAMPLE_SECONDS),
+    )
+    samples = np.unique(np.r_[grid, grid - 1, count - 1].clip(0)).tolist()
+    sample_offsets = [offset(index) for index in samples]
+    for lo, hi, lo_offset, hi_offset in zip(
+        samples, samples[1:], sample_offsets, sample_offsets[1:]
+    ):
+        while lo_offset != hi_offset:
+            # Find the first index with the offset of hi
+            left, right = lo, hi
+            while right - left > 1:
+                middle = (left + right) // 2
+                if offset(middle) == lo_offset:
+                    left = middle
+                else:
+                    right = middle
+            offsets[lo:right] = lo_offset
+            lo, lo_offset = right, offset(right)
+        offsets[lo:hi] = lo_offset
+    offsets[count - 1] = sample_offsets[-1]
+    return offsets
+
+
+def _day_arrays(series):
+    """
+    _iter_days with NumPy.  Returns the dates (datetime64[D]), unrounded sums, hours and
+    expected hours as arrays.
+
+    The hours are keyed by their local day and summed per run of equal keys.  A day with
+    24 readings at one UTC offset is a day without DST change; the wall-clock hours of any
+    other day are counted from the local times of its readings.
+    """
+    timestamps = np.frombuffer(series.timestamps, dtype=np.int64)
+    values = np.frombuffer(series.values, dtype=np.float64)
+    offsets = _utc_offsets(timestamps, series.tz)
+    local_days = (timestamps + offsets) // 86400
+    starts = np.flatnonzero(np.r_[True, local_days[1:] != local_days[:-1]])
+    ends = np.r_[starts[1:], len(timestamps)]
+    hours = ends - starts
+    expected = np.full(len(starts), HOURS_PER_DAY)
+    dates = local_days[starts].astype("datetime64[D]")
+    for index in np.flatnonzero(
+        (hours != HOURS_PER_DAY) | (offsets[starts] != offsets[ends - 1])
+    ).tolist():
+        start, end = starts[index], ends[index]
+        hours[index] = len(
+            np.unique((timestamps[start:end] + offsets[start:end]) // 3600)
+        )
+        expected[index] = min(
+            _hours_in_day(dates[index].item(), series.tz), HOURS_PER_DAY
+        )
+    return dates, np.add.reduceat(values, starts), hours, expected
+
+
+def _daily_arrays(series):
+    """_complete_days with NumPy.  Returns the dates (datetime64[D]) and sums as arrays."""
+    if not len(series):
+        return np.array([], dtype="datetime64[D]"), np.array([])
+    dates, sums, hours, expected = _day_arrays(series)
+    complete = hours == expected
+    # Rounded by Python - NumPy rounds some halves the other way
+    sums = np.array([round(daily_sum, 3) for daily_sum in sums[complete].tolist()])
+    return dates[complete], sums
+
+
+def _bucket_sums_vectorized(grouping, dates, sums):
+    """
+    Sum complete days into calendar weeks, months or years with NumPy.
+
+    dates and sums are the arrays of _daily_arrays.  Returns the (date, sum) buckets like
+    the _Grouping classes do, or None if the days have gaps which the groupings treat in
+    their own way - then the days have to be folded one by one.
+    """
+    if grouping == "week":
+        ordinals = dates.astype(np.int64)
+        # Days since 1970-01-01 (a Thursday) to the Monday starting the week
+        keys = ordinals - (ordinals + 3) % 7
+    elif grouping == "month":
+        keys = dates.astype("datetime64[M]").astype(np.int64)
+    else:
+        keys = dates.astype("datetime64[Y]").astype(np.int64)
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    bucket_keys = keys[starts]
+    if grouping == "week" and np.any(np.diff(bucket_keys) != 7):
+        # A week without days - the weeks move on one at a time
+        return None
+    if grouping == "month" and np.any(np.diff(bucket_keys) != 1):
+        # A month without days - the months move on one at a time
+        return None
+
+    bucket_sums = np.add.reduceat(sums, starts).tolist()
+    if grouping == "week":
+        labels = np.datetime_as_string(bucket_keys.astype("datetime64[D]")).tolist()
+    elif grouping == "month":
+        # Closed months are labelled with their last day, the ongoing one with its first
+        months = bucket_keys.astype("datetime64[M]")
+        labels = np.datetime_as_string(
+            (months + 1).astype("datetime64[D]") - 1
+        ).tolist()
+        labels[-1] = str(months[-1].astype("datetime64[D]"))
+    else:
+        labels = [f"{key + 1970}-01-01" for key in bucket_keys.tolist()]
+
+    buckets = [
+        (label, round(bucket_sum, 3))
+        for label, bucket_sum in zip(labels[:-1], bucket_sums[:-1])
+    ]
+    # The ongoing bucket is only reported with consumption
+    if bucket_sums[-1] > 0:
+        buckets.append((labels[-1], round(bucket_sums[-1], 3)))
+    return buckets
+
+
+def _fold(grouping, days):
+    """Fold (date, sum) days one by one into the buckets of a grouping."""
+    fold = _GROUPINGS[grouping]()
+    buckets = []
+    for day, daily_sum in days:
+        buckets.extend(fold.add(day, daily_sum))
+    return buckets + fold.close()
+
+
+def _rollup_vectorized(dates, sums, groupings):
+    days = None
+    bucket_sums = {}
+    for grouping in groupings:
+        buckets = None
+        if grouping == "day":
+            buckets = list(zip(np.datetime_as_string(dates).tolist(), sums.tolist()))
+        elif len(dates):
+            buckets = _bucket_sums_vectorized(grouping, dates, sums)
+        if buckets is None:
+            if days is None:
+                days = list(zip(dates.tolist(), sums.tolist()))
+            buckets = _fold(grouping, days)
+        bucket_sums[grouping] = buckets
+    return bucket_sums
+
+
+def rollup(series, groupings=GROUPINGS, day_sums=None):
+    """
+    Group an HourlySeries into the given groupings ('day', 'week', 'month', 'year').
+
+    Only complete days are counted: days with a reading for each of their 23, 24 or 25
+    hours.  day_sums holds {date: sum} of days summarised by the API, which are used
+    instead of the hours of those days.
+
+    Returns a dictionary with a list of RollupRows (grouping_start_date, sum, change, min,
+    max, mean) per grouping.  The dates are "YYYY-MM-DD" strings.  The first day has its sum as
+    change, the first week/month/year has no change (0.0).
+    """
+    if day_sums:
+        days = _days_with_summaries(series, day_sums)
+        if VECTORIZED:
+            dates = np.array([day for day, _ in days], dtype="datetime64[D]")
+            sums = np.array([daily_sum for _, daily_sum in days], dtype=np.float64)
+    elif VECTORIZED:
+        dates, sums = _daily_arrays(series)
+    else:
+        days = list(_iter_complete_days(series))
+    if VECTORIZED:
+        bucket_sums = _rollup_vectorized(dates, sums, groupings)
+    else:
+        bucket_sums = {grouping: _fold(grouping, days) for grouping in groupings}
+    # Python rounding for the changes and means as well, see _daily_arrays
+    return {
+        grouping: _with_changes(buckets, _first_change(grouping))
+        for grouping, buckets in bucket_sums.items()
+    }
+
+
+class RollupState:
+    """
+    Resumable rollups of the hourly data of one meter type.
+
+    The state of the groupings is saved as of a checkpoint day, together with the sums of
+    the complete days from the checkpoint on.  update() sums the days from the checkpoint
+    on again, folds them into the saved state and moves the checkpoint to RESUME_DAYS
+    days before the newest complete day.  Readings before the checkpoint are taken as
+    final.
+    """
+
+    def __init__(self, groupings=GROUPINGS, resume_days=RESUME_DAYS):
+        self._groupings = groupings
+        self._resume_days = resume_days
+        # First day not folded into the saved state.  None before the first update.
+        self._checkpoint = None
+        self._states = {}
+        # Sums of the complete days from the checkpoint on
+        self._days = {}
+
+    def update(self, series, day_sums=None):
+        """
+        Fold the hourly data of series into the rollups.
+
+        series has to hold the hours since the checkpoint - days it does not cover
+        completely keep the sum of an earlier update.  day_sums are the sums of days
+        summarised by the API, see rollup().  Returns the buckets from the checkpoint on
+        per grouping, see rollup().
+        """
+        days = dict(self._days)
+        if self._checkpoint is not None:
+            first = self._checkpoint
+            series = series.between(_midnight(first, series.tz))
+            if day_sums:
+                day_sums = {
+                    day: value for day, value in day_sums.items() if day >= first
+                }
+        days.update(_days_with_summaries(series, day_sums))
+
+        folds = {
+            grouping: _GROUPINGS[grouping].restored(self._states.get(grouping))
+            for grouping in self._groupings
+        }
+        prev = {grouping: fold.prev for grouping, fold in folds.items()}
+
+        checkpoint = self._checkpoint
+        if days:
+            resume = max(days) - timedelta(days=self._resume_days)
+            if checkpoint is None or resume > checkpoint:
+                checkpoint = resume
+
+        states = None
+        buckets = {grouping: [] for grouping in self._groupings}
+        for day, daily_sum in sorted(days.items()):
+            if states is None and day >= checkpoint:
+                states = {grouping: fold.state() for grouping, fold in folds.items()}
+            for grouping, fold in folds.items():
+                buckets[grouping].extend(fold.add(day, daily_sum))
+        if states is None:
+            states = {grouping: fold.state() for grouping, fold in folds.items()}
+
+        self._checkpoint = checkpoint
+        self._states = states
+        self._days = {day: value for day, value in days.items() if day >= checkpoint}
+        return {
+            grouping: _with_changes(
+                buckets[grouping] + fold.close(),
+                _first_change(grouping),
+                prev[grouping],
+            )
+            for grouping, fold in folds.items()
+        }
+
+    def to_dict(self):
+        return {
+            "checkpoint": None
+            if self._checkpoint is None
+            else self._checkpoint.isoformat(),
+            "states": self._states,
+            "days": [
+                [day.isoformat(), value] for day, value in sorted(self._days.items())
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data, groupings=GROUPINGS, resume_days=RESUME_DAYS):
+        state = cls(groupings, resume_days)
+        if data["checkpoint"] is not None:
+            state._checkpoint = date.fromisoformat(data["checkpoint"])
+        state._states = data["states"]
+        state._days = {date.fromisoformat(day): value for day, value in data["days"]}
+        return state
+
+
+class IncrementalRollups:
+    """
+    Rollup state per meter type.
+
+    The owner persists the state through to_dict/load, e.g. with the Home Assistant storage
+    helper, so a restart does not recompute the complete history.
+    """
+
+    def __init__(self, groupings=GROUPINGS):
+        self._groupings = groupings
+        self._meters = {}
+        # Set whenever the content changes and needs to be persisted
+        self.dirty = False
+
+    def update(self, meter_type, series, day_sums=None):
+        """Fold new hourly data of a meter type in.  Returns the buckets it touched, see RollupState.update."""
+        state = self._meters.get(meter_type)
+        if state is None:
+            state = self._meters[meter_type] = RollupState(self._groupings)
+        self.dirty = True
+        return state.update(series, day_sums)
+
+    def reset(self, meter_type):
+        """Forget the state of a meter type - the next update starts from scratch."""
+        if self._meters.pop(meter_type, None) is not None:
+            self.dirty = True
+
+    def to_dict(self):
+        """Return the persistable content."""
+        self.dirty = False
+        return {
+            "version": ROLLUP_VERSION,
+            "groupings": list(self._groupings),
+            "meters": {
+                meter_type: state.to_dict()
+                for meter_type, state in self._meters.items()
+            },
+        }
+
+    def load(self, data):
+        """Restore the content saved by to_dict."""
+        if (
+            not data
+            or data.get("version") != ROLLUP_VERSION
+            or data.get("groupings") != list(self._groupings)
+        ):
+            return
+        self._meters = {
+            meter_type: RollupState.from_dict(state, self._groupings)
+            for meter_type, state in data["meters"].items()
+        }
+        _LOGGER.debug("Loaded rollup state of %s meter type(s)", len(self._meters))
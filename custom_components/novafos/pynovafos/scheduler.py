@@ -0,0 +1,110 @@
+"""
+Bounded-concurrency, rate limited scheduling of KMD API requests.
+
+Used by AsyncNovafos to run the windows of a backfill concurrently without
+hammering the API.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+
+_LOGGER = logging.getLogger(__name__)
+
+# Seconds to back off after a HTTP 429 without a usable Retry-After header
+DEFAULT_RETRY_AFTER = 5.0
+
+
+def parse_retry_after(value, default=DEFAULT_RETRY_AFTER):
+    """Return the seconds to wait from a Retry-After header (delay-seconds or HTTP-date)."""
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return default
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=UTC)
+    return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Allows bursts of up to capacity requests and rate requests per second on average.
+    The bucket can be paused, e.g. when the API answers HTTP 429 with a Retry-After.
+    """
+
+    def __init__(self, rate, capacity):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Hand out no tokens for the given number of seconds."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self._capacity, self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self._rate)
+
+
+class BackfillScheduler:
+    """
+    Runs many jobs (e.g. one per request window) with at most concurrency of them in flight.
+
+    All requests made by the jobs share the limiter, which caps the request rate and is
+    paused whenever the API signals rate limiting.
+    """
+
+    def __init__(self, concurrency=4, rate=5.0, burst=5):
+        self._concurrency = max(1, concurrency)
+        self.limiter = TokenBucket(rate, burst)
+
+    def rate_limited(self, retry_after):
+        """Back off all requests after a HTTP 429."""
+        _LOGGER.warning("The KMD API is rate limiting - pausing for %.1fs", retry_after)
+        self.limiter.pause(retry_after)
+
+    async def run(self, jobs):
+        """Run the jobs (callables returning awaitables) concurrently.
+
+        Returns the results in the order of the jobs - chronological if the jobs are.
+        A failing job returns its exception instead of a result, and does not stop the
+        other jobs.
+        """
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def run_job(job):
+            async with semaphore:
+                return await job()
+
+        return await asyncio.gather(
+            *(run_job(job) for job in jobs), return_exceptions=True
+        )
@@ -0,0 +1,212 @@
+"""
+Streaming parser for consumptionTimeSeries responses.
+
+A window of hourly data is a large JSON document, of which only the rows of the first
+series and a few totals are used.  The parser is fed the response body chunk by chunk
+and hands out the rows as they arrive, so neither the body nor the decoded document is
+held in memory at once.
+
+The clients collect the rows of a window in one list of Readings, which the response
+cache keeps and the meter data copies into its arrays.  A window thus costs one list of
+its rows instead of the body, the decoded document and the list - memory still grows
+with the window and the cache, it is not flat.
+"""
+
+from __future__ import annotations
+
+import codecs
+import json
+
+# Bytes read from the response stream at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+class _NeedMore(Exception):
+    """The buffered text ends before the next JSON value does."""
+
+
+class ConsumptionStreamParser:
+    """
+    Incremental parser of a consumptionTimeSeries response body.
+
+    Only the structure actually used is tracked: the rows of the first series are passed
+    to on_row(DateFrom, Value) one at a time, all other top level members are decoded whole and kept
+    in summary (Total, Average, ...).  Further series are skipped.
+
+    feed() takes the body in chunks of bytes or text, close() checks that the document
+    was complete.  complete tells if all rows are flagged IsComplete, complete_rows how
+    many rows from the first one on are.
+    """
+
+    def __init__(self, on_row):
+        self._on_row = on_row
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._closed = False
+        # Parser state: where in the document the next token is expected
+        self._state = "top_start"
+        self._series_index = 0
+        self._key = None
+        # Results
+        self.summary = {}
+        self.rows = 0
+        self.complete = True
+        self.complete_rows = 0
+        self.last_date_to = ""
+
+    def feed(self, chunk):
+        """Parse the next chunk of the response body."""
+        if isinstance(chunk, bytes):
+            chunk = self._text.decode(chunk)
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        try:
+            while self._state != "done":
+                self._step()
+        except _NeedMore:
+            pass
+
+    def close(self):
+        """Finish parsing.  Raises ValueError if the document is incomplete."""
+        self._closed = True
+        self.feed(self._text.decode(b"", final=True))
+        if self._state != "done":
+            raise ValueError("Truncated consumptionTimeSeries response")
+        return self
+
+    def _skip_whitespace(self):
+        while self._pos < len(self._buffer) and self._buffer[self._pos] in _WHITESPACE:
+            self._pos += 1
+        if self._pos >= len(self._buffer):
+            raise _NeedMore
+
+    def _next_char(self):
+        """Consume and return the next structural character."""
+        self._skip_whitespace()
+        char = self._buffer[self._pos]
+        self._pos += 1
+        return char
+
+    def _peek_char(self):
+        self._skip_whitespace()
+        return self._buffer[self._pos]
+
+    def _value(self):
+        """Decode the next JSON value."""
+        self._skip_whitespace()
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if self._closed:
+                raise
+            raise _NeedMore from None
+        # A number at the end of the buffer may continue in the next chunk
+        if end >= len(self._buffer) and not self._closed:
+            raise _NeedMore
+        self._pos = end
+        return value
+
+    def _expect(self, expected):
+        char = self._next_char()
+        if char != expected:
+            raise ValueError(
+                f"Unexpected '{char}' in consumptionTimeSeries response, expected '{expected}'"
+            )
+
+    def _key_or_end(self, end_state):
+        """Read the next member name of an object, or its end."""
+        char = self._peek_char()
+        if char == ",":
+            self._pos += 1
+            char = self._peek_char()
+        if char == "}":
+            self._pos += 1
+            self._state = end_state
+            return None
+        key = self._value()
+        self._expect(":")
+        return key
+
+    def _step(self):
+        """Consume one token of the document.  Raises _NeedMore if it is not buffered yet."""
+        start = self._pos
+        try:
+            getattr(self, f"_state_{self._state}")()
+        except _NeedMore:
+            # Start over from the same token when more data arrives
+            self._pos = start
+            raise
+
+    def _state_top_start(self):
+        self._expect("{")
+        self._state = "top_key"
+
+    def _state_top_key(self):
+        key = self._key_or_end("done")
+        if key is None:
+            return
+        if key == "Series":
+            self._state = "series_start"
+        else:
+            self._key = key
+            self._state = "top_value"
+
+    def _state_top_value(self):
+        self.summary[self._key] = self._value()
+        self._state = "top_key"
+
+    def _state_series_start(self):
+        self._expect("[")
+        self._state = "series_next"
+
+    def _state_series_next(self):
+        char = self._peek_char()
+        if char == ",":
+            self._pos += 1
+            char = self._peek_char()
+        if char == "]":
+            self._pos += 1
+            self._state = "top_key"
+        elif self._series_index == 0:
+            self._expect("{")
+            self._state = "series_key"
+        else:
+            # Only the first series is used
+            self._value()
+        self._series_index += 1
+
+    def _state_series_key(self):
+        key = self._key_or_end("series_next")
+        if key is None:
+            return
+        self._state = "data_start" if key == "Data" else "series_value"
+
+    def _state_series_value(self):
+        self._value()
+        self._state = "series_key"
+
+    def _state_data_start(self):
+        self._expect("[")
+        self._state = "data_row"
+
+    def _state_data_row(self):
+        char = self._peek_char()
+        if char == ",":
+            self._pos += 1
+            char = self._peek_char()
+        if char == "]":
+            self._pos += 1
+            self._state = "series_key"
+            return
+        row = self._value()
+        self.rows += 1
+        self.complete = self.complete and row.get("IsComplete", False)
+        if self.complete:
+            self.complete_rows = self.rows
+        # NOTE: Assuming data is sorted by date - which it is
+        self.last_date_to = row["DateTo"]
+        self._on_row(row["DateFrom"], row["Value"])
@@ -0,0 +1,141 @@
+"""
+Fast conversion of KMD API times to epoch seconds.
+
+The API sends its times in a few fixed shapes: local time without offset
+("2024-12-29T13:00:00"), with a fixed offset ("2024-12-29T13:00:00+01:00") or in UTC
+("2024-11-30T23:00:00.000Z").  Instead of building a datetime per time, the fields are
+sliced out of the string and added to the epoch seconds of the day, which are looked up
+in a table filled once per day.  Local days with a DST change, and times of any other
+shape, take the datetime path.
+"""
+
+from __future__ import annotations
+
+from array import array
+from datetime import date, datetime
+from functools import lru_cache
+
+# Epoch seconds per day, and date.toordinal() of 1970-01-01
+_DAY = 86400
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Offsets the API appends to its times, in seconds
+_OFFSETS = {"Z": 0, "+00:00": 0, "+01:00": 3600, "+02:00": 7200}
+
+# The usual case, whole hours: seconds per hour field, and the offset per rest of the
+# time - None for local time
+_HOURS = {f"{hour:02}": hour * 3600 for hour in range(24)}
+_WHOLE_HOURS = {":00:00": None, ":00:00.000Z": 0} | {
+    f":00:00{suffix}": offset for suffix, offset in _OFFSETS.items()
+}
+
+
+class TimestampParser:
+    """
+    Converts API times to epoch seconds.  Times without offset are local time in tz.
+
+    Keeps two tables: the epoch seconds of UTC midnight per date, and of local midnight
+    per date - None for days with a DST change.  Both are filled on first use of a date.
+    """
+
+    def __init__(self, tz):
+        self.tz = tz
+        self._utc_days = {}
+        self._local_days = {}
+
+    def _utc_day(self, date_str):
+        epoch = self._utc_days.get(date_str)
+        if epoch is None:
+            epoch = (date.fromisoformat(date_str).toordinal() - _EPOCH_ORDINAL) * _DAY
+            self._utc_days[date_str] = epoch
+        return epoch
+
+    def _local_day(self, date_str):
+        if date_str in self._local_days:
+            return self._local_days[date_str]
+        day = date.fromisoformat(date_str)
+        midnight = datetime(day.year, day.month, day.day, tzinfo=self.tz)
+        epoch = int(midnight.timestamp())
+        # A day without DST change is 24 hours long, with the offset of midnight all day
+        next_day = date.fromordinal(day.toordinal() + 1)
+        next_midnight = datetime(
+            next_day.year, next_day.month, next_day.day, tzinfo=self.tz
+        )
+        if int(next_midnight.timestamp()) - epoch != _DAY:
+            epoch = None
+        self._local_days[date_str] = epoch
+        return epoch
+
+    def _slow(self, value, previous):
+        """Convert a time through datetime."""
+        time = datetime.fromisoformat(value)
+        if time.tzinfo is not None:
+            return int(time.timestamp())
+        timestamp = int(time.replace(tzinfo=self.tz).timestamp())
+        if previous is not None and timestamp <= previous:
+            # The hour repeated when DST ends - take the second occurrence
+            timestamp = int(time.replace(tzinfo=self.tz, fold=1).timestamp())
+        return timestamp
+
+    def to_epoch(self, value, previous=None):
+        """
+        Convert an API time to epoch seconds.
+
+        previous is the converted time before in the same response, if any.  It tells the
+        two occurrences of the hour repeated when DST ends apart.
+        """
+        length = len(value)
+        if length < 19 or value[10] != "T":
+            return self._slow(value, previous)
+        try:
+            seconds = (
+                int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19])
+            )
+        except ValueError:
+            return self._slow(value, previous)
+        suffix = value[19:]
+        if suffix[:1] == ".":
+            # Fraction of a second - dropped like int(datetime.timestamp()) does
+            suffix = suffix.lstrip(".0123456789")
+        if not suffix:
+            midnight = self._local_day(value[:10])
+            if midnight is None:
+                return self._slow(value, previous)
+            return midnight + seconds
+        offset = _OFFSETS.get(suffix)
+        if offset is None:
+            return self._slow(value, previous)
+        return self._utc_day(value[:10]) + seconds - offset
+
+    def to_epochs(self, values):
+        """Convert the times of one response to an array of epoch seconds."""
+        timestamps = array("q")
+        append = timestamps.append
+        local_days = self._local_days
+        utc_days = self._utc_days
+        timestamp = None
+        for value in values:
+            # Whole hours inline, with the day already in the table
+            hour = _HOURS.get(value[11:13])
+            if hour is not None and value[10:11] == "T":
+                rest = value[13:]
+                if rest in _WHOLE_HOURS:
+                    offset = _WHOLE_HOURS[rest]
+                    midnight = (
+                        local_days.get(value[:10])
+                        if offset is None
+                        else utc_days.get(value[:10])
+                    )
+                    if midnight is not None:
+                        timestamp = midnight + hour - (offset or 0)
+                        append(timestamp)
+                        continue
+            timestamp = self.to_epoch(value, timestamp)
+            append(timestamp)
+        return timestamps
+
+
+@lru_cache(maxsize=8)
+def parser_for(tz):
+    """Return the shared parser of a time zone, keeping its tables across responses."""
+    return TimestampParser(tz)
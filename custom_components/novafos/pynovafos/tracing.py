@@ -0,0 +1,62 @@
+"""
+Debug helpers which cost nothing unless they are used.
+
+LazyJson defers formatting a payload until a log record is actually emitted, and
+ResponseTrace keeps the latest raw API responses for diagnostics when enabled.
+"""
+
+from __future__ import annotations
+
+import json
+from collections import deque
+from datetime import UTC, datetime
+
+
+class LazyJson:
+    """Log argument formatting its payload as indented JSON only when the record is emitted."""
+
+    __slots__ = ("_payload",)
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def __str__(self):
+        return json.dumps(
+            self._payload, indent=4, sort_keys=True, ensure_ascii=False, default=str
+        )
+
+
+class ResponseTrace:
+    """
+    Bounded ring buffer of the latest raw API responses.
+
+    Disabled with size 0 (the default) - record() then does nothing and callers skip
+    collecting the bodies altogether by checking enabled first.
+    """
+
+    def __init__(self, size=0):
+        self._responses = deque(maxlen=max(0, size))
+
+    @property
+    def enabled(self):
+        return self._responses.maxlen > 0
+
+    def record(self, method, url, status, body):
+        """Keep a response.  The oldest response is dropped when the buffer is full."""
+        if not self.enabled:
+            return
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", errors="replace")
+        self._responses.append(
+            {
+                "time": datetime.now(UTC).isoformat(),
+                "method": method,
+                "url": url,
+                "status": status,
+                "body": body,
+            }
+        )
+
+    def as_list(self):
+        """Return the kept responses, oldest first."""
+        return list(self._responses)
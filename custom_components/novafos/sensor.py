@@ -105,7 +105,15 @@ class NovafosWaterSensor(CoordinatorEntity, SensorEntity):
         ):
             self._attrs["year_total"] = self.coordinator.data[1][
                 self.entity_description.sensor_type
-            ]["Data"][-1]["Value"]
+            ]["Data"][-1].value
+            # Percentage of the history retrieved while the first-time backfill runs
+            progress = self.coordinator.backfill_progress.get(
+                self.entity_description.sensor_type
+            )
+            if progress is None:
+                self._attrs.pop("backfill_progress", None)
+            else:
+                self._attrs["backfill_progress"] = round(100 * progress)
         #     self._attrs["last_valid_date"] = self.coordinator.data[self.entity_description.sensor_type][self.entity_description.key]["LastValidDate"]
         else:
             self._attrs = {}
@@ -0,0 +1,70 @@
+"""
+Benchmark of the API time conversion.
+
+Compares the per row conversion through datetime - as done before the parser module - with
+TimestampParser for a year of hourly local times.
+
+Run from the repository root:  python scripts/benchmark_timeparse.py
+"""
+
+from __future__ import annotations
+
+import sys
+import timeit
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+# pynovafos does not need Home Assistant - import it without the integration around it
+sys.path.insert(
+    0, str(Path(__file__).resolve().parent.parent / "custom_components" / "novafos")
+)
+
+from pynovafos.timeparse import TimestampParser
+
+TZ = ZoneInfo("Europe/Copenhagen")
+REPEAT = 5
+
+
+def per_row(values):
+    """The conversion before: a datetime per row, localised and converted."""
+    return [
+        int(datetime.fromisoformat(value).replace(tzinfo=TZ).timestamp())
+        for value in values
+    ]
+
+
+def main():
+    start = datetime(2024, 1, 1, tzinfo=ZoneInfo("UTC"))
+    values = [
+        (start + timedelta(hours=hour)).astimezone(TZ).replace(tzinfo=None).isoformat()
+        for hour in range(366 * 24)
+    ]
+    offset_values = [
+        (start + timedelta(hours=hour)).astimezone(TZ).isoformat()
+        for hour in range(366 * 24)
+    ]
+
+    cases = {
+        "datetime per row (local)": lambda: per_row(values),
+        "TimestampParser, cold (local)": lambda: TimestampParser(TZ).to_epochs(values),
+        "TimestampParser, warm (local)": lambda: parser.to_epochs(values),
+        "datetime per row (+01:00/+02:00)": lambda: [
+            int(datetime.fromisoformat(value).timestamp()) for value in offset_values
+        ],
+        "TimestampParser (+01:00/+02:00)": lambda: parser.to_epochs(offset_values),
+    }
+    parser = TimestampParser(TZ)
+    parser.to_epochs(values)
+
+    print(f"{len(values)} hourly times, best of {REPEAT}")
+    baseline = None
+    for name, case in cases.items():
+        seconds = min(timeit.repeat(case, number=1, repeat=REPEAT))
+        if baseline is None:
+            baseline = seconds
+        print(f"  {name:36} {seconds * 1000:8.2f} ms  {baseline / seconds:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# import pytest
+import asyncio
+from datetime import datetime, timedelta
+import json
+import random
+import string
+from zoneinfo import ZoneInfo
+
+import aiohttp
+
+from custom_components.novafos import AsyncNovafos
+from custom_components.novafos.pynovafos.resilience import Deadline, RetryPolicy
+import tests.utils
+
+
+TZ = ZoneInfo("Europe/Copenhagen")
+
+
+class StreamedResponse:
+    """Stands in for an aiohttp response streaming a JSON body in small chunks."""
+
+    def __init__(self, response_json, chunk_size=97):
+        self._body = json.dumps(response_json).encode("utf-8")
+        self._chunk_size = chunk_size
+        self.content = self
+
+    async def iter_chunked(self, size):
+        for start in range(0, len(self._body), self._chunk_size):
+            yield self._body[start : start + self._chunk_size]
+
+
+def streamed(*responses_json):
+    """Answer _request_json calls reading streamed responses with the given bodies, in order."""
+    responses = iter(responses_json)
+
+    async def request_json(method, url, read=None, **kwargs):
+        return await read(StreamedResponse(next(responses)))
+
+    return request_json
+
+
+async def test_async_authenticate_using_access_token_ok(mocker):
+    novafos = AsyncNovafos(timezone="Europe/Copenhagen")
+    mocker.patch.object(
+        novafos,
+        "_request_json",
+        side_effect=[
+            {"Customers": [{"Id": 22345678, "Number": 1234567.8}]},
+            tests.utils.load_data_structure("active_meters_water_and_heating.json"),
+        ],
+    )
+
+    rand = random.SystemRandom()
+    access_token = "".join(rand.choices(string.ascii_letters + string.digits, k=1200))
+    access_token_date_updated = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    assert (
+        await novafos.authenticate_using_access_token(
+            access_token, access_token_date_updated
+        )
+        is True
+    )
+    assert novafos._customer_id == "22345678"
+    assert [meter.type for meter in novafos.get_meter_types()] == [
+        "water",
+        "heating",
+    ]
+    await novafos.close()
+
+
+async def test_async_get_all_consumption_timeseries(mocker):
+    """The async client returns the same data as the blocking one."""
+    novafos = AsyncNovafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water_and_heating.json")
+    )
+    mocker.patch.object(
+        novafos,
+        "_request_json",
+        side_effect=streamed(
+            tests.utils.load_data_structure("consumption_hour_data_water_zoom_3.json"),
+            tests.utils.load_data_structure(
+                "consumption_hour_data_heating_zoom_3.json"
+            ),
+        ),
+    )
+
+    actuals = await novafos._get_all_consumption_timeseries(
+        "2024-12-01", "2024-12-31", 3
+    )
+    assert [series["type"] for series in actuals] == ["water", "heating"]
+    assert actuals[0]["Extra"].sum == 0.026
+    assert actuals[1]["Extra"].sum == 10.026
+    assert len(actuals[0]["Data"]) == 24
+
+
+async def test_async_get_statistics_chronological(mocker):
+    """Windows fetched concurrently are stored in chronological order."""
+    novafos = AsyncNovafos(timezone="Europe/Copenhagen", window_days=2)
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water_and_heating.json")
+    )
+
+    async def request_json(method, url, read=None, json=None, **kwargs):
+        first_day = datetime.fromisoformat(json["DateFrom"]).astimezone(TZ).date()
+        last_day = datetime.fromisoformat(json["DateTo"]).astimezone(TZ).date()
+        # Finish the windows in random order
+        await asyncio.sleep(random.uniform(0, 0.01))
+        rows = [
+            {
+                "DateFrom": f"{first_day + timedelta(days=day)}T{hour:02}:00:00",
+                "DateTo": f"{first_day + timedelta(days=day)}T{hour:02}:59:59",
+                "Value": 0.001,
+            }
+            for day in range((last_day - first_day).days + 1)
+            for hour in range(24)
+        ]
+        total = {"Value": 0.0}
+        return await read(
+            StreamedResponse(
+                {
+                    "Series": [{"Data": rows}],
+                    "Total": total,
+                    "Average": total,
+                    "Maximum": total,
+                    "Minimum": total,
+                }
+            )
+        )
+
+    mocker.patch.object(novafos, "_request_json", side_effect=request_json)
+
+    await novafos.get_statistics(from_date=datetime.now() - timedelta(days=10))
+    for meter_type in ("water", "heating"):
+        dates = [row.date_from for row in novafos._meter_data[meter_type].to_rows()]
+        assert len(dates) == 10 * 24
+        assert dates == sorted(dates)
+
+
+async def test_async_overlapping_deadlines():
+    """Calls overlapping on one client each keep their own deadline."""
+    novafos = AsyncNovafos(timezone="Europe/Copenhagen")
+    expired = Deadline(0)
+    running = Deadline(60)
+
+    async def scoped(deadline, delay):
+        with novafos._deadline_scope(deadline):
+            await asyncio.sleep(delay)
+            return novafos._deadline
+
+    # The first call leaves its scope while the second is still in its own
+    assert await asyncio.gather(scoped(expired, 0.01), scoped(running, 0.02)) == [
+        expired,
+        running,
+    ]
+    assert novafos._deadline is None
+    novafos._check_deadline()
+
+
+class SessionResponse(StreamedResponse):
+    """A streamed response as the aiohttp session hands it out.  If drop is set, the
+    connection drops half way through the body."""
+
+    status = 200
+    url = "https://easy-energy-plugin-api.kmd.dk"
+
+    def __init__(self, response_json, drop=False):
+        super().__init__(response_json)
+        self._drop = drop
+
+    def raise_for_status(self):
+        pass
+
+    async def iter_chunked(self, size):
+        if not self._drop:
+            yield self._body
+            return
+        yield self._body[: len(self._body) // 2]
+        raise aiohttp.ClientPayloadError("Response payload is not completed")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+async def test_async_dropped_body_retried(mocker):
+    """A connection dropped while the body streams in is retried like other network errors."""
+    body = tests.utils.load_data_structure("consumption_hour_data_water_zoom_3.json")
+    session = mocker.Mock()
+    session.request.side_effect = [
+        SessionResponse(body, drop=True),
+        SessionResponse(body),
+    ]
+    novafos = AsyncNovafos(
+        timezone="Europe/Copenhagen",
+        session=session,
+        retry_policy=RetryPolicy(base=0.0),
+    )
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+
+    series = await novafos._get_consumption_timeseries(
+        novafos.get_meter_types()[0], "2024-11-30T23:00:00Z", "2024-12-01T22:59:59Z", 3
+    )
+    assert session.request.call_count == 2
+    assert len(series["Data"]) == 24
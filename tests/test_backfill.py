@@ -0,0 +1,48 @@
+# import pytest
+from datetime import datetime
+import json
+from zoneinfo import ZoneInfo
+
+from custom_components.novafos import Novafos
+from custom_components.novafos.pynovafos.backfill import BackfillCheckpoints
+import tests.utils
+
+
+TZ = ZoneInfo("Europe/Copenhagen")
+
+
+def test_backfill_checkpoints(mocker):
+    """The backfill continues from the first window not completely imported."""
+    tests.utils.freeze_now(mocker, datetime(2024, 3, 5, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen", window_days=10)
+    novafos.start_backfill("water", datetime(2024, 1, 25))
+    assert novafos.backfill.dirty
+    assert novafos.backfill.resume_from("water") == datetime(2024, 1, 25)
+    assert novafos.backfill.get("water").last_hour is None
+    assert novafos.backfill.progress("water") == 0.0
+
+    # Imported until 2024-02-11T05:00:00+01:00
+    last_hour = int(datetime(2024, 2, 11, 5, tzinfo=TZ).timestamp())
+    novafos.backfill.advance("water", last_hour, 12.5, TZ)
+    checkpoint = novafos.backfill.get("water")
+    assert checkpoint.sum == 12.5
+    assert checkpoint.windows == [
+        ("2024-02-11", "2024-02-20"),
+        ("2024-02-21", "2024-02-29"),
+        ("2024-03-01", "2024-03-04"),
+    ]
+    assert novafos.backfill.resume_from("water") == datetime(2024, 2, 11)
+    # 23 of the 40 days are left
+    assert novafos.backfill.progress("water") == 1.0 - 23 / 40
+
+    # Stored as JSON by the Home Assistant storage helper
+    restored = BackfillCheckpoints()
+    restored.load(json.loads(json.dumps(novafos.backfill.to_dict())))
+    assert not novafos.backfill.dirty
+    assert restored.get("water") == checkpoint
+
+    restored.finish("water")
+    assert restored.dirty
+    assert restored.get("water") is None
+    assert restored.resume_from("water") is None
+    assert restored.progress("water") is None
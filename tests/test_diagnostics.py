@@ -0,0 +1,95 @@
+# import pytest
+import json
+
+from custom_components.novafos import Novafos
+from custom_components.novafos.const import DOMAIN
+from custom_components.novafos.diagnostics import async_get_config_entry_diagnostics
+import tests.utils
+
+
+PROFILE = b"""
+{
+    "Customers": [
+        {
+            "City": "1000 MyTown",
+            "ContactInfos": [{"Type": 0, "Value": "my@email.com"}],
+            "FullName": "John Doe",
+            "Id": 12345678,
+            "Number": 1234567.8,
+            "StreetAddress": "Small Street 123"
+        }
+    ],
+    "ProfileId": "abcdefff-0000-1234-9090-121212121212"
+}
+"""
+
+
+async def test_diagnostics_redact_traced_bodies(mocker):
+    """The customer and meter identifiers are redacted from the traced responses."""
+    novafos = Novafos(timezone="Europe/Copenhagen", trace_responses=5)
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    novafos.trace.record("GET", "https://example/api/profile/get", 200, PROFILE)
+    novafos.trace.record(
+        "POST",
+        "https://example/api/meter/customerActiveMeters",
+        200,
+        tests.utils.load_data("active_meters_water.json"),
+    )
+    novafos.trace.record("GET", "https://example", 502, b"Bad Gateway")
+
+    coordinator = mocker.MagicMock(api=novafos, statistics_pending=False)
+    hass = mocker.MagicMock()
+    hass.data = {DOMAIN: {"entry": {"coordinator": coordinator}}}
+    entry = mocker.MagicMock(entry_id="entry", data={}, options={"access_token": "x"})
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert diagnostics["entry"]["options"]["access_token"] == "**REDACTED**"
+    profile, meters, error = diagnostics["responses"]
+    customer = profile["body"]["Customers"][0]
+    for key in ("City", "ContactInfos", "FullName", "Id", "Number", "StreetAddress"):
+        assert customer[key] == "**REDACTED**"
+    assert profile["body"]["ProfileId"] == "**REDACTED**"
+    assert meters["body"][0]["InstallationId"] == "**REDACTED**"
+    assert meters["body"][0]["MeasurementPointId"] == "**REDACTED**"
+    assert meters["body"][0]["ConsumptionTypeId"] == 6
+    assert error["body"] == "Bad Gateway"
+    # The trace itself is left as it is
+    assert "12345678" in novafos.trace.as_list()[0]["body"]
+
+
+async def test_diagnostics_without_identifiers(mocker):
+    """No customer or meter identifier appears anywhere in the diagnostics."""
+    novafos = Novafos(timezone="Europe/Copenhagen", trace_responses=5)
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water_and_heating.json")
+    )
+    novafos.trace.record("GET", "https://example/api/profile/get", 200, PROFILE)
+    novafos.trace.record(
+        "POST",
+        "https://example/api/meter/customerActiveMeters",
+        200,
+        tests.utils.load_data("active_meters_water_and_heating.json"),
+    )
+    identifiers = {"12345678", "1234567.8", "abcdefff-0000-1234-9090-121212121212"}
+    for meter_device in novafos.get_meter_types():
+        identifiers.add(str(meter_device.installation_id))
+        identifiers.add(str(meter_device.measurement_point_id))
+
+    coordinator = mocker.MagicMock(
+        api=novafos, statistics_pending=False, backfill_progress={}
+    )
+    hass = mocker.MagicMock()
+    hass.data = {DOMAIN: {"entry": {"coordinator": coordinator}}}
+    entry = mocker.MagicMock(
+        entry_id="entry",
+        data={"name": "Novafos", "use_grouped_sensors": True},
+        options={"access_token": "x", "access_token_date_updated": ""},
+    )
+
+    diagnostics = await async_get_config_entry_diagnostics(hass, entry)
+    assert [meter["type"] for meter in diagnostics["meters"]] == ["water", "heating"]
+    dump = json.dumps(diagnostics)
+    for identifier in identifiers:
+        assert identifier not in dump
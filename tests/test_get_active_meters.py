@@ -1,9 +1,12 @@
 # import pytest
+import json
 import requests
+from custom_components.novafos import Novafos
+import tests.utils
 
 
 def test_get_inactive_meters_water_and_heating(mocker, novafos):
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = """
@@ -49,7 +52,7 @@ def test_get_inactive_meters_water_and_heating(mocker, novafos):
 
 
 def test_get_active_meters_water_ok(mocker, data_regression, novafos):
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = """
@@ -88,11 +91,11 @@ def test_get_active_meters_water_ok(mocker, data_regression, novafos):
     mock_post.return_value = mock_response
     novafos._get_active_meters()
     # On first run create a yaml file with data from the data structure. Subsequently check against this file.
-    data_regression.check(novafos._active_meters)
+    data_regression.check(tests.utils.as_plain(novafos._active_meters))
 
 
 def test_get_active_meters_heating_ok(mocker, data_regression, novafos):
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = """
@@ -131,12 +134,12 @@ def test_get_active_meters_heating_ok(mocker, data_regression, novafos):
     mock_post.return_value = mock_response
     novafos._get_active_meters()
     # On first run create a yaml file with data from the data structure. Subsequently check against this file.
-    data_regression.check(novafos._active_meters)
+    data_regression.check(tests.utils.as_plain(novafos._active_meters))
 
 
 # @pytest.mark.skip(reason="Need some data to test what is necessary here.")
 def test_get_active_meters_water_and_heating_ok(mocker, data_regression, novafos):
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = """
@@ -176,9 +179,36 @@ def test_get_active_meters_water_and_heating_ok(mocker, data_regression, novafos
     mock_post.return_value = mock_response
     novafos._get_active_meters()
     # On first run create a yaml file with data from the data structure. Subsequently check against this file.
-    data_regression.check(novafos._active_meters)
+    data_regression.check(tests.utils.as_plain(novafos._active_meters))
 
 
 def test_get_meter_types(mocker, data_regression, novafos):
     novafos._active_meters = "Return me"
     assert novafos.get_meter_types() == "Return me"
+
+
+def test_metadata_round_trip():
+    """The stored profile and meters set up the meters without reaching the API."""
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_customer_profile({"Customers": [{"Id": 1234, "Number": 5678}]})
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water_and_heating.json")
+    )
+    assert novafos.metadata_dirty
+
+    stored = novafos.metadata_to_dict()
+    assert not novafos.metadata_dirty
+    # The same profile and meters again are no change
+    novafos._parse_customer_profile({"Customers": [{"Id": 1234, "Number": 5678}]})
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water_and_heating.json")
+    )
+    assert not novafos.metadata_dirty
+
+    restored = Novafos(timezone="Europe/Copenhagen")
+    # Stored as JSON by the Home Assistant storage helper
+    restored.load_metadata(json.loads(json.dumps(stored)))
+    assert restored.get_meter_types() == novafos.get_meter_types()
+    assert list(restored._meter_data) == ["water", "heating"]
+    assert restored._session.headers["Customer-Id"] == "1234"
+    assert not restored.metadata_dirty
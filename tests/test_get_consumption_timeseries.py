@@ -1,10 +1,11 @@
 # import pytest
 import requests
+from custom_components.novafos import Novafos
 import tests.utils
 
 
 def prepare_active_meters(mocker, novafos):
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = tests.utils.load_data(
@@ -18,38 +19,73 @@ def prepare_active_meters(mocker, novafos):
 def test_get_compsumption_timeseries(mocker, data_regression, novafos):
     prepare_active_meters(mocker, novafos)
 
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = tests.utils.load_data(
         "consumption_hour_data_water_zoom_3.json"
     )
+    mock_response._content_consumed = True
     mock_post.return_value = mock_response
 
     actuals = novafos._get_consumption_timeseries(
         novafos._active_meters[0], "2024-12-01", "2024-12-31"
     )
-    data_regression.check(actuals)
+    data_regression.check(tests.utils.as_plain(actuals))
 
 
 # @pytest.mark.skip(reason="Need some data to test what is necessary here.")
 def test_get_all_compsumption_timeseries(mocker, data_regression, novafos):
     prepare_active_meters(mocker, novafos)
 
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response_1 = requests.Response()
     mock_response_1.status_code = 200
     mock_response_1._content = tests.utils.load_data(
         "consumption_hour_data_water_zoom_3.json"
     )
+    mock_response_1._content_consumed = True
 
     mock_response_2 = requests.Response()
     mock_response_2.status_code = 200
     mock_response_2._content = tests.utils.load_data(
         "consumption_hour_data_heating_zoom_3.json"
     )
+    mock_response_2._content_consumed = True
 
-    mock_post.side_effect = [mock_response_1, mock_response_2]
+    # Meters are fetched concurrently - answer by meter instead of by call order
+    responses = {66774455: mock_response_1, 44556677: mock_response_2}
+    mock_post.side_effect = lambda url, json, **kwargs: responses[
+        json["MeasurementPointId"]
+    ]
 
     actuals = novafos._get_all_consumption_timeseries("2024-12-01", "2024-12-31", 3)
-    data_regression.check(actuals)
+    data_regression.check(tests.utils.as_plain(actuals))
+
+
+def test_get_all_compsumption_timeseries_one_meter_fails(mocker):
+    """A failing meter does not throw away the data of the other meters."""
+    # Fresh instance - the shared one has the heating data cached
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    prepare_active_meters(mocker, novafos)
+
+    mock_response = requests.Response()
+    mock_response.status_code = 200
+    mock_response._content = tests.utils.load_data(
+        "consumption_hour_data_water_zoom_3.json"
+    )
+    mock_response._content_consumed = True
+
+    def post(url, json, **kwargs):
+        if json["MeasurementPointId"] == 44556677:
+            raise requests.exceptions.ConnectionError("Heating meter is down")
+        return mock_response
+
+    mocker.patch("requests.Session.post", side_effect=post)
+    # Skip the backoff of the retries
+    mocker.patch("time.sleep")
+
+    actuals = novafos._get_all_consumption_timeseries("2024-12-01", "2024-12-31", 3)
+    assert [series["type"] for series in actuals] == ["water", "heating"]
+    assert len(actuals[0]["Data"]) == 24
+    assert actuals[1]["Data"] == []
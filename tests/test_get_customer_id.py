@@ -3,7 +3,7 @@ import requests
 
 
 def test_get_customer_id_ok(caplog, mocker, novafos):
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("requests.Session.get")
     mock_response = requests.Response()
     mock_response.status_code = 200
     # mock_response._content = b'{"key1": "value1", "key2": 123}'
@@ -53,7 +53,7 @@ def test_get_customer_id_ok(caplog, mocker, novafos):
 
 
 def test_get_customer_id_minimal_data_ok(caplog, mocker, novafos):
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("requests.Session.get")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = b"""
@@ -74,7 +74,7 @@ def test_get_customer_id_minimal_data_ok(caplog, mocker, novafos):
 
 
 def test_get_customer_id_exception_on_no_id_field(caplog, mocker, novafos):
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("requests.Session.get")
     mock_response = requests.Response()
     mock_response.status_code = 200
     # Customer id does not contain the right fields
@@ -96,7 +96,7 @@ def test_get_customer_id_exception_on_no_id_field(caplog, mocker, novafos):
 
 
 def test_get_customer_id_exception_on_no_number_field(caplog, mocker, novafos):
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("requests.Session.get")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = b"""
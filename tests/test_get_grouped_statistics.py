@@ -1,10 +1,18 @@
-# imoprt pytest
+import pytest
 import tests.utils
 
 
+@pytest.fixture(autouse=True, params=[True, False], ids=["numpy", "python"])
+def vectorized(request, mocker):
+    """Check both the NumPy and the pure Python rollups."""
+    mocker.patch("custom_components.novafos.pynovafos.rollup.VECTORIZED", request.param)
+
+
 # @pytest.mark.skip(reason="Skipped")
 def test_grouped_statistics_day(mocker, novafos):
-    novafos._meter_data = tests.utils.load_data_structure("meter_data_small.json")
+    novafos._meter_data = tests.utils.load_meter_data(
+        "meter_data_small.json", novafos.tz
+    )
 
     expected = [
         ("2024-01-01", 0.168, 0.168, 0.168, 0.168, 0.168),
@@ -23,7 +31,9 @@ def test_grouped_statistics_day(mocker, novafos):
 
 # @pytest.mark.skip(reason="Skipped")
 def test_grouped_statistics_week(data_regression, novafos):
-    novafos._meter_data = tests.utils.load_data_structure("meter_data_medium.json")
+    novafos._meter_data = tests.utils.load_meter_data(
+        "meter_data_medium.json", novafos.tz
+    )
     expected = [
         ("2024-01-01", 1.801, 0.0, 1.801, 1.801, 1.801),
         ("2024-01-08", 1.96, 0.159, 1.801, 1.96, 1.881),
@@ -37,7 +47,7 @@ def test_grouped_statistics_week(data_regression, novafos):
         ("2024-03-04", 3.529, 1.117, 2.412, 3.529, 2.97),
         ("2024-03-11", 3.103, -0.426, 3.103, 3.529, 3.316),
         ("2024-03-18", 3.13, 0.027, 3.103, 3.13, 3.117),
-        ("2024-03-25", 3.202, 0.072, 3.13, 3.202, 3.166),
+        ("2024-03-25", 3.965, 0.835, 3.13, 3.965, 3.547),
     ]
     assert (
         novafos.get_grouped_statistics(meter_type="water", grouping="week") == expected
@@ -46,12 +56,14 @@ def test_grouped_statistics_week(data_regression, novafos):
 
 # @pytest.mark.skip(reason="Skipped")
 def test_grouped_statistics_month(data_regression, novafos):
-    novafos._meter_data = tests.utils.load_data_structure("meter_data_large.json")
+    novafos._meter_data = tests.utils.load_meter_data(
+        "meter_data_large.json", novafos.tz
+    )
     expected = [
         ("2024-01-31", 8.604, 0.0, 8.604, 8.604, 8.604),
         ("2024-02-29", 8.336, -0.268, 8.336, 8.604, 8.47),
-        ("2024-03-31", 14.125, 5.789, 8.336, 14.125, 11.23),
-        ("2024-04-30", 10.416, -3.709, 10.416, 14.125, 12.271),
+        ("2024-03-31", 14.888, 6.552, 8.336, 14.888, 11.612),
+        ("2024-04-30", 10.416, -4.472, 10.416, 14.888, 12.652),
         ("2024-05-31", 13.62, 3.204, 10.416, 13.62, 12.018),
         ("2024-06-30", 11.472, -2.148, 11.472, 13.62, 12.546),
         ("2024-07-31", 7.59, -3.882, 7.59, 11.472, 9.531),
@@ -69,11 +81,38 @@ def test_grouped_statistics_month(data_regression, novafos):
 
 # @pytest.mark.skip(reason="Skipped")
 def test_grouped_statistics_year(data_regression, novafos):
-    novafos._meter_data = tests.utils.load_data_structure("meter_data_large.json")
+    novafos._meter_data = tests.utils.load_meter_data(
+        "meter_data_large.json", novafos.tz
+    )
     expected = [
-        ("2024-01-01", 138.734, 0.0, 138.734, 138.734, 138.734),
-        ("2025-01-01", 2.244, -136.49, 2.244, 138.734, 70.489),
+        ("2024-01-01", 139.497, 0.0, 139.497, 139.497, 139.497),
+        ("2025-01-01", 2.244, -137.253, 2.244, 139.497, 70.871),
     ]
     assert (
         novafos.get_grouped_statistics(meter_type="water", grouping="year") == expected
     )
+
+
+def test_grouped_statistics_all_at_once(novafos):
+    novafos._meter_data = tests.utils.load_meter_data(
+        "meter_data_large.json", novafos.tz
+    )
+    rollups = novafos.get_rollups(meter_type="water")
+    assert list(rollups) == ["day", "week", "month", "year"]
+    for grouping, stats in rollups.items():
+        assert stats == novafos.get_grouped_statistics(
+            meter_type="water", grouping=grouping
+        )
+
+
+def test_grouped_statistics_no_complete_day(novafos):
+    novafos._meter_data = tests.utils.load_meter_data(
+        "meter_data_small.json", novafos.tz
+    )
+    novafos._meter_data["water"] = novafos._meter_data["water"][:23]
+    assert novafos.get_rollups(meter_type="water") == {
+        "day": [],
+        "week": [],
+        "month": [],
+        "year": [],
+    }
@@ -1,9 +1,15 @@
 # import pytest
+import json
 import requests
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from custom_components.novafos import Novafos
 import tests.utils
 
 
+TZ = ZoneInfo("Europe/Copenhagen")
+
+
 # Test cases:
 # _get_statistics(self, days_back = None, from_date = None)
 # get_statistics(self, from_date = None):
@@ -12,7 +18,7 @@ import tests.utils
 
 
 def prepare_active_meter(mocker, novafos):
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = tests.utils.load_data("active_meters_water.json")
@@ -21,7 +27,7 @@ def prepare_active_meter(mocker, novafos):
 
 
 def prepare_active_meters(mocker, novafos):
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = tests.utils.load_data(
@@ -36,18 +42,20 @@ def prepare_active_meters(mocker, novafos):
 def test_get_statistics_single(mocker, novafos):
     prepare_active_meter(mocker, novafos)
 
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response_1 = requests.Response()
     mock_response_1.status_code = 200
     mock_response_1._content = tests.utils.load_data(
         "consumption_hour_data_water_zoom_3.json"
     )
+    mock_response_1._content_consumed = True
 
     mock_response_2 = requests.Response()
     mock_response_2.status_code = 200
     mock_response_2._content = tests.utils.load_data(
         "consumption_hour_data_heating_zoom_3.json"
     )
+    mock_response_2._content_consumed = True
 
     mock_post.side_effect = [mock_response_1, mock_response_2]
 
@@ -58,21 +66,272 @@ def test_get_statistics_single(mocker, novafos):
 def test_statistics(mocker, data_regression, novafos) -> None:
     prepare_active_meter(mocker, novafos)
 
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response_1 = requests.Response()
     mock_response_1.status_code = 200
     mock_response_1._content = tests.utils.load_data(
         "consumption_hour_data_water_zoom_3.json"
     )
+    mock_response_1._content_consumed = True
 
     mock_response_2 = requests.Response()
     mock_response_2.status_code = 200
     mock_response_2._content = tests.utils.load_data(
         "consumption_hour_data_heating_zoom_3.json"
     )
+    mock_response_2._content_consumed = True
 
     mock_post.side_effect = [mock_response_1, mock_response_2]
 
     from_date = datetime.now() - timedelta(days=1)
     novafos.get_statistics(from_date=from_date)
-    data_regression.check(novafos._meter_data)
+    data_regression.check(
+        {
+            meter_type: tests.utils.as_plain(series.to_rows())
+            for meter_type, series in novafos._meter_data.items()
+        }
+    )
+
+
+def hourly_response(request_data, max_days=None):
+    """Build a consumptionTimeSeries response with one row per local hour of the requested days.
+    The response is truncated to max_days days to mimic the API cutting a window short.
+    """
+    first_day = datetime.fromisoformat(request_data["DateFrom"]).astimezone(TZ).date()
+    last_day = datetime.fromisoformat(request_data["DateTo"]).astimezone(TZ).date()
+    days = (last_day - first_day).days + 1
+    if max_days is not None:
+        days = min(days, max_days)
+    rows = [
+        {
+            "DateFrom": f"{first_day + timedelta(days=day)}T{hour:02}:00:00",
+            "DateTo": f"{first_day + timedelta(days=day)}T{hour:02}:59:59",
+            "Value": 0.001,
+            "IsComplete": True,
+        }
+        for day in range(days)
+        for hour in range(24)
+    ]
+    total = {"Value": 0.0}
+    mock_response = requests.Response()
+    mock_response.status_code = 200
+    mock_response._content = json.dumps(
+        {
+            "Series": [{"Data": rows}],
+            "Total": total,
+            "Average": total,
+            "Maximum": total,
+            "Minimum": total,
+        }
+    ).encode("utf-8")
+    # Served like a streamed response
+    mock_response._content_consumed = True
+    return mock_response
+
+
+def test_statistics_window_split_on_truncation(mocker):
+    """A truncated multi-day window is split and refetched in halves."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen", window_days=31)
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    mock_post = mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: hourly_response(json, max_days=2),
+    )
+
+    novafos.get_statistics(from_date=datetime(2024, 12, 16))
+
+    # 4 days: the 4-day window is truncated, the two 2-day halves are not.
+    assert mock_post.call_count == 3
+    assert len(novafos._meter_data["water"]) == 4 * 24
+    timestamps = list(novafos._meter_data["water"].timestamps)
+    assert timestamps == sorted(timestamps)
+
+
+def test_statistics_window_matches_daily(mocker):
+    """Windowed fetching gives the same meter data as fetching one day at a time."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    from_date = datetime(2024, 12, 10)
+    meter_data = {}
+    call_count = {}
+    for window_days in (1, 31):
+        novafos = Novafos(timezone="Europe/Copenhagen", window_days=window_days)
+        novafos._parse_active_meters(
+            tests.utils.load_data_structure("active_meters_water_and_heating.json")
+        )
+        mock_post = mocker.patch(
+            "requests.Session.post",
+            side_effect=lambda url, json, **kwargs: hourly_response(json),
+        )
+        novafos.get_statistics(from_date=from_date)
+        meter_data[window_days] = novafos._meter_data
+        call_count[window_days] = mock_post.call_count
+
+    assert meter_data[1] == meter_data[31]
+    assert call_count[1] == 2 * 10
+    assert call_count[31] == 2
+
+
+def test_statistics_windows_follow_months(mocker):
+    """Windows start on the month grid, whatever the first day asked for."""
+    tests.utils.freeze_now(mocker, datetime(2024, 3, 5, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen", window_days=10)
+
+    windows = novafos._statistics_windows(datetime(2024, 1, 25, 8, 30))
+    assert [
+        (first.date().isoformat(), last.date().isoformat()) for first, last in windows
+    ] == [
+        ("2024-01-25", "2024-01-30"),
+        ("2024-01-31", "2024-01-31"),
+        ("2024-02-01", "2024-02-10"),
+        ("2024-02-11", "2024-02-20"),
+        ("2024-02-21", "2024-02-29"),
+        ("2024-03-01", "2024-03-04"),
+    ]
+
+
+def test_statistics_refetch_no_duplicates(mocker):
+    """Fetching overlapping days again replaces the hours instead of adding them."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: hourly_response(json),
+    )
+
+    novafos.get_statistics(from_date=datetime(2024, 12, 10))
+    data = novafos.get_statistics(from_date=datetime(2024, 12, 15, 13, 0))
+
+    assert len(novafos._meter_data["water"]) == 10 * 24
+    # Only the days asked for are returned
+    assert len(data["water"]) == 5 * 24
+    assert data["water"].to_rows()[0].date_from == "2024-12-15T00:00:00"
+
+
+def daily_response(request_data, complete_until):
+    """Build a Day zoom consumptionTimeSeries response, complete for the days before complete_until."""
+    first_day = datetime.fromisoformat(request_data["DateFrom"]).astimezone(TZ).date()
+    last_day = datetime.fromisoformat(request_data["DateTo"]).astimezone(TZ).date()
+    rows = [
+        {
+            "DateFrom": f"{first_day + timedelta(days=day)}T00:00:00+01:00",
+            "DateTo": f"{first_day + timedelta(days=day)}T23:59:59+01:00",
+            "Value": 1.0 + day,
+            "IsComplete": first_day + timedelta(days=day) < complete_until,
+        }
+        for day in range((last_day - first_day).days + 1)
+    ]
+    total = {"Value": 0.0}
+    mock_response = requests.Response()
+    mock_response.status_code = 200
+    mock_response._content = json.dumps(
+        {
+            "Series": [{"Data": rows}],
+            "Total": total,
+            "Average": total,
+            "Maximum": total,
+            "Minimum": total,
+        }
+    ).encode("utf-8")
+    mock_response._content_consumed = True
+    return mock_response
+
+
+def test_day_summaries(mocker):
+    """The days the API flags complete are kept and used by the rollups."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    # No hourly data to start from
+    assert novafos.get_day_summaries() == {}
+
+    mock_post = mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: daily_response(
+            json, complete_until=date(2024, 12, 18)
+        ),
+    )
+    day_sums = novafos.get_day_summaries(from_date=datetime(2024, 12, 10))
+
+    assert mock_post.call_args.kwargs["json"]["ZoomLevel"] == 2
+    assert day_sums["water"] == {
+        date(2024, 12, 10) + timedelta(days=day): 1.0 + day for day in range(8)
+    }
+    # No hourly data, yet the summarised days are grouped
+    assert [stat[:2] for stat in novafos.get_grouped_statistics("water", "week")] == [
+        ("2024-12-09", 21.0),
+        ("2024-12-16", 15.0),
+    ]
+
+
+def test_statistics_hybrid_zoom(mocker):
+    """Only the latest hourly_days days are retrieved hourly, the days before as daily summaries."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen", hourly_days=5)
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    mock_post = mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: (
+            daily_response(json, complete_until=date(2024, 12, 20))
+            if json["ZoomLevel"] == 2
+            else hourly_response(json)
+        ),
+    )
+
+    data = novafos.get_statistics(from_date=datetime(2024, 12, 10))
+
+    assert [call.kwargs["json"]["ZoomLevel"] for call in mock_post.call_args_list] == [
+        2,
+        3,
+    ]
+    assert len(data["water"]) == 5 * 24
+    assert data["water"].to_rows()[0].date_from == "2024-12-15T00:00:00"
+    assert sorted(novafos._day_sums["water"]) == [
+        date(2024, 12, 10) + timedelta(days=day) for day in range(5)
+    ]
+    # The rollups cover the summarised and the hourly days
+    weeks = novafos.get_grouped_statistics("water", "week")
+    assert [stat.date for stat in weeks] == ["2024-12-09", "2024-12-16"]
+    # Summaries of 12-10 to 12-14 and the hours of Sunday 12-15, then 4 hourly days
+    assert [round(stat.sum, 3) for stat in weeks] == [15.024, 0.096]
+
+
+def test_statistics_hybrid_zoom_pending(mocker):
+    """Daily summaries not retrieved leave the days pending - the hours after them are not retrieved."""
+    mocker.patch("time.sleep")
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen", hourly_days=5)
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    failed = requests.Response()
+    failed.status_code = 503
+    failed._content = b""
+    failed._content_consumed = True
+    mock_post = mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: (
+            failed if json["ZoomLevel"] == 2 else hourly_response(json)
+        ),
+    )
+
+    # The backfill covers the summarised days too
+    novafos.start_backfill("water", datetime(2024, 12, 10))
+    assert novafos.backfill.resume_from("water") == datetime(2024, 12, 10)
+
+    data = novafos.get_statistics(from_date=datetime(2024, 12, 10))
+
+    assert novafos.statistics_pending
+    assert not data["water"]
+    assert all(
+        call.kwargs["json"]["ZoomLevel"] == 2 for call in mock_post.call_args_list
+    )
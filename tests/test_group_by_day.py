@@ -1,10 +1,18 @@
-# import pytest
+import pytest
 import tests.utils
 
 
+@pytest.fixture(autouse=True, params=[True, False], ids=["numpy", "python"])
+def vectorized(request, mocker):
+    """Check both the NumPy and the pure Python rollups."""
+    mocker.patch("custom_components.novafos.pynovafos.rollup.VECTORIZED", request.param)
+
+
 # @pytest.mark.skip(reason="Skipped")
 def test_group_by_day(mocker, novafos):
-    novafos._meter_data = tests.utils.load_data_structure("meter_data_small.json")
+    novafos._meter_data = tests.utils.load_meter_data(
+        "meter_data_small.json", novafos.tz
+    )
 
     expected = [
         ("2024-01-01", 0.168, 0.168, 0.168, 0.168, 0.168),
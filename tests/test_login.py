@@ -1,7 +1,11 @@
 from datetime import datetime
+import json
 import random
 import string
 import requests
+from custom_components.novafos import Novafos
+from custom_components.novafos.pynovafos.novafos import LoginFailed
+import tests.utils
 
 
 def test_login_using_access_token_too_short(novafos):
@@ -24,7 +28,7 @@ def test_login_using_access_token_out_of_date(novafos):
 
 
 def test_login_using_access_token_ok(mocker, novafos):
-    mock_get = mocker.patch("requests.get")
+    mock_get = mocker.patch("requests.Session.get")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = b"""
@@ -61,7 +65,7 @@ def test_login_using_access_token_ok(mocker, novafos):
     """
     mock_get.return_value = mock_response
 
-    mock_post = mocker.patch("requests.post")
+    mock_post = mocker.patch("requests.Session.post")
     mock_response = requests.Response()
     mock_response.status_code = 200
     mock_response._content = """
@@ -107,3 +111,63 @@ def test_login_using_access_token_ok(mocker, novafos):
         novafos.authenticate_using_access_token(access_token, access_token_date_updated)
         is True
     )
+    # The pooled session carries the credentials as default headers
+    assert novafos._session.headers["Authorization"] == "Bearer " + access_token
+    assert novafos._session.headers["Customer-Id"] == "12345678"
+    assert novafos._session.headers["Customer-Number"] == "1234567.8"
+
+
+def test_login_reuses_profile_and_meters(mocker):
+    """The profile and meters are retrieved again after the TTL, with a new token or after a 401."""
+    novafos = Novafos(timezone="Europe/Copenhagen", metadata_ttl=3600)
+    mock_get = mocker.patch("requests.Session.get")
+    mock_get.return_value = requests.Response()
+    mock_get.return_value.status_code = 200
+    mock_get.return_value._content = b'{"Customers": [{"Id": 12345678, "Number": 1}]}'
+    mock_post = mocker.patch("requests.Session.post")
+    mock_post.return_value = requests.Response()
+    mock_post.return_value.status_code = 200
+    mock_post.return_value._content = json.dumps(
+        tests.utils.load_data_structure("active_meters_water.json")
+    ).encode()
+    mock_time = mocker.patch("time.time", return_value=1000.0)
+
+    rand = random.SystemRandom()
+    access_token = "".join(rand.choices(string.ascii_letters + string.digits, k=1200))
+    access_token_date_updated = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+    assert novafos.authenticate_using_access_token(
+        access_token, access_token_date_updated
+    )
+    novafos._meter_data["water"].append(1733007600, 0.5)
+    assert novafos.authenticate_using_access_token(
+        access_token, access_token_date_updated
+    )
+    assert (mock_get.call_count, mock_post.call_count) == (1, 1)
+
+    # Retrieved again once the TTL passed - the meter data is kept
+    mock_time.return_value = 1000.0 + 3600
+    assert novafos.authenticate_using_access_token(
+        access_token, access_token_date_updated
+    )
+    assert (mock_get.call_count, mock_post.call_count) == (2, 2)
+    assert len(novafos._meter_data["water"]) == 1
+
+    # A new access token
+    access_token = access_token[1:] + "x"
+    assert novafos.authenticate_using_access_token(
+        access_token, access_token_date_updated
+    )
+    assert (mock_get.call_count, mock_post.call_count) == (3, 3)
+
+    # The API rejected the access token
+    rejected = requests.Response()
+    rejected.status_code = 401
+    try:
+        novafos._raise_for_status(rejected, "testing")
+        assert False
+    except LoginFailed:
+        pass
+    assert novafos.authenticate_using_access_token(
+        access_token, access_token_date_updated
+    )
+    assert (mock_get.call_count, mock_post.call_count) == (4, 4)
@@ -0,0 +1,235 @@
+# import pytest
+from datetime import datetime
+import requests
+
+from custom_components.novafos import Novafos
+from custom_components.novafos.pynovafos.novafos import (
+    CircuitOpen,
+    DeadlineExceeded,
+    HTTPFailed,
+    Unavailable,
+)
+from custom_components.novafos.pynovafos.resilience import (
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    CircuitBreaker,
+    Deadline,
+    RetryPolicy,
+)
+from tests.test_get_statistics import hourly_response
+import tests.utils
+
+
+def error_response(status_code):
+    mock_response = requests.Response()
+    mock_response.status_code = status_code
+    mock_response._content = b""
+    mock_response._content_consumed = True
+    return mock_response
+
+
+def test_retry_policy_delay_is_capped():
+    policy = RetryPolicy(retries=10, base=1.0, cap=5.0)
+    for attempt in range(1, 11):
+        assert 0 <= policy.delay(attempt) <= min(5.0, 2 ** (attempt - 1))
+
+
+def test_circuit_breaker_opens_and_recovers(mocker):
+    mock_time = mocker.patch("time.monotonic", return_value=100.0)
+    circuit = CircuitBreaker(failure_threshold=2, reset_timeout=60.0)
+    circuit.record_failure()
+    assert circuit.allow_request()
+    circuit.record_failure()
+    assert not circuit.allow_request()
+
+    # Half-open after the timeout: a failure opens the circuit again
+    mock_time.return_value = 161.0
+    assert circuit.allow_request()
+    circuit.record_failure()
+    assert not circuit.allow_request()
+
+    mock_time.return_value = 222.0
+    circuit.record_success()
+    assert circuit.allow_request()
+    assert not circuit.is_open
+
+
+def test_circuit_breaker_half_open_trial(mocker):
+    """Half-open, a single trial request goes through - the others wait for its outcome."""
+    mock_time = mocker.patch("time.monotonic", return_value=100.0)
+    circuit = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    circuit.record_failure()
+
+    mock_time.return_value = 161.0
+    assert circuit.allow_request()
+    assert not circuit.allow_request()
+    assert circuit.retry_in() == 60.0
+
+    # A trial request which never reports back is replaced
+    mock_time.return_value = 222.0
+    assert circuit.allow_request()
+    assert not circuit.allow_request()
+    circuit.record_success()
+    assert circuit.allow_request()
+    assert circuit.allow_request()
+
+
+def test_circuit_trial_request(mocker):
+    """Half-open, one request tries the API.  A trial rejected for other reasons lets the next one try."""
+    mock_time = mocker.patch("time.monotonic", return_value=100.0)
+    novafos = Novafos(timezone="Europe/Copenhagen", retry_policy=RetryPolicy(retries=0))
+    novafos._circuit = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+    novafos._circuit.record_failure()
+    mock_time.return_value = 161.0
+    mock_get = mocker.patch(
+        "requests.Session.get",
+        side_effect=[error_response(404), error_response(503)],
+    )
+
+    try:
+        novafos._request("get", "https://example", "testing")
+        assert False
+    except Unavailable:
+        assert False
+    except HTTPFailed:
+        assert True
+    # The next request is the trial - it fails and opens the circuit again
+    try:
+        novafos._request("get", "https://example", "testing")
+        assert False
+    except CircuitOpen:
+        assert False
+    except Unavailable:
+        assert True
+    try:
+        novafos._request("get", "https://example", "testing")
+        assert False
+    except CircuitOpen:
+        assert True
+    assert mock_get.call_count == 2
+
+
+def test_request_retries_transient_errors(mocker):
+    mock_sleep = mocker.patch("time.sleep")
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    mock_get = mocker.patch(
+        "requests.Session.get",
+        side_effect=[
+            error_response(503),
+            requests.exceptions.ConnectionError("Connection reset"),
+            error_response(200),
+        ],
+    )
+
+    assert novafos._request("get", "https://example", "testing").status_code == 200
+    assert mock_get.call_count == 3
+    assert mock_sleep.call_count == 2
+
+
+def test_circuit_opens_after_repeated_failures(mocker):
+    mocker.patch("time.sleep")
+    novafos = Novafos(timezone="Europe/Copenhagen", retry_policy=RetryPolicy(retries=1))
+    mock_get = mocker.patch("requests.Session.get", return_value=error_response(502))
+
+    for _ in range(5):
+        try:
+            novafos._request("get", "https://example", "testing")
+            assert False
+        except Unavailable as err:
+            assert not isinstance(err, CircuitOpen)
+    assert mock_get.call_count == 5 * 2
+
+    # Fail fast without calling the API
+    try:
+        novafos._request("get", "https://example", "testing")
+        assert False
+    except CircuitOpen:
+        assert True
+    assert mock_get.call_count == 5 * 2
+
+
+def test_statistics_keep_days_before_failure(mocker):
+    """A window failing for good ends the fetch, but the days before it are kept."""
+    mocker.patch("time.sleep")
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+
+    def post(url, json, **kwargs):
+        if json["DateFrom"].startswith("2024-11-30"):
+            # The December window
+            return error_response(503)
+        return hourly_response(json)
+
+    mocker.patch("requests.Session.post", side_effect=post)
+
+    novafos.get_statistics(from_date=datetime(2024, 11, 1))
+    dates = [row.date_from for row in novafos._meter_data["water"].to_rows()]
+    assert len(dates) == 30 * 24
+    assert dates[-1] == "2024-11-30T23:00:00"
+
+
+def test_statistics_keep_days_before_unreadable_body(mocker):
+    """A window answered with a body which is not JSON ends the fetch, the days before it are kept."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+
+    def post(url, json, **kwargs):
+        if json["DateFrom"] >= "2024-11-30":
+            # The December window, and the halves it is split in
+            mock_response = error_response(200)
+            mock_response._content = b"<html><body>Service unavailable</body></html>"
+            return mock_response
+        return hourly_response(json)
+
+    mocker.patch("requests.Session.post", side_effect=post)
+
+    novafos.get_statistics(from_date=datetime(2024, 11, 1))
+    assert novafos.statistics_pending
+    assert len(novafos._meter_data["water"]) == 30 * 24
+
+
+def test_session_has_default_timeouts():
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    adapter = novafos._session.get_adapter("https://easy-energy-plugin-api.kmd.dk")
+    assert adapter._timeout == (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+
+def test_request_not_sent_after_deadline(mocker):
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    mock_get = mocker.patch("requests.Session.get")
+    with novafos._deadline_scope(Deadline(0)):
+        try:
+            novafos._request("get", "https://example", "testing")
+            assert False
+        except DeadlineExceeded:
+            assert True
+    assert mock_get.call_count == 0
+
+
+def test_statistics_deferred_at_deadline(mocker):
+    """Windows not started by the deadline are left for the next call."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    deadline = Deadline(60)
+
+    def post(url, json, timeout, **kwargs):
+        assert timeout[1] <= READ_TIMEOUT
+        # The deadline passes while the November window is retrieved
+        deadline._end = 0
+        return hourly_response(json)
+
+    mock_post = mocker.patch("requests.Session.post", side_effect=post)
+
+    novafos.get_statistics(from_date=datetime(2024, 11, 1), deadline=deadline)
+    assert mock_post.call_count == 1
+    assert novafos.statistics_pending
+    assert len(novafos._meter_data["water"]) == 30 * 24
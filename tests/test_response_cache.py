@@ -0,0 +1,144 @@
+# import pytest
+from datetime import datetime
+import json
+
+from custom_components.novafos import Novafos
+from custom_components.novafos.pynovafos.cache import ResponseCache
+from custom_components.novafos.pynovafos.records import (
+    MeterInfo,
+    PeriodSummary,
+    Reading,
+)
+from tests.test_get_statistics import hourly_response
+import tests.utils
+
+
+METER = MeterInfo("water", 12345678, 66774455, {"Id": 10319})
+RESPONSE = {
+    "type": "water",
+    "Data": [Reading("2024-12-01T00:00:00", 0.5)],
+    "Extra": PeriodSummary(1.0, 0.5, 0.5, 0.5, "2024-12-01T00:59:59"),
+}
+
+
+def test_cache_keeps_immutable_entries(mocker):
+    cache = ResponseCache(ttl=60)
+    mock_time = mocker.patch("time.time", return_value=1000.0)
+    cache.put("complete", RESPONSE, immutable=True)
+    cache.put("partial", RESPONSE, immutable=False)
+
+    mock_time.return_value = 1030.0
+    assert cache.get("partial") == RESPONSE
+
+    mock_time.return_value = 10000.0
+    assert cache.get("partial") is None
+    assert cache.get("complete") == RESPONSE
+
+
+def test_cache_round_trip(mocker):
+    cache = ResponseCache(ttl=60)
+    mock_time = mocker.patch("time.time", return_value=1000.0)
+    key = ResponseCache.key(METER, 3, "2024-11-30T23:00:00Z", "2024-12-31T22:59:59Z")
+    cache.put(key, RESPONSE, immutable=True)
+    cache.put("partial", RESPONSE, immutable=False)
+    assert cache.dirty
+
+    mock_time.return_value = 2000.0
+    stored = cache.to_dict()
+    assert not cache.dirty
+
+    restored = ResponseCache()
+    # Stored as JSON by the Home Assistant storage helper
+    restored.load(json.loads(json.dumps(stored)))
+    assert len(restored) == 1
+    assert restored.get(key) == RESPONSE
+
+
+def test_statistics_served_from_cache(mocker):
+    """Completed windows are not retrieved again."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    mock_post = mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: hourly_response(json),
+    )
+
+    novafos.get_statistics(from_date=datetime(2024, 11, 10))
+    first_data = novafos._meter_data["water"]
+    assert mock_post.call_count == 2
+
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    novafos.get_statistics(from_date=datetime(2024, 11, 10))
+    assert mock_post.call_count == 2
+    assert novafos._meter_data["water"] == first_data
+
+
+def test_year_data_served_from_cache(mocker):
+    """The year data built from a cached response leaves the cache entry as it was."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    mock_post = mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: hourly_response(json, max_days=1),
+    )
+
+    first = novafos.get_year_data()
+    # The year is not complete - served from the cache until the TTL passed
+    second = novafos.get_year_data()
+    assert mock_post.call_count == 1
+    assert second == first
+    assert len(second["water"]["Data"]) == 24
+
+
+def test_cache_bounded(mocker):
+    """Final responses are dropped past the retention, and the least recently used beyond max_entries."""
+    cache = ResponseCache(ttl=60, retention=3600, max_entries=2)
+    mock_time = mocker.patch("time.time", return_value=10000.0)
+    cache.put("old", RESPONSE, immutable=True, end=5000)
+    cache.put("recent", RESPONSE, immutable=True, end=9000)
+    assert cache.get("old") is None
+    assert cache.get("recent") == RESPONSE
+
+    cache.put("first", RESPONSE, immutable=True, end=9500)
+    cache.put("second", RESPONSE, immutable=True, end=9500)
+    cache.get("first")
+    cache.put("third", RESPONSE, immutable=True, end=9500)
+    assert len(cache) == 2
+    assert cache.get("second") is None
+    assert cache.get("first") == RESPONSE
+
+    mock_time.return_value = 9500.0 + 3601
+    assert cache.to_dict()["entries"] == {}
+
+
+def test_statistics_windows_off_grid_expire(mocker):
+    """Only windows on the month grid are kept as final - the days since the last statistics are not."""
+    tests.utils.freeze_now(mocker, datetime(2024, 12, 20, 12, 0, 0))
+    novafos = Novafos(timezone="Europe/Copenhagen")
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    mocker.patch(
+        "requests.Session.post",
+        side_effect=lambda url, json, **kwargs: hourly_response(json),
+    )
+
+    novafos.get_statistics(from_date=datetime(2024, 10, 10))
+    immutable = {
+        key.split("/")[3][:10]: entry["immutable"]
+        for key, entry in novafos.response_cache._entries.items()
+    }
+    # Windows from 10-10, 11-01 and 12-01 (UTC dates)
+    assert immutable == {
+        "2024-10-09": False,
+        "2024-10-31": True,
+        "2024-11-30": False,
+    }
@@ -0,0 +1,181 @@
+# import pytest
+from datetime import date, datetime
+import json
+from zoneinfo import ZoneInfo
+
+from custom_components.novafos.pynovafos import rollup as rollup_module
+from custom_components.novafos.pynovafos.rollup import (
+    GROUPINGS,
+    IncrementalRollups,
+    rollup,
+)
+from custom_components.novafos.pynovafos.records import Reading
+from custom_components.novafos.pynovafos.series import HourlySeries
+import tests.utils
+
+
+TZ = ZoneInfo("Europe/Copenhagen")
+
+
+def refreshes(series, hours_per_refresh):
+    """Yield the data available at each refresh: a growing prefix of the series."""
+    for end in range(
+        hours_per_refresh, len(series) + hours_per_refresh, hours_per_refresh
+    ):
+        yield series[:end]
+
+
+def test_incremental_rollups_match_full():
+    """Imported buckets - the latest import of each - equal a full recalculation."""
+    series = tests.utils.load_meter_data("meter_data_large.json", TZ)["water"]
+    rollups = IncrementalRollups()
+    imported = {grouping: {} for grouping in GROUPINGS}
+    for data in refreshes(series, 5 * 24 + 7):
+        for grouping, stats in rollups.update("water", data).items():
+            # Only the latest days and the ongoing buckets are imported again
+            if grouping == "day":
+                assert len(stats) <= 10
+            else:
+                assert len(stats) <= 4
+            for stat in stats:
+                imported[grouping][stat[0]] = stat
+
+    for grouping, stats in rollup(series).items():
+        assert [imported[grouping][stat[0]] for stat in stats] == stats
+
+
+def test_incremental_rollups_restored():
+    """The saved state picks up where it left off - also with only the latest hours at hand."""
+    series = tests.utils.load_meter_data("meter_data_large.json", TZ)["water"]
+    rollups = IncrementalRollups()
+    rollups.update("water", series[: 200 * 24])
+    assert rollups.dirty
+
+    restored = IncrementalRollups()
+    restored.load(json.loads(json.dumps(rollups.to_dict())))
+    assert not rollups.dirty
+
+    # After a restart only the hours retrieved since the last statistics are in memory
+    latest = series[198 * 24 : 210 * 24]
+    assert restored.update("water", latest) == rollups.update("water", latest)
+
+    full = rollup(series[: 210 * 24])
+    updated = rollups.update("water", series[: 210 * 24])
+    for grouping in GROUPINGS:
+        stats = {stat[0]: stat for stat in full[grouping]}
+        assert [stats[stat[0]] for stat in updated[grouping]] == updated[grouping]
+
+
+def test_incremental_rollups_reset():
+    series = tests.utils.load_meter_data("meter_data_small.json", TZ)["water"]
+    rollups = IncrementalRollups()
+    rollups.update("water", series)
+    rollups.reset("water")
+    assert rollups.update("water", series) == rollup(series)
+
+
+def test_rollups_vectorized_with_gaps(mocker):
+    """Gaps of a week or a month and more are handled like the pure Python rollups do."""
+    series = tests.utils.load_meter_data("meter_data_large.json", TZ)["water"]
+    # Drop 10 days in February, and hours of a day in May
+    gaps = series[: 40 * 24]
+    gaps.extend(series[50 * 24 : 130 * 24 + 5])
+    gaps.extend(series[131 * 24 :])
+    # Drop all of March
+    month_gap = series[: 55 * 24]
+    month_gap.extend(series[95 * 24 :])
+
+    for data in (series, gaps, month_gap):
+        mocker.patch("custom_components.novafos.pynovafos.rollup.VECTORIZED", True)
+        vectorized = rollup(data)
+        mocker.patch("custom_components.novafos.pynovafos.rollup.VECTORIZED", False)
+        assert vectorized == rollup(data)
+
+
+def test_rollups_dst_days(mocker):
+    """The days DST starts and ends are complete with 23 and 24 wall-clock hours."""
+    rows = []
+    for day, hours in (
+        ("2024-03-30", range(24)),
+        ("2024-03-31", (0, 1, *range(3, 24))),
+        # The repeated hour sent twice
+        ("2024-10-27", (0, 1, 2, 2, *range(3, 24))),
+        # Partial
+        ("2024-10-28", range(12)),
+    ):
+        rows.extend(Reading(f"{day}T{hour:02}:00:00", 1.0) for hour in hours)
+    series = HourlySeries.from_rows(rows, TZ)
+
+    for vectorized in (True, False):
+        mocker.patch(
+            "custom_components.novafos.pynovafos.rollup.VECTORIZED", vectorized
+        )
+        assert [stat[:2] for stat in rollup(series, ("day",))["day"]] == [
+            ("2024-03-30", 24.0),
+            ("2024-03-31", 23.0),
+            ("2024-10-27", 25.0),
+        ]
+        # A day missing one of its hours is left out
+        assert [
+            stat[0] for stat in rollup(series[: 24 + 23 + 24], ("day",))["day"]
+        ] == ["2024-03-30", "2024-03-31"]
+
+
+def test_rollups_with_day_summaries(mocker):
+    """Summarised days are taken as they are, only the hours of the other days are summed."""
+    series = tests.utils.load_meter_data("meter_data_large.json", TZ)["water"]
+    full = {stat.date: stat.sum for stat in rollup(series, ("day",))["day"]}
+    day_sums = {
+        date.fromisoformat(day): value
+        for day, value in full.items()
+        if "2024-05-01" <= day <= "2024-05-31" and day != "2024-05-10"
+    }
+    day_sums[date(2024, 5, 20)] = 100.0
+    # Summarised, but not all of its hours retrieved
+    data = series.between(0, 1715724000)  # 2024-05-15T00:00:00+02:00
+    data.extend(series.between(1715724000 + 3600))
+
+    expected = dict(full, **{"2024-05-20": 100.0})
+    walked = mocker.spy(rollup_module, "_complete_days")
+    results = []
+    for vectorized in (True, False):
+        mocker.patch(
+            "custom_components.novafos.pynovafos.rollup.VECTORIZED", vectorized
+        )
+        results.append(rollup(data, GROUPINGS, day_sums))
+        assert {stat.date: stat.sum for stat in results[-1]["day"]} == expected
+    assert results[0] == results[1]
+    # The hours of the 30 summarised days are not walked
+    hours = sum(len(call.args[0]) for call in walked.call_args_list)
+    assert hours == 2 * (len(data) - 30 * 24 + 1)
+
+    # Incremental rollups end up with the same buckets
+    rollups = IncrementalRollups()
+    imported = {grouping: {} for grouping in GROUPINGS}
+    for part in refreshes(data, 9 * 24):
+        # Summaries are retrieved for the days of the hourly data
+        last_day = datetime.fromtimestamp(part.timestamps[-1], TZ).date()
+        known = {day: value for day, value in day_sums.items() if day <= last_day}
+        for grouping, stats in rollups.update("water", part, known).items():
+            imported[grouping].update((stat.date, stat) for stat in stats)
+    for grouping, stats in results[0].items():
+        assert [imported[grouping][stat.date] for stat in stats] == stats
+
+
+def test_rollups_dst_end_as_sent(mocker):
+    """The API sends the day DST ends as 24 hours with a single 02:00."""
+    series = tests.utils.load_meter_data("meter_data_large.json", TZ)["water"]
+    october = series.between(
+        datetime(2024, 10, 26, tzinfo=TZ), datetime(2024, 10, 29, tzinfo=TZ)
+    )
+    assert len(october) == 3 * 24
+
+    for vectorized in (True, False):
+        mocker.patch(
+            "custom_components.novafos.pynovafos.rollup.VECTORIZED", vectorized
+        )
+        days = [stat[0] for stat in rollup(october, ("day",))["day"]]
+        assert days == ["2024-10-26", "2024-10-27", "2024-10-28"]
+        # Without its last hour the day is partial
+        days = [stat[0] for stat in rollup(october[: 2 * 24 - 1], ("day",))["day"]]
+        assert days == ["2024-10-26"]
@@ -0,0 +1,98 @@
+# import pytest
+import asyncio
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+import random
+import time
+
+from custom_components.novafos import AsyncNovafos
+from custom_components.novafos.pynovafos.scheduler import (
+    BackfillScheduler,
+    TokenBucket,
+    parse_retry_after,
+)
+import tests.utils
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) == 5.0
+    assert parse_retry_after("garbage", default=1.0) == 1.0
+    retry_at = datetime.now(UTC) + timedelta(seconds=30)
+    assert 25 < parse_retry_after(format_datetime(retry_at, usegmt=True)) <= 30
+
+
+async def test_token_bucket_rate():
+    bucket = TokenBucket(rate=100.0, capacity=1)
+    start = time.monotonic()
+    for _ in range(11):
+        await bucket.acquire()
+    # First token is free, the next 10 arrive at 100/s
+    assert time.monotonic() - start >= 0.09
+
+
+async def test_scheduler_keeps_job_order_and_concurrency():
+    scheduler = BackfillScheduler(concurrency=3, rate=1000.0, burst=1000)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def job(idx):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(random.uniform(0, 0.01))
+        in_flight -= 1
+        if idx == 5:
+            raise ValueError("Job failed")
+        return idx
+
+    results = await scheduler.run(lambda idx=idx: job(idx) for idx in range(20))
+    assert max_in_flight == 3
+    assert isinstance(results[5], ValueError)
+    assert [result for result in results if not isinstance(result, ValueError)] == [
+        idx for idx in range(20) if idx != 5
+    ]
+
+
+class FakeResponse:
+    def __init__(self, status, body=None, headers=None):
+        self.status = status
+        self.headers = headers or {}
+        self._body = body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    async def json(self, content_type=None):
+        return self._body
+
+
+class FakeSession:
+    closed = False
+
+    def __init__(self, responses):
+        self._responses = iter(responses)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return next(self._responses)
+
+
+async def test_async_request_honours_retry_after(mocker):
+    body = tests.utils.load_data_structure("active_meters_water.json")
+    session = FakeSession(
+        [FakeResponse(429, headers={"Retry-After": "0.05"}), FakeResponse(200, body)]
+    )
+    novafos = AsyncNovafos(timezone="Europe/Copenhagen", session=session)
+
+    start = time.monotonic()
+    assert await novafos._request_json("POST", "https://example") == body
+    assert session.calls == 2
+    assert time.monotonic() - start >= 0.05
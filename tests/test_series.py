@@ -0,0 +1,69 @@
+# import pytest
+from datetime import datetime
+from itertools import pairwise
+from zoneinfo import ZoneInfo
+
+from custom_components.novafos.pynovafos.records import Reading
+from custom_components.novafos.pynovafos.series import HourlySeries
+import tests.utils
+
+
+TZ = ZoneInfo("Europe/Copenhagen")
+
+
+def test_series_round_trip():
+    rows = tests.utils.load_readings("meter_data_small.json")["water"]
+    series = HourlySeries.from_rows(rows, TZ)
+
+    assert len(series) == len(rows)
+    assert series.to_rows() == rows
+    assert series.nbytes == 16 * len(rows)
+    # 2024-01-01T00:00:00+01:00
+    assert series[0] == (1704063600, rows[0].value)
+
+
+def test_series_between():
+    series = HourlySeries(TZ)
+    for hour in range(48):
+        series.append(1704063600 + hour * 3600, float(hour))
+
+    day = series.between(
+        datetime(2024, 1, 2, tzinfo=TZ), datetime(2024, 1, 3, tzinfo=TZ)
+    )
+    assert len(day) == 24
+    assert list(day.values) == [float(hour) for hour in range(24, 48)]
+    assert len(series.between(datetime(2024, 1, 2, 12, tzinfo=TZ))) == 12
+
+
+def test_series_dst_end():
+    """The hour repeated when DST ends is kept as two hours."""
+    rows = [Reading(f"2024-10-27T{hour:02}:00:00", 1.0) for hour in (0, 1, 2, 2, 3)]
+    series = HourlySeries.from_rows(rows, TZ)
+    assert [b - a for a, b in pairwise(series.timestamps)] == [3600] * 4
+    assert [date.hour for date, _ in series.iter_local()] == [0, 1, 2, 2, 3]
+
+
+def test_series_upsert():
+    series = HourlySeries(TZ)
+    for hour in (0, 1, 3):
+        series.upsert(1704063600 + hour * 3600, 1.0)
+    series.upsert(1704063600 + 1 * 3600, 2.0)
+    series.upsert(1704063600 + 2 * 3600, 3.0)
+
+    assert [timestamp - 1704063600 for timestamp in series.timestamps] == [
+        0,
+        3600,
+        7200,
+        10800,
+    ]
+    assert list(series.values) == [1.0, 2.0, 3.0, 1.0]
+
+
+def test_series_retention():
+    series = HourlySeries(TZ, retention=24 * 3600)
+    rows = tests.utils.load_readings("meter_data_small.json")["water"]
+    series.extend_rows(rows)
+
+    # The newest hour and the 24 hours before it
+    assert len(series) == 25
+    assert series.to_rows() == rows[-25:]
@@ -0,0 +1,61 @@
+# import pytest
+import json
+
+from custom_components.novafos.pynovafos.stream import ConsumptionStreamParser
+import tests.utils
+
+
+def parse(body, chunk_size):
+    rows = []
+    parser = ConsumptionStreamParser(
+        lambda date_from, value: rows.append((date_from, value))
+    )
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start : start + chunk_size])
+    return parser.close(), rows
+
+
+def test_stream_parser_matches_json_loads():
+    body = tests.utils.load_data("consumption_hour_data_heating_zoom_3.json")
+    expected = json.loads(body)
+    # Chunks splitting tokens anywhere, down to single bytes
+    for chunk_size in (1, 2, 3, 7, 64, len(body)):
+        parser, rows = parse(body, chunk_size)
+        assert rows == [
+            (data["DateFrom"], data["Value"]) for data in expected["Series"][0]["Data"]
+        ]
+        assert parser.summary["Total"] == expected["Total"]
+        assert parser.rows == 24
+        assert parser.complete
+        assert parser.last_date_to == expected["Series"][0]["Data"][-1]["DateTo"]
+
+
+def test_stream_parser_uses_first_series_only():
+    body = json.dumps(
+        {
+            "Series": [
+                {
+                    "Data": [{"DateFrom": "a", "DateTo": "b", "Value": 1.5}],
+                    "Label": None,
+                },
+                {"Data": [{"DateFrom": "c", "DateTo": "d", "Value": 2.5}]},
+            ],
+            "Total": {"Value": 4.0},
+            "Count": 12,
+        }
+    ).encode("utf-8")
+    for chunk_size in (1, 5):
+        parser, rows = parse(body, chunk_size)
+        assert rows == [("a", 1.5)]
+        assert parser.summary == {"Total": {"Value": 4.0}, "Count": 12}
+        # Rows without IsComplete are not complete
+        assert not parser.complete
+
+
+def test_stream_parser_rejects_truncated_body():
+    body = tests.utils.load_data("consumption_hour_data_water_zoom_3.json")
+    try:
+        parse(body[:-10], 64)
+        assert False
+    except ValueError:
+        assert True
@@ -0,0 +1,42 @@
+# import pytest
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from custom_components.novafos.pynovafos.timeparse import TimestampParser
+
+
+TZ = ZoneInfo("Europe/Copenhagen")
+
+
+def reference(value):
+    time = datetime.fromisoformat(value)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=TZ)
+    return int(time.timestamp())
+
+
+def test_parse_shapes():
+    parser = TimestampParser(TZ)
+    for value in (
+        "2024-12-29T13:00:00",
+        "2024-06-29T13:00:00",
+        "2024-12-29T13:00:00+01:00",
+        "2024-06-29T13:00:00+02:00",
+        "2024-11-30T23:00:00.000Z",
+        "2024-12-31T22:59:59.999Z",
+        "2024-03-31T22:00:00Z",
+        "2024-03-31T22:00:00+00:00",
+        "2024-12-29T13:00:00-05:00",
+        "2024-12-29",
+    ):
+        assert parser.to_epoch(value) == reference(value), value
+
+
+def test_parse_local_hours_across_dst():
+    """Every local hour of a year, including the days DST starts and ends."""
+    parser = TimestampParser(TZ)
+    start = datetime(2024, 1, 1, tzinfo=ZoneInfo("UTC"))
+    hours = [start + timedelta(hours=hour) for hour in range(366 * 24)]
+    values = [hour.astimezone(TZ).replace(tzinfo=None).isoformat() for hour in hours]
+
+    assert list(parser.to_epochs(values)) == [int(hour.timestamp()) for hour in hours]
@@ -0,0 +1,52 @@
+# import pytest
+import logging
+import requests
+
+from custom_components.novafos import Novafos
+from custom_components.novafos.pynovafos.tracing import LazyJson, ResponseTrace
+import tests.utils
+
+
+def test_lazy_json_not_formatted_when_debug_is_off(mocker, caplog):
+    mock_dumps = mocker.patch("json.dumps", return_value="{}")
+    logger = logging.getLogger("tests.tracing")
+    logger.setLevel(logging.INFO)
+    logger.debug("%s", LazyJson({"Series": []}))
+    assert mock_dumps.call_count == 0
+
+    with caplog.at_level(logging.DEBUG, logger="tests.tracing"):
+        logger.debug("%s", LazyJson({"Series": []}))
+    assert mock_dumps.called
+
+
+def test_response_trace_is_bounded():
+    trace = ResponseTrace(size=2)
+    for status in (200, 500, 201):
+        trace.record("GET", "https://example", status, b"{}")
+    assert [response["status"] for response in trace.as_list()] == [500, 201]
+
+    disabled = ResponseTrace()
+    disabled.record("GET", "https://example", 200, b"{}")
+    assert not disabled.enabled
+    assert disabled.as_list() == []
+
+
+def test_consumption_responses_traced(mocker):
+    novafos = Novafos(timezone="Europe/Copenhagen", trace_responses=5)
+    novafos._parse_active_meters(
+        tests.utils.load_data_structure("active_meters_water.json")
+    )
+    body = tests.utils.load_data("consumption_hour_data_water_zoom_3.json")
+    mock_response = requests.Response()
+    mock_response.status_code = 200
+    mock_response._content = body
+    mock_response._content_consumed = True
+    mocker.patch("requests.Session.post", return_value=mock_response)
+
+    novafos._get_consumption_timeseries(
+        novafos._active_meters[0], "2024-12-01", "2024-12-31", 3
+    )
+    responses = novafos.trace.as_list()
+    assert len(responses) == 1
+    assert responses[0]["status"] == 200
+    assert responses[0]["body"] == body.decode("utf-8")
@@ -1,5 +1,9 @@
+from datetime import datetime
 import json
 
+from custom_components.novafos.pynovafos.records import Reading
+from custom_components.novafos.pynovafos.series import HourlySeries
+
 
 def load_data(data_file_name):
     with open(f"tests/data/{data_file_name}") as f:
@@ -11,3 +15,41 @@ def load_data_structure(data_file_name):
     with open(f"tests/data/{data_file_name}") as f:
         response_data = json.load(f)
     return response_data
+
+
+def load_readings(data_file_name):
+    """Load meter data saved as API rows per meter type into lists of Readings."""
+    return {
+        meter_type: [Reading(row["DateFrom"], row["Value"]) for row in rows]
+        for meter_type, rows in load_data_structure(data_file_name).items()
+    }
+
+
+def load_meter_data(data_file_name, tz):
+    """Load meter data saved as API rows per meter type into HourlySeries."""
+    return {
+        meter_type: HourlySeries.from_rows(rows, tz)
+        for meter_type, rows in load_readings(data_file_name).items()
+    }
+
+
+def as_plain(value):
+    """Turn records, also nested in lists and dictionaries, into dictionaries - e.g. for data_regression."""
+    if hasattr(value, "_asdict"):
+        return {key: as_plain(item) for key, item in value._asdict().items()}
+    if isinstance(value, dict):
+        return {key: as_plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [as_plain(item) for item in value]
+    return value
+
+
+def freeze_now(mocker, now):
+    """Make datetime.now() in the novafos module return the given naive local time."""
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now if tz is None else now.astimezone(tz)
+
+    mocker.patch("custom_components.novafos.pynovafos.novafos.datetime", FrozenDatetime)